@@ -1,22 +1,248 @@
+import os
+import sys
+
+def _wants_gevent(argv):
+    """Whether this run serves with gevent, decided before other imports."""
+    if len(argv) > 1 and not argv[1].startswith('-') and argv[1] != 'serve':
+        return False
+    if '--debug' in argv or os.environ.get('MONITOR_DEBUG', '') == '1' and '--no-debug' not in argv:
+        return False
+    server = os.environ.get('MONITOR_SERVER', 'gevent')
+    for i, arg in enumerate(argv):
+        if arg.startswith('--server='):
+            server = arg.split('=', 1)[1]
+        elif arg == '--server' and i + 1 < len(argv):
+            server = argv[i + 1]
+    return server == 'gevent'
+
+if __name__ == '__main__' and _wants_gevent(sys.argv):
+    # gevent must patch sockets, threads and locks before anything imports them.
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        pass
+
 import psutil
 import platform
-from flask import Flask, render_template_string, jsonify
+import numpy as np
+from flask import Flask, Response, jsonify, request
+from array import array
+import argparse
+import atexit
+import bisect
+import collections
+import ctypes
+import ctypes.util
+import fcntl
+import functools
+import gzip
+import hashlib
+import http.client
+import http.server
+import ipaddress
+import json
+import mmap
+import queue
+import random
+import shlex
+import socket
+import struct
+import subprocess
+import urllib.parse
+import urllib.request
+import math
+import mimetypes
+import operator
 import threading
 import logging
+import signal
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+# Seconds between background samples; every endpoint reads the latest snapshot.
+SAMPLE_INTERVAL = float(os.environ.get('MONITOR_SAMPLE_INTERVAL', '1.0'))
+# Hours of samples kept in the history ring.
+HISTORY_HOURS = float(os.environ.get('MONITOR_HISTORY_HOURS', '24'))
+# Directory for the memory-mapped history file; empty keeps history in memory only.
+HISTORY_DIR = os.environ.get('MONITOR_HISTORY_DIR', '')
+# Most metric names kept in history; ones first seen past this are dropped.
+HISTORY_MAX_METRICS = int(os.environ.get('MONITOR_HISTORY_MAX_METRICS', '256'))
+# Seconds between msync() calls; the page cache already survives a process crash.
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('MONITOR_HISTORY_FLUSH_INTERVAL', '60'))
+# Target number of buckets when /history is called without an explicit step.
+HISTORY_MAX_POINTS = 300
+# Seconds of silence after which /stream sends an SSE comment to keep proxies open.
+STREAM_KEEPALIVE = 15
+# Concurrent /stream clients; more get a 503 and fall back to polling.
+STREAM_MAX_CLIENTS = int(os.environ.get('MONITOR_MAX_STREAMS', '500'))
+# Alert rules (YAML or JSON), re-read whenever the file changes.
+RULES_FILE = os.environ.get('MONITOR_RULES_FILE',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.yaml'))
+# Seconds between checks of the rules file's mtime.
+RULES_RELOAD_INTERVAL = 5
+# Alert events are POSTed to the webhook and/or appended to the log as JSON lines.
+ALERT_WEBHOOK = os.environ.get('MONITOR_ALERT_WEBHOOK', '')
+ALERT_LOG = os.environ.get('MONITOR_ALERT_LOG', '')
+# Fired/resolved events kept for /alerts.
+ALERT_HISTORY = 100
+# Recent samples /data?since=<cursor> can diff against; older cursors get a full payload.
+DATA_DELTA_DEPTH = int(os.environ.get('MONITOR_DELTA_DEPTH', '120'))
+
+# The llama-server process started next to the monitor by start.sh. A pidfile,
+# when given, takes precedence over matching by process name; with managed
+# workers (MONITOR_LLAMA_WORKERS) the process tracked is worker 0.
+LLAMA_PROCESS_NAME = os.environ.get('LLAMA_SERVER_PROCESS', 'llama-server')
+LLAMA_PIDFILE = os.environ.get('LLAMA_SERVER_PIDFILE')
+MODEL_PATH = os.environ.get('MODEL_PATH', '/models/smollm-model.gguf')
+# Reading smaps (USS, model mapping) is costly, so only do it every N samples.
+PROCESS_DETAIL_EVERY = int(os.environ.get('MONITOR_PROCESS_DETAIL_EVERY', '5'))
+# Minimum seconds between process-table scans while llama-server is missing.
+PROCESS_RESCAN_INTERVAL = 5.0
+
+# How often to check how much of MODEL_PATH sits in the page cache.
+MODEL_RESIDENCY_INTERVAL = float(os.environ.get('MODEL_RESIDENCY_INTERVAL', '10'))
+# Prewarm the model file at startup: '' (off), 'read' or 'fadvise'.
+MODEL_PREWARM = os.environ.get('MODEL_PREWARM', '')
+# Client networks allowed to start a prewarm with POST /model/prewarm, which
+# reads the whole model file; loopback only by default, empty for nobody.
+MODEL_PREWARM_ALLOW = os.environ.get('MONITOR_PREWARM_ALLOW', '127.0.0.0/8,::1/128')
+PREWARM_CHUNK = 8 * 1024 * 1024
+
+# /ready waits for a warmup completion of this many tokens (0 skips it)...
+WARMUP_PROMPT = os.environ.get('MONITOR_WARMUP_PROMPT', 'Hello')
+WARMUP_MAX_TOKENS = int(os.environ.get('MONITOR_WARMUP_MAX_TOKENS', '8'))
+# ...and for this much of MODEL_PATH to be in the page cache.
+READY_RESIDENT_PERCENT = float(os.environ.get('MONITOR_READY_RESIDENT_PERCENT', '90'))
+# Seconds between readiness checks until ready; LLAMA_POLL_INTERVAL after.
+READY_CHECK_INTERVAL = 0.5
+# Seconds between warmup attempts after one fails.
+WARMUP_RETRY_INTERVAL = 5.0
+# /healthz fails when the newest sample is older than this many intervals.
+LIVENESS_MAX_SAMPLE_AGE = 10
+
+# The co-located llama-server HTTP API, polled for throughput and slot usage.
+LLAMA_SERVER_URL = os.environ.get('LLAMA_SERVER_URL', 'http://127.0.0.1:8080')
+LLAMA_SERVER_TIMEOUT = float(os.environ.get('LLAMA_SERVER_TIMEOUT', '0.5'))
+LLAMA_POLL_INTERVAL = float(os.environ.get('LLAMA_POLL_INTERVAL', '2.0'))
+# llama-server workers the monitor starts and routes chat requests across;
+# 0 proxies to the single server at LLAMA_SERVER_URL that start.sh runs.
+# With workers, the process and inference cards and slot counts follow worker 0.
+LLAMA_WORKERS = int(os.environ.get('MONITOR_LLAMA_WORKERS', '0'))
+# Command per worker; {port}, {threads} and {index} are filled in. For stub
+# workers: python3 system_monitor.py stub-worker --port {port}
+LLAMA_WORKER_COMMAND = os.environ.get(
+    'MONITOR_LLAMA_WORKER_COMMAND',
+    '/llama-server -m ' + shlex.quote(MODEL_PATH) +
+    ' --host 127.0.0.1 --port {port} --threads {threads} -n 512 --metrics')
+# Extra arguments for every worker, shell-quoted; start.sh passes the
+# container's arguments here, as it does to its single llama-server.
+LLAMA_WORKER_ARGS = os.environ.get('MONITOR_LLAMA_WORKER_ARGS', '')
+LLAMA_WORKER_BASE_PORT = int(os.environ.get('MONITOR_LLAMA_WORKER_BASE_PORT', '8081'))
+# Give each worker its own share of the CPUs this process may run on.
+LLAMA_WORKER_PIN = os.environ.get('MONITOR_LLAMA_WORKER_PIN', '1') == '1'
+# Seconds between worker health checks.
+LLAMA_WORKER_HEALTH_INTERVAL = float(os.environ.get('MONITOR_LLAMA_WORKER_HEALTH_INTERVAL', '1.0'))
+# Failed checks in a row before a worker is restarted, and how long a new
+# one may take to load its model before failed checks count.
+LLAMA_WORKER_MAX_FAILURES = int(os.environ.get('MONITOR_LLAMA_WORKER_MAX_FAILURES', '3'))
+LLAMA_WORKER_START_TIMEOUT = float(os.environ.get('MONITOR_LLAMA_WORKER_START_TIMEOUT', '300'))
+# Longest wait between restarts of a worker that keeps dying.
+LLAMA_WORKER_MAX_BACKOFF = 60.0
+# The chat proxy waits this long for each upstream read; generation is slow.
+CHAT_UPSTREAM_TIMEOUT = float(os.environ.get('CHAT_UPSTREAM_TIMEOUT', '300'))
+# Idle keep-alive connections kept open to llama-server for the chat proxy.
+CHAT_POOL_SIZE = int(os.environ.get('CHAT_POOL_SIZE', '8'))
+# Cache for deterministic completions (temperature 0 or fixed seed); 0 disables.
+CHAT_CACHE_MAX_BYTES = int(os.environ.get('CHAT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+CHAT_CACHE_TTL = float(os.environ.get('CHAT_CACHE_TTL', '600'))
+# Concurrent requests let through to llama-server; 0 follows its slot count.
+CHAT_CONCURRENCY = int(os.environ.get('CHAT_CONCURRENCY', '0'))
+# Requests allowed to wait for a free slot, and how long each may wait.
+CHAT_QUEUE_SIZE = int(os.environ.get('CHAT_QUEUE_SIZE', '16'))
+CHAT_QUEUE_TIMEOUT = float(os.environ.get('CHAT_QUEUE_TIMEOUT', '30'))
+# Request fields that do not change the generated text.
+CHAT_CACHE_IGNORED_FIELDS = ('stream', 'stream_options', 'user')
+# Server-side conversations for requests that carry a session_id.
+CHAT_SESSION_MAX = int(os.environ.get('CHAT_SESSION_MAX', '256'))
+CHAT_SESSION_TTL = float(os.environ.get('CHAT_SESSION_TTL', '3600'))
+# Estimated prompt tokens a session may send; older turns are dropped past it.
+CHAT_SESSION_TOKEN_BUDGET = int(os.environ.get('CHAT_SESSION_TOKEN_BUDGET', '1536'))
+# Overflowing history is cut to this share of the budget in one go, so the kept
+# prefix stays identical, and cached by llama-server, for the next several turns.
+CHAT_SESSION_TRIM_TO = 0.5
+# Chat-template tokens around each message, for the budget estimate.
+CHAT_MESSAGE_OVERHEAD = 4
+# llama-server slots sessions are pinned to; 0 follows its slot count.
+CHAT_SLOTS = int(os.environ.get('CHAT_SLOTS', '0'))
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# /debug/perf: route, collector and listener timings plus an on-demand
+# sampling profiler. Off unless set, and then nothing is timed at all.
+DEBUG_PERF = os.environ.get('MONITOR_DEBUG_PERF', '') == '1'
+# Client networks allowed to reach /debug/perf; loopback only by default.
+DEBUG_PERF_ALLOW = os.environ.get('MONITOR_DEBUG_PERF_ALLOW', '127.0.0.0/8,::1/128')
+# Recent timings per series kept for the percentiles /debug/perf reports.
+PERF_RECENT = 1024
+# Longest profile one request may ask for, and the default sampling interval.
+PROFILE_MAX_SECONDS = 60
+PROFILE_INTERVAL = 0.005
+
+# Per-core CPU history is (samples x cores x fields), so keep a shorter window.
+CORE_HISTORY_MINUTES = float(os.environ.get('MONITOR_CORE_HISTORY_MINUTES', '15'))
+# Per-core modes kept in history; busy is 100 - idle - iowait.
+CORE_FIELDS = ('user', 'system', 'iowait', 'steal', 'busy')
+# A core counts as busy above this utilisation.
+CORE_BUSY_THRESHOLD = 80.0
+
+# Block devices without real I/O worth tracking.
+IGNORED_DISK_PREFIXES = ('loop', 'ram')
+
+# cgroup v2 mount point; container metrics come from this process's cgroup under it.
+CGROUP_ROOT = os.environ.get('MONITOR_CGROUP_ROOT', '/sys/fs/cgroup')
+
+# Host facts that cannot change while the process runs.
+STATIC_FIELDS = ('system', 'node_name', 'release', 'version', 'machine', 'processor', 'network_info')
+# /info is fixed for the life of the process; the ETag makes revalidation cheap.
+INFO_CACHE_CONTROL = 'no-cache'
+
+# Front-end libraries, vendored into STATIC_DIR/vendor when the image is built.
+# Missing files fall back to the CDN so a bare checkout still works.
+STATIC_DIR = os.environ.get('MONITOR_STATIC_DIR',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+VENDOR_ASSETS = {
+    'chart.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/Chart.js/3.7.0/chart.min.js',
+    'marked.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/marked/4.0.2/marked.min.js',
+    'highlight.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.5.1/highlight.min.js',
+}
+# Asset URLs carry a content hash, so browsers may keep them forever.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# The page itself is revalidated against its ETag so a new build shows up at once.
+PAGE_CACHE_CONTROL = 'no-cache'
+
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html>
   <head>
     <title>System Monitor and Chat</title>
     <meta name="viewport" content="width=device-width, initial-scale=1" />
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/Chart.js/3.7.0/chart.min.js"></script>
+    <script src="{{ assets['chart.min.js'] }}"></script>
     <style>
       body {
-        font-family: "Poppins", Arial, sans-serif;
+        font-family: "Poppins", system-ui, -apple-system, "Segoe UI", Arial, sans-serif;
         line-height: 1.6;
         background-color: #1a1b26;
         color: #a9b1d6;
@@ -57,10 +283,168 @@ HTML_TEMPLATE = """
     </div>
 
     <script>
+      // text/event-stream parser that carries partial lines across reads.
+      class SSEDecoder {
+        constructor(onData) {
+          this.onData = onData;
+          this.buffer = "";
+          this.data = [];
+        }
+
+        push(text) {
+          this.buffer += text;
+          let start = 0;
+          let newline;
+          while ((newline = this.buffer.indexOf("\\n", start)) !== -1) {
+            const end = newline > start && this.buffer[newline - 1] === "\\r" ? newline - 1 : newline;
+            this.line(this.buffer.slice(start, end));
+            start = newline + 1;
+          }
+          this.buffer = this.buffer.slice(start);
+        }
+
+        end() {
+          if (this.buffer) this.line(this.buffer);
+          this.buffer = "";
+          this.line("");
+        }
+
+        line(line) {
+          if (line === "") {
+            // A blank line dispatches the event built from its data: lines.
+            if (this.data.length) this.onData(this.data.join("\\n"));
+            this.data = [];
+            return;
+          }
+          if (line[0] === ":") return;
+          const colon = line.indexOf(":");
+          if (colon === -1 || line.slice(0, colon) !== "data") return;
+          const value = line.slice(colon + 1);
+          this.data.push(value[0] === " " ? value.slice(1) : value);
+        }
+      }
+
+      function renderMarkdown(element, source, highlight) {
+        if (!window.marked) {
+          element.textContent = source;
+          return;
+        }
+        element.innerHTML = marked.parse(source);
+        if (highlight && window.hljs) {
+          element.querySelectorAll("pre code").forEach((code) => hljs.highlightElement(code));
+        }
+      }
+
+      // Renders markdown that grows at the end. Closed blocks (ended by a
+      // blank line or a closing code fence) are parsed and highlighted once;
+      // only the trailing open block is re-parsed, at most once per frame.
+      class StreamingMarkdown {
+        constructor(element, onRender = null, schedule = (callback) => requestAnimationFrame(callback)) {
+          this.element = element;
+          this.onRender = onRender;
+          this.schedule = schedule;
+          this.source = "";
+          this.committed = 0;
+          this.closed = 0;
+          this.scanned = 0;
+          this.fence = null;
+          this.blankAt = null;
+          this.pending = false;
+          this.tail = document.createElement("div");
+          element.appendChild(this.tail);
+        }
+
+        append(text) {
+          this.source += text;
+          if (this.pending) return;
+          this.pending = true;
+          this.schedule(() => {
+            if (this.pending) this.flush();
+          });
+        }
+
+        scan() {
+          // Only complete lines are looked at, each exactly once.
+          let newline;
+          while ((newline = this.source.indexOf("\\n", this.scanned)) !== -1) {
+            const line = this.source.slice(this.scanned, newline);
+            this.scanned = newline + 1;
+            const fence = /^ {0,3}(`{3,}|~{3,})/.exec(line);
+            if (this.fence) {
+              if (
+                fence &&
+                fence[1][0] === this.fence[0] &&
+                fence[1].length >= this.fence.length &&
+                !line.slice(fence[0].length).trim()
+              ) {
+                this.fence = null;
+                this.closed = this.scanned;
+              }
+            } else if (!line.trim()) {
+              this.blankAt = this.blankAt === null ? this.scanned : this.blankAt;
+            } else {
+              // A blank line ends the block unless the next line is indented
+              // (a list continuation or indented code).
+              if (this.blankAt !== null && !/^[ \\t]/.test(line)) this.closed = this.blankAt;
+              this.blankAt = null;
+              if (fence) {
+                this.closed = Math.max(this.closed, this.scanned - line.length - 1);
+                this.fence = fence[1];
+              }
+            }
+          }
+        }
+
+        flush() {
+          this.pending = false;
+          this.scan();
+          if (this.closed > this.committed) {
+            const block = document.createElement("div");
+            renderMarkdown(block, this.source.slice(this.committed, this.closed), true);
+            this.element.insertBefore(block, this.tail);
+            this.committed = this.closed;
+          }
+          renderMarkdown(this.tail, this.source.slice(this.committed), false);
+          if (this.onRender) this.onRender();
+        }
+
+        finish() {
+          this.pending = false;
+          renderMarkdown(this.tail, this.source.slice(this.committed), true);
+          this.committed = this.closed = this.scanned = this.source.length;
+          if (this.onRender) this.onRender();
+        }
+      }
+
+      // A long recorded-style chat stream for replayBenchmark().
+      function syntheticTranscript(blocks = 60) {
+        const words = "the model streams tokens while the monitor renders markdown blocks".split(" ");
+        let markdown = "";
+        for (let i = 0; i < blocks; i++) {
+          if (i % 3 === 0) {
+            markdown += `\\`\\`\\`python\\ndef step_${i}(x):\\n    return [v * ${i} for v in x]\\n\\`\\`\\`\\n\\n`;
+          } else if (i % 3 === 1) {
+            markdown += [1, 2, 3].map((n) => `- item ${n} of ${words.join(" ")}`).join("\\n") + "\\n\\n";
+          } else {
+            markdown += `**Part ${i}.** ` + Array(6).fill(words.join(" ")).join(", ") + ".\\n\\n";
+          }
+        }
+        const tokens = markdown.match(/\\s*\\S+|\\s+/g) || [];
+        return (
+          tokens
+            .map((token) => `data: ${JSON.stringify({ choices: [{ delta: { content: token } }] })}\\n\\n`)
+            .join("") + "data: [DONE]\\n\\n"
+        );
+      }
+
       class AIChatInterface extends HTMLElement {
         constructor() {
           super();
           this.attachShadow({ mode: "open" });
+          // The proxy keeps this conversation's history; a reload starts a new one.
+          this.sessionId = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
         }
 
 
@@ -75,21 +459,14 @@ HTML_TEMPLATE = """
             const libraryContainer = this.shadowRoot.querySelector("#libraryContainer");
             
             const markedScript = document.createElement("script");
-            markedScript.src = "https://cdnjs.cloudflare.com/ajax/libs/marked/4.0.2/marked.min.js";
+            markedScript.src = "{{ assets['marked.min.js'] }}";
             
             const highlightScript = document.createElement("script");
-            highlightScript.src = "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.5.1/highlight.min.js";
+            highlightScript.src = "{{ assets['highlight.min.js'] }}";
             
             libraryContainer.appendChild(markedScript);
             libraryContainer.appendChild(highlightScript);
 
-            // Wait for libraries to load before setting up Markdown and highlighting
-            Promise.all([
-            new Promise(resolve => markedScript.onload = resolve),
-            new Promise(resolve => highlightScript.onload = resolve)
-            ]).then(() => {
-            this.setupMarkdownAndHighlighting();
-            });
         }
 
 
@@ -97,10 +474,9 @@ HTML_TEMPLATE = """
         render() {
           this.shadowRoot.innerHTML = `
                 <style>
-                    @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap');
                     :host {
           display: block;
-          font-family: 'Poppins', sans-serif;
+          font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Arial, sans-serif;
           height: 100%;
         }
 
@@ -149,6 +525,13 @@ HTML_TEMPLATE = """
           border-bottom-left-radius: 0;
         }
 
+        .turn-stats {
+          align-self: flex-start;
+          font-size: 12px;
+          color: #565f89;
+          margin: -8px 0 12px 4px;
+        }
+
         .chat-input {
           display: flex;
           padding: 20px;
@@ -319,18 +702,6 @@ HTML_TEMPLATE = """
         }
 
 
-        setupMarkdownAndHighlighting() {
-            // Configure marked to use highlight.js for code syntax highlighting
-            marked.setOptions({
-            highlight: function(code, lang) {
-                const language = hljs.getLanguage(lang) ? lang : 'plaintext';
-                return hljs.highlight(code, { language }).value;
-            },
-            langPrefix: 'hljs language-'
-            });
-        }
-
-
         setupEventListeners() {
             const input = this.shadowRoot.querySelector("#userInput");
             const sendButton = this.shadowRoot.querySelector("#sendButton");
@@ -347,6 +718,14 @@ HTML_TEMPLATE = """
             }
             });
 
+            const chatMessages = this.shadowRoot.querySelector("#chatMessages");
+            this.followOutput = true;
+            chatMessages.addEventListener("scroll", () => {
+            // Keep following the answer unless the user scrolled up to read.
+            this.followOutput =
+                chatMessages.scrollHeight - chatMessages.scrollTop - chatMessages.clientHeight < 40;
+            });
+
             sendButton.addEventListener("click", () => this.sendMessage());
             themeToggle.addEventListener("click", () => this.toggleTheme());
             settingsToggle.addEventListener("click", () => this.toggleSettings());
@@ -360,8 +739,7 @@ HTML_TEMPLATE = """
             this.shadowRoot.querySelector("#systemPrompt");
 
           apiUrlInput.value =
-            localStorage.getItem("apiUrl") ||
-            "https://ai-smol.5nlcr7.easypanel.host/v1/chat/completions";
+            localStorage.getItem("apiUrl") || "/v1/chat/completions";
           systemPromptInput.value = localStorage.getItem("systemPrompt") || "";
         }
 
@@ -398,9 +776,12 @@ HTML_TEMPLATE = """
             input.value = "";
             sendButton.disabled = true;
 
-            const apiUrl = localStorage.getItem("apiUrl") || "https://ai-smol.5nlcr7.easypanel.host/v1/chat/completions";
+            const apiUrl = localStorage.getItem("apiUrl") || "/v1/chat/completions";
             const systemPrompt = localStorage.getItem("systemPrompt") || "";
 
+            // Our own proxy keeps the history server-side; other endpoints
+            // get the single-turn request as before.
+            const useSession = apiUrl.startsWith("/");
             try {
             const response = await fetch(apiUrl, {
                 method: "POST",
@@ -412,39 +793,38 @@ HTML_TEMPLATE = """
                     { role: "user", content: userMessage },
                 ],
                 stream: true,
+                ...(useSession ? { session_id: this.sessionId } : {}),
                 }),
             });
 
             if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
 
+            const messageDiv = document.createElement("div");
+            messageDiv.className = "message-bubble ai-message";
+            chatMessages.appendChild(messageDiv);
+            const renderer = new StreamingMarkdown(messageDiv, () => {
+                if (this.followOutput) chatMessages.scrollTop = chatMessages.scrollHeight;
+            });
+            const decoder = this.chunkDecoder(renderer);
             const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-            let aiMessage = "";
+            const textDecoder = new TextDecoder();
+            // Kept for replayBenchmark().
+            this.lastTranscript = "";
 
-            while (true) {
+            try {
+                while (true) {
                 const { done, value } = await reader.read();
                 if (done) break;
-
-                const chunk = decoder.decode(value, { stream: true });
-                const lines = chunk.split("\n");
-
-                for (const line of lines) {
-                if (line.startsWith("data: ")) {
-                    const data = line.slice(6);
-                    if (data === "[DONE]") continue;
-                    try {
-                    const parsed = JSON.parse(data);
-                    const content = parsed.choices[0].delta.content;
-                    if (content) {
-                        aiMessage += content;
-                        this.updateAIMessage(aiMessage);
-                    }
-                    } catch (error) {
-                    console.error("Error parsing JSON:", error);
-                    }
-                }
+                const text = textDecoder.decode(value, { stream: true });
+                this.lastTranscript += text;
+                decoder.push(text);
                 }
+                decoder.push(textDecoder.decode());
+                decoder.end();
+            } finally {
+                renderer.finish();
             }
+            if (useSession) this.showTurnStats(messageDiv);
             } catch (error) {
             console.error("Error:", error);
             this.addMessage("ai", `Error: ${error.message}`);
@@ -454,23 +834,105 @@ HTML_TEMPLATE = """
             chatMessages.scrollTop = chatMessages.scrollHeight;
         }
 
+        showTurnStats(messageDiv) {
+            fetch(`/v1/sessions/${encodeURIComponent(this.sessionId)}`)
+            .then((response) => response.json())
+            .then((session) => {
+                const turn = (session.turns || []).slice(-1)[0];
+                if (!turn || turn.prompt_evaluated === null) return;
+                const stats = document.createElement("div");
+                stats.className = "turn-stats";
+                stats.textContent =
+                `prompt: ${turn.prompt_evaluated} tokens evaluated, ${turn.prompt_reused ?? "?"} reused` +
+                (turn.slot === null ? "" : ` · slot ${turn.slot}`);
+                messageDiv.after(stats);
+            })
+            .catch((error) => console.error("Error:", error));
+        }
+
+        chunkDecoder(renderer) {
+            return new SSEDecoder((data) => {
+            if (data === "[DONE]") return;
+            try {
+                // The last llama-server chunk carries timings and may have no choices.
+                const choice = (JSON.parse(data).choices || [])[0];
+                const content = choice && choice.delta && choice.delta.content;
+                if (content) renderer.append(content);
+            } catch (error) {
+                console.error("Error parsing JSON:", error);
+            }
+            });
+        }
+
         addMessage(role, content) {
             const chatMessages = this.shadowRoot.querySelector("#chatMessages");
             const messageDiv = document.createElement("div");
             messageDiv.className = `message-bubble ${role}-message`;
-            messageDiv.innerHTML = marked.parse(content);
+            renderMarkdown(messageDiv, content, true);
             chatMessages.appendChild(messageDiv);
         }
 
-        updateAIMessage(content) {
-            const chatMessages = this.shadowRoot.querySelector("#chatMessages");
-            let aiMessage = chatMessages.querySelector(".ai-message:last-child");
-            if (!aiMessage) {
-            aiMessage = document.createElement("div");
-            aiMessage.className = "message-bubble ai-message";
-            chatMessages.appendChild(aiMessage);
+        // Replays the last answer's raw stream (or a synthetic long one) off-screen
+        // and compares per-frame render cost against re-parsing the whole message
+        // on every token. From the console:
+        //   document.querySelector("ai-chat-interface").replayBenchmark()
+        replayBenchmark(transcript = this.lastTranscript || syntheticTranscript(), chunkSize = 64, chunksPerFrame = 2) {
+            const chunks = [];
+            for (let i = 0; i < transcript.length; i += chunkSize) {
+            chunks.push(transcript.slice(i, i + chunkSize));
+            }
+            const percentile = (times, p) =>
+            times.length ? times.slice().sort((a, b) => a - b)[Math.floor(p * (times.length - 1))] : 0;
+            const results = {};
+
+            const element = document.createElement("div");
+            const renderer = new StreamingMarkdown(element, null, () => {});
+            const decoder = this.chunkDecoder(renderer);
+            const frames = [];
+            let started = performance.now();
+            chunks.forEach((chunk, i) => {
+            decoder.push(chunk);
+            if ((i + 1) % chunksPerFrame === 0 || i === chunks.length - 1) {
+                const t = performance.now();
+                renderer.flush();
+                frames.push(performance.now() - t);
             }
-            aiMessage.innerHTML = marked.parse(content);
+            });
+            decoder.end();
+            renderer.finish();
+            results.incremental = {
+            renders: frames.length,
+            total_ms: +(performance.now() - started).toFixed(1),
+            p50_ms: +percentile(frames, 0.5).toFixed(3),
+            p99_ms: +percentile(frames, 0.99).toFixed(3),
+            max_ms: +Math.max(0, ...frames).toFixed(3),
+            chars: renderer.source.length,
+            };
+
+            const naive = document.createElement("div");
+            let message = "";
+            const renders = [];
+            started = performance.now();
+            const naiveDecoder = this.chunkDecoder({
+            append: (content) => {
+                message += content;
+                const t = performance.now();
+                renderMarkdown(naive, message, true);
+                renders.push(performance.now() - t);
+            },
+            });
+            chunks.forEach((chunk) => naiveDecoder.push(chunk));
+            naiveDecoder.end();
+            results.full_per_token = {
+            renders: renders.length,
+            total_ms: +(performance.now() - started).toFixed(1),
+            p50_ms: +percentile(renders, 0.5).toFixed(3),
+            p99_ms: +percentile(renders, 0.99).toFixed(3),
+            max_ms: +Math.max(0, ...renders).toFixed(3),
+            chars: message.length,
+            };
+            console.table(results);
+            return results;
         }
     }
 
@@ -485,7 +947,102 @@ HTML_TEMPLATE = """
 
         connectedCallback() {
           this.render();
-          this.setupEventListeners();
+          this.initChart();
+          this.coreColumns = [];
+          this.maxCoreColumns = 120;
+          Promise.all([this.loadHistory(), this.loadCoreHistory()]).finally(() =>
+            this.setupEventListeners()
+          );
+        }
+
+        loadCoreHistory() {
+          return fetch(`/history/cores?since=-${this.maxCoreColumns * 2}`)
+            .then((response) => response.json())
+            .then((history) => {
+              this.coreColumns = (history.cores || []).slice(-this.maxCoreColumns);
+              this.drawHeatmap();
+            })
+            .catch((error) => console.error("Error:", error));
+        }
+
+        drawHeatmap() {
+          // One column per sample, one row per core, hue from idle to busy.
+          const canvas = this.shadowRoot.getElementById("coreHeatmap");
+          const ctx = canvas.getContext("2d");
+          const columns = this.coreColumns;
+          ctx.clearRect(0, 0, canvas.width, canvas.height);
+          if (!columns.length) return;
+          const cores = columns[columns.length - 1].length;
+          const cellWidth = canvas.width / this.maxCoreColumns;
+          const cellHeight = canvas.height / cores;
+          const offset = this.maxCoreColumns - columns.length;
+          columns.forEach((column, x) => {
+            column.forEach((busy, y) => {
+              ctx.fillStyle = `hsl(${120 - 1.2 * busy}, 70%, ${20 + 0.35 * busy}%)`;
+              ctx.fillRect(
+                (offset + x) * cellWidth,
+                y * cellHeight,
+                Math.ceil(cellWidth),
+                Math.ceil(cellHeight)
+              );
+            });
+          });
+        }
+
+        updateCoreInfo(cores) {
+          if (!cores) return;
+          this.shadowRoot.getElementById("coreSummary").textContent =
+            `${cores.busy_cores}/${cores.count} busy, max ${cores.busy_max}%, ` +
+            `steal ${cores.steal}%, iowait ${cores.iowait}%` +
+            (cores.freq_avg_mhz ? `, ${cores.freq_avg_mhz} MHz` : "");
+          this.coreColumns.push(cores.per_core);
+          if (this.coreColumns.length > this.maxCoreColumns) {
+            this.coreColumns.shift();
+          }
+          this.drawHeatmap();
+        }
+
+        initChart() {
+          // Keep a rolling window of the server-side history on screen.
+          this.maxChartPoints = 300;
+          this.chartData = {
+            labels: [],
+            datasets: [
+              {
+                label: "CPU %",
+                data: [],
+                borderColor: "#ff9e64",
+                borderWidth: 1,
+                pointRadius: 0,
+                tension: 0.2,
+              },
+            ],
+          };
+          this.cpuChart = new Chart(this.shadowRoot.getElementById("cpuChart"), {
+            type: "line",
+            data: this.chartData,
+            options: {
+              animation: false,
+              plugins: { legend: { display: false } },
+              scales: { y: { min: 0, max: 100 } },
+            },
+          });
+        }
+
+        loadHistory() {
+          // Seed the chart from /history so reloads and other tabs agree.
+          return fetch("/history?metric=cpu_usage&since=-600")
+            .then((response) => response.json())
+            .then((history) => {
+              for (const point of history.points || []) {
+                this.chartData.labels.push(
+                  new Date(point.t * 1000).toLocaleTimeString()
+                );
+                this.chartData.datasets[0].data.push(point.avg);
+              }
+              this.cpuChart.update();
+            })
+            .catch((error) => console.error("Error:", error));
         }
 
         render() {
@@ -533,6 +1090,22 @@ HTML_TEMPLATE = """
                 .memory { border-left: 4px solid #7dcfff; }
                 .disk { border-left: 4px solid #9ece6a; }
                 .network { border-left: 4px solid #bb9af7; }
+                .process { border-left: 4px solid #f7768e; }
+                .model { border-left: 4px solid #2ac3de; }
+                .worker-unhealthy { color: #f7768e; }
+                .gauge { height: 8px; background: #1a1b26; border-radius: 4px; overflow: hidden; }
+                .gauge-fill { height: 100%; width: 0; background: #2ac3de; transition: width 0.5s; }
+                .action {
+                margin-top: 10px;
+                padding: 4px 12px;
+                border: none;
+                border-radius: 12px;
+                background: #414868;
+                color: #c0caf5;
+                cursor: pointer;
+                }
+                .heatmap { width: 100%; image-rendering: pixelated; background: #1a1b26; }
+                .inference { border-left: 4px solid #e0af68; }
                 #deviceInfo {
                 background-color: #24283b;
                 padding: 20px;
@@ -570,6 +1143,15 @@ HTML_TEMPLATE = """
                 font-weight: bold;
                 color: #c0caf5;
                 }
+                .alert {
+                background: #24283b;
+                border-left: 4px solid #e0af68;
+                border-radius: 8px;
+                padding: 10px 20px;
+                margin-bottom: 10px;
+                color: #c0caf5;
+                }
+                .alert.critical { border-left-color: #f7768e; }
                 #updateTime {
                 text-align: center;
                 font-style: italic;
@@ -577,6 +1159,8 @@ HTML_TEMPLATE = """
                 color: #565f89;
                 }
             </style>
+
+            <div id="alerts"></div>
             
             <div id="deviceInfo">
                 <h2>Server Specifications</h2>
@@ -633,19 +1217,57 @@ HTML_TEMPLATE = """
                 <div class="subtitle" id="cpuLoad"></div>
                 <canvas id="cpuChart"></canvas>
                 </div>
+                <div class="card cpu">
+                <h3>CPU cores</h3>
+                <div class="subtitle" id="coreSummary"></div>
+                <canvas id="coreHeatmap" class="heatmap" width="300" height="120"></canvas>
+                </div>
                 <div class="card memory">
                 <h3>Memory</h3>
                 <p id="memoryUsage"></p>
                 <div class="subtitle" id="memoryDetails"></div>
                 </div>
+                <div class="card memory" id="containerCard" style="display: none">
+                <h3>Container</h3>
+                <p id="containerMemory"></p>
+                <div class="subtitle" id="containerDetails"></div>
+                <div class="subtitle" id="containerPressure"></div>
+                </div>
                 <div class="card disk">
                 <h3>Disk</h3>
                 <p id="diskUsage"></p>
                 <div class="subtitle" id="diskDetails"></div>
+                <div class="subtitle" id="diskIo"></div>
                 </div>
                 <div class="card network">
                 <h3>Network</h3>
                 <p id="networkUsage"></p>
+                <div class="subtitle" id="networkTotals"></div>
+                <div class="subtitle" id="networkInterfaces"></div>
+                </div>
+                <div class="card inference">
+                <h3>Inference</h3>
+                <p id="inferenceSpeed"></p>
+                <div class="subtitle" id="inferenceDetails"></div>
+                <div class="subtitle" id="admissionDetails"></div>
+                </div>
+                <div class="card inference" id="workersCard" style="display: none">
+                <h3>llama-server workers</h3>
+                <p id="workersSummary"></p>
+                <div id="workerList"></div>
+                </div>
+                <div class="card model">
+                <h3>Model page cache</h3>
+                <p id="modelResident"></p>
+                <div class="gauge"><div class="gauge-fill" id="modelGauge"></div></div>
+                <div class="subtitle" id="modelDetails"></div>
+                <button id="prewarmButton" class="action">Prewarm</button>
+                </div>
+                <div class="card process">
+                <h3>llama-server</h3>
+                <p id="processUsage"></p>
+                <div class="subtitle" id="processMemory"></div>
+                <div class="subtitle" id="processDetails"></div>
                 </div>
             </div>
             
@@ -654,21 +1276,115 @@ HTML_TEMPLATE = """
         }
 
         setupEventListeners() {
+          this.shadowRoot
+            .getElementById("prewarmButton")
+            .addEventListener("click", () => this.prewarmModel());
+          this.activeAlerts = {};
+          this.loadAlerts();
+          if (window.EventSource) {
+            this.startStream();
+          } else {
+            this.startPolling();
+          }
+        }
+
+        startStream() {
+          // One server push per sample: static fields once, then deltas.
+          this.state = {};
+          this.streamOpened = false;
+          const source = new EventSource("/stream");
+          source.addEventListener("static", (event) => {
+            this.streamOpened = true;
+            Object.assign(this.state, JSON.parse(event.data));
+          });
+          source.addEventListener("snapshot", (event) => {
+            Object.assign(this.state, JSON.parse(event.data));
+            this.applyData(this.state);
+          });
+          source.addEventListener("delta", (event) => {
+            this.mergeDelta(this.state, JSON.parse(event.data));
+            this.applyData(this.state);
+          });
+          source.addEventListener("alert", (event) => {
+            const alert = JSON.parse(event.data);
+            if (alert.state === "firing") {
+              this.activeAlerts[alert.rule] = alert;
+            } else {
+              delete this.activeAlerts[alert.rule];
+            }
+            this.renderAlerts();
+          });
+          source.onerror = () => {
+            if (!this.streamOpened) {
+              source.close();
+              this.startPolling();
+            }
+          };
+        }
+
+        mergeDelta(target, delta) {
+          for (const [key, value] of Object.entries(delta)) {
+            if (value === null) {
+              delete target[key];
+            } else if (
+              typeof value === "object" &&
+              !Array.isArray(value) &&
+              typeof target[key] === "object" &&
+              target[key] !== null
+            ) {
+              this.mergeDelta(target[key], value);
+            } else {
+              target[key] = value;
+            }
+          }
+        }
+
+        startPolling() {
+          if (this.pollTimer) return;
           this.updateData();
-          setInterval(() => this.updateData(), 2000);
+          this.pollTimer = setInterval(() => this.updateData(), 2000);
         }
 
         updateData() {
           fetch("/data")
             .then((response) => response.json())
-            .then((data) => {
-              this.updateSystemInfo(data);
-              this.updateUsageInfo(data);
-              this.updateCharts(data);
+            .then((data) => this.applyData(data))
+            .catch((error) => console.error("Error:", error));
+          this.loadAlerts();
+        }
+
+        loadAlerts() {
+          fetch("/alerts")
+            .then((response) => response.json())
+            .then((status) => {
+              this.activeAlerts = {};
+              (status.active || []).forEach((alert) => {
+                this.activeAlerts[alert.rule] = alert;
+              });
+              this.renderAlerts();
             })
             .catch((error) => console.error("Error:", error));
         }
 
+        renderAlerts() {
+          const container = this.shadowRoot.getElementById("alerts");
+          container.replaceChildren(
+            ...Object.values(this.activeAlerts).map((alert) => {
+              const item = document.createElement("div");
+              item.className = `alert ${alert.severity}`;
+              const since = new Date((alert.since || alert.at) * 1000).toLocaleTimeString();
+              item.textContent = `⚠️ ${alert.rule}: ${alert.summary} (now ${alert.value}, since ${since})`;
+              return item;
+            })
+          );
+        }
+
+        applyData(data) {
+          this.updateSystemInfo(data);
+          this.updateUsageInfo(data);
+          this.updateCharts(data);
+        }
+
         updateSystemInfo(data) {
           this.shadowRoot.getElementById(
             "os"
@@ -705,22 +1421,206 @@ HTML_TEMPLATE = """
           this.shadowRoot.getElementById(
             "diskDetails"
           ).textContent = `${data.disk.used} GB / ${data.disk.total} GB`;
-          this.shadowRoot.getElementById(
-            "networkUsage"
-          ).textContent = `↓ ${data.network.bytes_recv} MB ↑ ${data.network.bytes_sent} MB`;
+          this.updateIoInfo(data);
+          this.updateContainerInfo(data.container);
+          this.updateCoreInfo(data.cpu_cores);
+          this.updateModelInfo(data.model_cache);
+          this.updateProcessInfo(data.llama_process);
+          this.updateInferenceInfo(data.inference);
+          this.updateAdmissionInfo(data.admission);
+          this.updateWorkersInfo(data.workers);
           this.shadowRoot.getElementById("lastUpdateTime").textContent =
             new Date().toLocaleTimeString();
         }
 
+        updateContainerInfo(container) {
+          const card = this.shadowRoot.getElementById("containerCard");
+          card.style.display = container ? "" : "none";
+          if (!container) return;
+          const memory = container.memory;
+          const cpu = container.cpu;
+          const value = (v, suffix = "") => (v === null || v === undefined ? "-" : `${v}${suffix}`);
+          this.shadowRoot.getElementById("containerMemory").textContent =
+            memory.percent === null ? `${value(memory.used)} GB` : `${memory.percent}%`;
+          let details =
+            `${value(memory.used)} GB / ${memory.limit === null ? "no limit" : memory.limit + " GB"}` +
+            ` · CPU ${value(cpu.cores)} of ${value(cpu.limit)} cores` +
+            ` · throttled ${value(cpu.throttled_percent, "%")}`;
+          if (memory.oom_kills) details += ` · ${memory.oom_kills} OOM kills`;
+          this.shadowRoot.getElementById("containerDetails").textContent = details;
+          const pressure = Object.entries(container.pressure)
+            .filter(([, values]) => values.some !== undefined)
+            .map(([resource, values]) => `${resource} ${values.some}%`);
+          this.shadowRoot.getElementById("containerPressure").textContent =
+            pressure.length ? `Pressure (10s) ${pressure.join(" · ")}` : "";
+        }
+
+        formatRate(bytesPerSec) {
+          const units = ["B/s", "KB/s", "MB/s", "GB/s"];
+          let value = bytesPerSec || 0;
+          let unit = 0;
+          while (value >= 1024 && unit < units.length - 1) {
+            value /= 1024;
+            unit++;
+          }
+          return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+        }
+
+        updateIoInfo(data) {
+          const interfaces = data.network.interfaces || {};
+          let rx = 0;
+          let tx = 0;
+          const lines = [];
+          for (const [name, rates] of Object.entries(interfaces)) {
+            if (name === "lo") continue;
+            rx += rates.rx_bytes_per_sec || 0;
+            tx += rates.tx_bytes_per_sec || 0;
+            if (rates.rx_bytes_per_sec || rates.tx_bytes_per_sec) {
+              const faults =
+                (rates.rx_errors_per_sec || 0) + (rates.tx_errors_per_sec || 0) +
+                (rates.rx_drops_per_sec || 0) + (rates.tx_drops_per_sec || 0);
+              lines.push(
+                `${name} ↓ ${this.formatRate(rates.rx_bytes_per_sec)} ↑ ${this.formatRate(rates.tx_bytes_per_sec)}` +
+                  (faults ? ` (${faults.toFixed(1)} err+drop/s)` : "")
+              );
+            }
+          }
+          this.shadowRoot.getElementById("networkUsage").textContent =
+            `↓ ${this.formatRate(rx)} ↑ ${this.formatRate(tx)}`;
+          this.shadowRoot.getElementById("networkTotals").textContent =
+            `Total ↓ ${data.network.bytes_recv} MB ↑ ${data.network.bytes_sent} MB`;
+          this.shadowRoot.getElementById("networkInterfaces").textContent =
+            lines.join(" · ");
+
+          const disks = [];
+          for (const [name, rates] of Object.entries(data.disk_io || {})) {
+            if (!rates.read_iops && !rates.write_iops) continue;
+            disks.push(
+              `${name} R ${this.formatRate(rates.read_bytes_per_sec)} (${rates.read_iops} IOPS) ` +
+                `W ${this.formatRate(rates.write_bytes_per_sec)} (${rates.write_iops} IOPS)`
+            );
+          }
+          this.shadowRoot.getElementById("diskIo").textContent =
+            disks.join(" · ") || "Idle";
+        }
+
+        prewarmModel() {
+          fetch("/model/prewarm?mode=read", { method: "POST" })
+            .then((response) => response.json())
+            .then((status) => this.updateModelInfo(this.state ? this.state.model_cache : null, status))
+            .catch((error) => console.error("Error:", error));
+        }
+
+        updateModelInfo(cache, prewarm) {
+          const resident = this.shadowRoot.getElementById("modelResident");
+          const details = this.shadowRoot.getElementById("modelDetails");
+          if (!cache) {
+            resident.textContent = "-";
+            details.textContent = "Model file not found";
+            return;
+          }
+          prewarm = prewarm || cache.prewarm;
+          resident.textContent = `${cache.resident_percent}%`;
+          this.shadowRoot.getElementById("modelGauge").style.width =
+            `${cache.resident_percent}%`;
+          let text = `${cache.resident} MB / ${cache.size} MB resident`;
+          if (prewarm && prewarm.state === "running") {
+            const pct = prewarm.bytes_total
+              ? Math.round((100 * prewarm.bytes_done) / prewarm.bytes_total)
+              : 0;
+            text += ` · prewarm ${pct}% @ ${prewarm.throughput_mb_s || 0} MB/s`;
+          } else if (prewarm && prewarm.state === "done") {
+            text += ` · prewarmed in ${prewarm.duration}s (${prewarm.throughput_mb_s} MB/s)`;
+          } else if (prewarm && prewarm.state === "error") {
+            text += ` · prewarm failed: ${prewarm.error}`;
+          }
+          details.textContent = text;
+        }
+
+        updateInferenceInfo(inference) {
+          const speed = this.shadowRoot.getElementById("inferenceSpeed");
+          const details = this.shadowRoot.getElementById("inferenceDetails");
+          if (!inference || inference.status !== "ok") {
+            speed.textContent = inference ? inference.status : "-";
+            details.textContent = "";
+            return;
+          }
+          const value = (v) => (v === undefined || v === null ? "-" : v);
+          speed.textContent = `${value(inference.generated_throughput)} tok/s`;
+          details.textContent =
+            `gen ${value(inference.generated_tokens_per_second)} tok/s, ` +
+            `prompt ${value(inference.prompt_tokens_per_second)} tok/s, ` +
+            `slots ${value(inference.slots_busy)}/${value(inference.slots_total)} busy, ` +
+            `queue ${value(inference.queue_depth)}`;
+        }
+
+        updateAdmissionInfo(admission) {
+          if (!admission) return;
+          const rejected = admission.rejected_queue_full + admission.rejected_deadline;
+          this.shadowRoot.getElementById("admissionDetails").textContent =
+            `proxy ${admission.inflight}/${admission.limit} in flight, ` +
+            `${admission.queued} queued (${admission.queued_clients} clients), ` +
+            `${rejected} rejected`;
+        }
+
+        updateWorkersInfo(workers) {
+          const card = this.shadowRoot.getElementById("workersCard");
+          card.style.display = workers ? "" : "none";
+          if (!workers) return;
+          const entries = Object.entries(workers);
+          const healthy = entries.filter(([, w]) => w.state === "healthy").length;
+          const outstanding = entries.reduce((sum, [, w]) => sum + w.outstanding, 0);
+          this.shadowRoot.getElementById("workersSummary").textContent =
+            `${healthy}/${entries.length} healthy · ${outstanding} in flight`;
+          const seconds = (v) => (v === null || v === undefined ? "-" : `${v}s`);
+          this.shadowRoot.getElementById("workerList").replaceChildren(
+            ...entries.map(([index, w]) => {
+              const row = document.createElement("div");
+              row.className = w.state === "healthy" ? "subtitle" : "subtitle worker-unhealthy";
+              let text =
+                `#${index} ${w.state}${w.warm ? "" : " (cold)"} · ${w.outstanding} in flight · ` +
+                `${w.served} served · TTFT ${seconds(w.ttft)} · ${seconds(w.duration)}/req`;
+              if (w.cpus) text += ` · CPUs ${w.cpus}`;
+              if (w.errors) text += ` · ${w.errors} errors`;
+              if (w.restarts) text += ` · ${w.restarts} restarts`;
+              if (w.state !== "healthy" && w.last_error) text += ` · ${w.last_error}`;
+              row.textContent = text;
+              return row;
+            })
+          );
+        }
+
+        updateProcessInfo(proc) {
+          const usage = this.shadowRoot.getElementById("processUsage");
+          const memory = this.shadowRoot.getElementById("processMemory");
+          const details = this.shadowRoot.getElementById("processDetails");
+          if (!proc) {
+            usage.textContent = "Not running";
+            memory.textContent = "";
+            details.textContent = "";
+            return;
+          }
+          const rate = (value) => (value === undefined ? "-" : value);
+          usage.textContent = `${proc.cpu_percent}% CPU`;
+          memory.textContent =
+            `RSS ${proc.rss} MB, USS ${rate(proc.uss)} MB, ` +
+            `model ${rate(proc.model_resident)} / ${rate(proc.model_mapped)} MB resident`;
+          details.textContent =
+            `PID ${proc.pid}, ${proc.num_threads} threads, ` +
+            `${rate(proc.ctx_involuntary_rate)} invol. ctx/s, ` +
+            `faults ${rate(proc.major_faults_rate)} major/s ${rate(proc.minor_faults_rate)} minor/s` +
+            (proc.restarts ? `, ${proc.restarts} restarts` : "");
+        }
+
         updateCharts(data) {
           // Update CPU chart
-          const currentTime = new Date().toLocaleTimeString();
+          const currentTime = new Date(data.timestamp * 1000).toLocaleTimeString();
 
           this.chartData.labels.push(currentTime);
           this.chartData.datasets[0].data.push(data.cpu_usage);
 
-          // Keep only the last 10 data points
-          if (this.chartData.labels.length > 10) {
+          // Keep only the most recent points
+          while (this.chartData.labels.length > this.maxChartPoints) {
             this.chartData.labels.shift();
             this.chartData.datasets[0].data.shift();
           }
@@ -741,55 +1641,4295 @@ HTML_TEMPLATE = """
 @app.route('/')
 def index():
     try:
-        return render_template_string(HTML_TEMPLATE, **get_system_info())
+        return dashboard.page().response()
     except Exception as e:
         app.logger.error(f"Error in index route: {str(e)}")
         return "An error occurred while rendering the page", 500
 
+@app.route('/assets/<digest>/<name>')
+def asset(digest, name):
+    static = dashboard.asset(name)
+    if static is None or static.digest != digest:
+        return jsonify({"error": f"Unknown asset: {name}"}), 404
+    return static.response()
+
+@app.route('/info')
+def info():
+    try:
+        return host_info().response()
+    except Exception as e:
+        app.logger.error(f"Error in info route: {str(e)}")
+        return jsonify({"error": "An error occurred while fetching host info"}), 500
+
 @app.route('/data')
 def data():
     try:
-        return jsonify(get_system_info())
+        since = request.args.get('since')
+        if since is None:
+            return jsonify(sampler.latest())
+        sampler.latest()  # make sure the sampler is running
+        return Response(data_deltas.body(since), content_type='application/json')
     except Exception as e:
         app.logger.error(f"Error in data route: {str(e)}")
         return jsonify({"error": "An error occurred while fetching data"}), 500
 
-def get_system_info():
+@app.route('/history')
+def history_route():
+    metric = request.args.get('metric')
+    if not metric:
+        return jsonify({'metrics': history.metrics()})
+    try:
+        since = request.args.get('since', type=float)
+        step = request.args.get('step', type=float)
+        if since is not None and since <= 0:
+            # Non-positive values are relative to now, e.g. since=-3600.
+            since = time.time() + since
+        if step is not None and step <= 0:
+            return jsonify({"error": "step must be positive"}), 400
+        points = run_blocking(history.query, metric, since, step)
+    except KeyError:
+        return jsonify({"error": f"Unknown metric: {metric}"}), 404
+    except Exception as e:
+        app.logger.error(f"Error in history route: {str(e)}")
+        return jsonify({"error": "An error occurred while fetching history"}), 500
+    return jsonify({'metric': metric, 'points': points})
+
+@app.route('/history/cores')
+def core_history_route():
+    try:
+        field = request.args.get('field', 'busy')
+        if field not in CORE_FIELDS:
+            return jsonify({"error": f"field must be one of {', '.join(CORE_FIELDS)}"}), 400
+        since = request.args.get('since', type=float)
+        step = request.args.get('step', type=float)
+        if since is not None and since <= 0:
+            since = time.time() + since
+        if step is not None and step <= 0:
+            return jsonify({"error": "step must be positive"}), 400
+        times, values = run_blocking(core_history.query, since, step, field)
+    except Exception as e:
+        app.logger.error(f"Error in core history route: {str(e)}")
+        return jsonify({"error": "An error occurred while fetching core history"}), 500
+    return jsonify({'field': field, 'times': times, 'cores': np.round(values, 1).tolist()})
+
+def parse_networks(spec):
+    return [ipaddress.ip_network(network.strip(), strict=False)
+            for network in spec.split(',') if network.strip()]
+
+def client_allowed(networks):
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return any(address in network for network in networks)
+
+@app.route('/model/prewarm', methods=['GET', 'POST'])
+def model_prewarm():
+    if request.method == 'GET':
+        return jsonify(model_prewarmer.status())
+    # A full read of the model can push everything else out of the page cache.
+    if not client_allowed(prewarm_networks):
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        started = model_prewarmer.start(request.args.get('mode', 'read'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not started:
+        return jsonify({"error": "Prewarm already running", **model_prewarmer.status()}), 409
+    return jsonify(model_prewarmer.status()), 202
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    body = request.get_data()
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return openai_error("Request body must be JSON", 400)
+    if not isinstance(payload, dict):
+        return openai_error("Request body must be a JSON object", 400)
+    streaming = bool(payload.get('stream'))
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    session = None
+    session_id = payload.pop('session_id', None)
+    if session_id is not None:
+        session, payload = chat_sessions.begin(str(session_id), payload)
+        if session is None:
+            return openai_error("A turn is already in progress for this session", 409)
+        body = json.dumps(payload).encode('utf-8')
+        headers['X-Session-Id'] = session.id
+    cache_key = response_cache.key(payload) if session is None else None
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            chat_stats.count('cache_hit')
+            content_type, chunks = cached
+            # Replay the recorded upstream chunks, so a hit streams like a miss.
+            return Response(iter(chunks), content_type=content_type,
+                            headers={**headers, 'X-Cache': 'HIT'})
+        headers['X-Cache'] = 'MISS'
+    client = request.headers.get('X-Client-Id') or request.remote_addr or 'unknown'
+    timeout = min(request.headers.get('X-Queue-Timeout', CHAT_QUEUE_TIMEOUT, type=float),
+                  CHAT_QUEUE_TIMEOUT)
+    ticket = admission.acquire(client, timeout)
+    if ticket.rejected:
+        if session is not None:
+            chat_sessions.abort(session)
+        status = 429 if ticket.rejected == 'queue_full' else 503
+        return openai_error(f"Server busy ({ticket.rejected.replace('_', ' ')})", status,
+                            {'Retry-After': str(ticket.retry_after)})
+    timer = ChatTimer(streaming=streaming, keep_content=session is not None)
+    if session is not None:
+        timer.on_finish = lambda timer, outcome: chat_sessions.complete(session, timer, outcome)
+    worker = llama_workers.pick(session.worker if session is not None else None)
+    if llama_workers.managed:
+        headers['X-Worker'] = str(worker.index)
+    llama_workers.dispatch(worker)
+    timer.worker = worker
+    try:
+        conn, response = worker.pool.request('POST', '/v1/chat/completions', body,
+                                             {'Content-Type': 'application/json'})
+    except (OSError, http.client.HTTPException) as e:
+        admission.release(ticket)
+        app.logger.error(f"Error in chat proxy: {str(e)}")
+        timer.finish('upstream_error')
+        return openai_error("llama-server is unavailable", 502)
+    content_type = response.getheader('Content-Type', 'application/json')
+    if response.status != 200 or not content_type.startswith('text/event-stream'):
+        try:
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            app.logger.error(f"Error in chat proxy: {str(e)}")
+            worker.pool.release(conn, False)
+            timer.finish('upstream_error')
+            return openai_error("llama-server response was interrupted", 502)
+        finally:
+            admission.release(ticket)
+        worker.pool.release(conn, not response.will_close)
+        timer.finish_response(response.status, data)
+        if cache_key is not None and response.status == 200:
+            response_cache.put(cache_key, content_type, [data])
+        return Response(data, status=response.status, content_type=content_type,
+                        headers=headers)
+    relayed = Response(relay_stream(conn, response, timer, worker.pool, cache_key, content_type),
+                       content_type=content_type, headers=headers)
+    # Runs when the WSGI server closes the response, even if never iterated.
+    relayed.call_on_close(lambda: admission.release(ticket))
+    relayed.call_on_close(lambda: timer.finish('aborted'))
+    return relayed
+
+@app.route('/v1/sessions/<session_id>', methods=['GET', 'DELETE'])
+def chat_session(session_id):
+    if request.method == 'DELETE':
+        if not chat_sessions.delete(session_id):
+            return jsonify({"error": f"Unknown session: {session_id}"}), 404
+        return jsonify({'deleted': session_id})
+    session = chat_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
+    return jsonify(session)
+
+def openai_error(message, status, headers=None):
+    body = jsonify({'error': {'message': message, 'type': 'proxy_error', 'code': status}})
+    return body, status, headers or {}
+
+@app.route('/stream')
+def stream():
+    sampler.latest()  # make sure the sampler is running
+    if not stream_hub.try_join():
+        return jsonify({"error": "Too many stream clients"}), 503, {'Retry-After': '30'}
+    response = Response(stream_hub.subscribe(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(stream_hub.leave)
+    return response
+
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process serves requests and the sampler is not stuck.
+    snapshot = sampler.latest()
+    if snapshot['sample_age'] > LIVENESS_MAX_SAMPLE_AGE * SAMPLE_INTERVAL:
+        return jsonify({'status': 'stalled', 'sample_age': snapshot['sample_age']}), 503
+    return jsonify({'status': 'ok'})
+
+@app.route('/ready')
+def ready():
+    readiness.start()
+    status = readiness.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/alerts')
+def alerts_route():
+    try:
+        return jsonify(alerts.status())
+    except Exception as e:
+        app.logger.error(f"Error in alerts route: {str(e)}")
+        return jsonify({"error": "An error occurred while fetching alerts"}), 500
+
+@app.route('/debug/perf')
+def debug_perf():
+    error = perf_access_error()
+    if error is not None:
+        return error
+    return jsonify({
+        **perf.summary(),
+        'sample_interval': SAMPLE_INTERVAL,
+        'profiler': {'running': profiler.running, 'last': profiler.last},
+    })
+
+@app.route('/debug/perf/profile')
+def debug_perf_profile():
+    error = perf_access_error()
+    if error is not None:
+        return error
+    seconds = request.args.get('seconds', 10.0, type=float)
+    interval = request.args.get('interval', PROFILE_INTERVAL, type=float)
+    output = request.args.get('format', 'collapsed')
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({"error": f"seconds must be in (0, {PROFILE_MAX_SECONDS}]"}), 400
+    if not 0.001 <= interval <= 1:
+        return jsonify({"error": "interval must be between 0.001 and 1 seconds"}), 400
+    if output not in ('collapsed', 'json'):
+        return jsonify({"error": "format must be collapsed or json"}), 400
+    job = profiler.profile(seconds, interval)
+    if job is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    stacks = job['stacks'].most_common()
+    if output == 'json':
+        return jsonify({'seconds': seconds, 'interval': interval, 'samples': job['samples'],
+                        'stacks': [{'stack': stack, 'count': count} for stack, count in stacks]})
+    filename = time.strftime('monitor-%Y%m%d-%H%M%S.folded')
+    return Response(''.join(f'{stack} {count}\n' for stack, count in stacks),
+                    content_type='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'inline; filename="{filename}"'})
+
+def perf_access_error():
+    # /debug/perf exposes internals and can burn CPU, so it is opt-in and
+    # limited to DEBUG_PERF_ALLOW.
+    if not DEBUG_PERF:
+        return jsonify({"error": "Not found"}), 404
+    if not client_allowed(perf_networks):
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+@app.route('/metrics')
+def metrics():
+    sampler.latest()  # make sure the sampler is running
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = Response(exposition.body(use_gzip), content_type=PROMETHEUS_CONTENT_TYPE)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@functools.lru_cache(maxsize=None)
+def get_static_info():
+    return {
+        'system': platform.system(),
+        'node_name': platform.node(),
+        'release': platform.release(),
+        'version': platform.version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'network_info': describe_network()
+    }
+
+@functools.lru_cache(maxsize=None)
+def host_info():
+    """/info body: static facts plus totals, in native units."""
+    facts = {
+        **get_static_info(),
+        'cpu_count': psutil.cpu_count(),
+        'cpu_count_physical': psutil.cpu_count(logical=False),
+        'memory_total': psutil.virtual_memory().total,
+        'disk_total': psutil.disk_usage('/').total,
+        'boot_time': psutil.boot_time(),
+    }
+    body = json.dumps(facts, separators=(',', ':')).encode('utf-8')
+    return StaticAsset(body, 'application/json', INFO_CACHE_CONTROL)
+
+def describe_network():
+    addresses = psutil.net_if_addrs()
+    stats = psutil.net_if_stats()
+    parts = []
+    for name, addrs in sorted(addresses.items()):
+        stat = stats.get(name)
+        if name == 'lo' or (stat is not None and not stat.isup):
+            continue
+        ips = [a.address for a in addrs if a.family in (socket.AF_INET, socket.AF_INET6)]
+        if not ips:
+            continue
+        speed = f" ({stat.speed} Mb/s)" if stat is not None and stat.speed else ""
+        parts.append(f"{name} {', '.join(ips)}{speed}")
+    return '; '.join(parts) or 'N/A'
+
+def counter_delta(old, new):
+    # psutil's nowrap mode already folds kernel counter wraparound into a
+    # monotonic total, so a decrease here means the counters were reset.
+    return new - old if new >= old else None
+
+class CounterRates:
+    """Per-device rates from cumulative counters.
+
+    Devices that appear are reported from their second sample on; devices
+    that disappear are forgotten.
+    """
+
+    def __init__(self, fields):
+        # fields maps output names to counter field names.
+        self.fields = fields
+        self._previous = {}
+        self._time = None
+
+    def update(self, counters):
+        now = time.monotonic()
+        elapsed = now - self._time if self._time is not None else 0
+        rates = {}
+        for device, values in counters.items():
+            old = self._previous.get(device)
+            if old is None or elapsed <= 0:
+                continue
+            device_rates = {}
+            for name, field in self.fields.items():
+                delta = counter_delta(old[field], values[field])
+                if delta is not None:
+                    device_rates[name] = round(delta / elapsed, 1)
+            rates[device] = device_rates
+        self._previous = counters
+        self._time = now
+        return rates
+
+def read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    # Limits read "max" when unset.
+    return None if value == 'max' else int(value)
+
+def read_keyed(path):
+    """A flat-keyed cgroup file such as memory.stat or cpu.stat."""
+    try:
+        with open(path) as f:
+            return {key: int(value) for key, value in (line.split() for line in f if line.strip())}
+    except (OSError, ValueError):
+        return {}
+
+def read_pressure(path):
+    """PSI averages and stall totals, e.g. {'some_avg10': 0.5, 'some_total': 1234}."""
+    pressure = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                kind, *fields = line.split()
+                for field in fields:
+                    name, value = field.split('=')
+                    pressure[f'{kind}_{name}'] = int(value) if name == 'total' else float(value)
+    except (OSError, ValueError):
+        pass
+    return pressure
+
+class CgroupStats:
+    """Container memory, CPU and pressure from this process's cgroup v2 files.
+
+    psutil reports the host, which hides a container running into its own
+    limits. root is the cgroup2 mount point, so a fake directory tree can
+    stand in for /sys/fs/cgroup. Without a v2 hierarchy (cgroup v1, or no
+    cgroups at all) sample() returns None.
+    """
+
+    def __init__(self, root=CGROUP_ROOT, self_cgroup='/proc/self/cgroup'):
+        self.root = root
+        self.path = self._locate(self_cgroup)
+        self._previous = None
+
+    def _locate(self, self_cgroup):
+        if not os.path.exists(os.path.join(self.root, 'cgroup.controllers')):
+            app.logger.info(f"No cgroup v2 hierarchy at {self.root}, container metrics disabled")
+            return None
+        relative = ''
+        try:
+            with open(self_cgroup) as f:
+                for line in f:
+                    hierarchy, _, path = line.rstrip('\n').split(':', 2)
+                    if hierarchy == '0':
+                        relative = path.lstrip('/')
+        except (OSError, ValueError):
+            pass
+        path = os.path.join(self.root, relative)
+        # Without a cgroup namespace the listed path is not under our mount,
+        # which is then the container's own cgroup.
+        if not os.path.exists(os.path.join(path, 'memory.current')):
+            path = self.root
+        return path
+
+    def _read_cpu_limit(self):
+        try:
+            with open(os.path.join(self.path, 'cpu.max')) as f:
+                quota, period = f.read().split()
+            if quota != 'max':
+                return int(quota) / int(period)
+        except (OSError, ValueError):
+            pass
+        try:
+            return float(len(os.sched_getaffinity(0)))
+        except (AttributeError, OSError):
+            return float(psutil.cpu_count())
+
+    def sample(self):
+        if self.path is None:
+            return None
+        now = time.monotonic()
+        join = lambda name: os.path.join(self.path, name)
+        stat = read_keyed(join('memory.stat'))
+        events = read_keyed(join('memory.events'))
+        cpu = read_keyed(join('cpu.stat'))
+        current = read_int(join('memory.current'))
+        limit = read_int(join('memory.max'))
+        working_set = None
+        if current is not None:
+            # What the kernel cannot simply drop under pressure, as kubelet counts it.
+            working_set = max(0, current - stat.get('inactive_file', 0))
+        cpu_limit = self._read_cpu_limit()
+        sample = {
+            'memory_current': current,
+            'memory_max': limit,
+            'memory_working_set': working_set,
+            'memory_anon': stat.get('anon'),
+            'memory_file': stat.get('file'),
+            'memory_kernel': stat.get('kernel'),
+            'memory_percent': round(100.0 * working_set / limit, 1)
+            if limit and working_set is not None else None,
+            'oom_kills': events.get('oom_kill'),
+            'major_faults': stat.get('pgmajfault'),
+            'cpu_limit': cpu_limit,
+            'cpu_usage_usec': cpu.get('usage_usec'),
+            'cpu_periods': cpu.get('nr_periods'),
+            'cpu_throttled': cpu.get('nr_throttled'),
+            'cpu_throttled_usec': cpu.get('throttled_usec'),
+            'pressure': {resource: read_pressure(join(f'{resource}.pressure'))
+                         for resource in ('cpu', 'memory', 'io')},
+        }
+        sample.update(self._rates(now, sample))
+        return sample
+
+    def _rates(self, now, sample):
+        previous, self._previous = self._previous, (now, sample)
+        rates = {'cpu_cores': None, 'cpu_percent': None, 'throttled_percent': None,
+                 'throttled_seconds_per_sec': None}
+        if previous is None or now <= previous[0]:
+            return rates
+        elapsed = now - previous[0]
+        old = previous[1]
+
+        def delta(key):
+            if sample[key] is None or old[key] is None:
+                return None
+            return counter_delta(old[key], sample[key])
+
+        usage = delta('cpu_usage_usec')
+        if usage is not None:
+            rates['cpu_cores'] = round(usage / 1e6 / elapsed, 3)
+            if sample['cpu_limit']:
+                rates['cpu_percent'] = round(100.0 * rates['cpu_cores'] / sample['cpu_limit'], 1)
+        periods, throttled = delta('cpu_periods'), delta('cpu_throttled')
+        if periods and throttled is not None:
+            rates['throttled_percent'] = round(100.0 * throttled / periods, 1)
+        elif periods == 0:
+            rates['throttled_percent'] = 0.0
+        throttled_usec = delta('cpu_throttled_usec')
+        if throttled_usec is not None:
+            rates['throttled_seconds_per_sec'] = round(throttled_usec / 1e6 / elapsed, 3)
+        return rates
+
+def format_container(cgroup):
+    if cgroup is None:
+        return None
+    gb = 1024 * 1024 * 1024
+
+    def to_gb(value):
+        return None if value is None else round(value / gb, 2)
+
+    return {
+        'memory': {
+            'used': to_gb(cgroup['memory_working_set']),
+            'limit': to_gb(cgroup['memory_max']),
+            'percent': cgroup['memory_percent'],
+            'oom_kills': cgroup['oom_kills'],
+        },
+        'cpu': {
+            'cores': cgroup['cpu_cores'],
+            'limit': cgroup['cpu_limit'],
+            'percent': cgroup['cpu_percent'],
+            'throttled_percent': cgroup['throttled_percent'],
+        },
+        'pressure': {resource: {kind: values[f'{kind}_avg10']
+                                for kind in ('some', 'full') if f'{kind}_avg10' in values}
+                     for resource, values in cgroup['pressure'].items()},
+    }
+
+def read_interface_counters():
+    return {name: c._asdict()
+            for name, c in psutil.net_io_counters(pernic=True, nowrap=True).items()}
+
+def read_disk_counters():
+    return {name: c._asdict()
+            for name, c in (psutil.disk_io_counters(perdisk=True, nowrap=True) or {}).items()
+            if not name.startswith(IGNORED_DISK_PREFIXES)}
+
+# (key, reader) pairs behind collect_metrics(), run in order; each reader gets
+# the readings taken so far. /debug/perf times them one by one.
+COLLECTORS = (
+    # Non-blocking: psutil reports usage since the previous call, so the
+    # sampler's own cadence defines the measurement window.
+    ('cpu_percent', lambda raw: psutil.cpu_percent(interval=None)),
+    ('model_cache', lambda raw: model_cache.sample()),
+    ('core_times', lambda raw: read_core_times()),
+    ('core_freq', lambda raw: read_core_freq()),
+    ('load', lambda raw: psutil.getloadavg()),
+    ('memory', lambda raw: psutil.virtual_memory()._asdict()),
+    ('disk', lambda raw: psutil.disk_usage('/')._asdict()),
+    ('network', lambda raw: psutil.net_io_counters()._asdict()),
+    ('interfaces', lambda raw: read_interface_counters()),
+    ('interface_rates', lambda raw: network_rates.update(raw['interfaces'])),
+    ('disks', lambda raw: read_disk_counters()),
+    ('disk_rates', lambda raw: disk_rates.update(raw['disks'])),
+    ('process', lambda raw: llama_process.sample()),
+    ('inference', lambda raw: inference.latest()),
+    ('admission', lambda raw: admission.status()),
+    ('workers', lambda raw: llama_workers.status() if llama_workers.managed else None),
+    ('cgroup', lambda raw: cgroup_stats.sample()),
+)
+
+def collect_metrics(collectors=COLLECTORS):
+    """One round of raw readings in native units (bytes, counters)."""
+    raw = {}
+    for key, read in collectors:
+        raw[key] = read(raw)
+    return raw
+
+def get_system_info(raw=None):
     try:
-        cpu_usage = psutil.cpu_percent(interval=1)
-        cpu_load = ", ".join([f"{x:.2f}" for x in psutil.getloadavg()])
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        network = psutil.net_io_counters()
+        if raw is None:
+            raw = collect_metrics()
+        memory = raw['memory']
+        disk = raw['disk']
+        network = raw['network']
         
         return {
-            'system': platform.system(),
-            'node_name': platform.node(),
-            'release': platform.release(),
-            'version': platform.version(),
-            'machine': platform.machine(),
-            'processor': platform.processor(),
-            'cpu_usage': cpu_usage,
-            'cpu_load': cpu_load,
+            **get_static_info(),
+            'cpu_usage': raw['cpu_percent'],
+            'cpu_load': ", ".join([f"{x:.2f}" for x in raw['load']]),
+            'cpu_cores': core_aggregates(raw['core_times'], raw['core_freq']),
             'memory': {
-                'percent': memory.percent,
-                'used': round(memory.used / (1024 * 1024 * 1024), 1),
-                'total': round(memory.total / (1024 * 1024 * 1024), 1)
+                'percent': memory['percent'],
+                'used': round(memory['used'] / (1024 * 1024 * 1024), 1),
+                'total': round(memory['total'] / (1024 * 1024 * 1024), 1)
             },
             'disk': {
-                'percent': disk.percent,
-                'used': round(disk.used / (1024 * 1024 * 1024), 1),
-                'total': round(disk.total / (1024 * 1024 * 1024), 1)
+                'percent': disk['percent'],
+                'used': round(disk['used'] / (1024 * 1024 * 1024), 1),
+                'total': round(disk['total'] / (1024 * 1024 * 1024), 1)
             },
             'network': {
-                'bytes_recv': round(network.bytes_recv / (1024 * 1024), 2),
-                'bytes_sent': round(network.bytes_sent / (1024 * 1024), 2)
+                'bytes_recv': round(network['bytes_recv'] / (1024 * 1024), 2),
+                'bytes_sent': round(network['bytes_sent'] / (1024 * 1024), 2),
+                'interfaces': raw['interface_rates']
             },
-            'network_info': 'N/A'  # Simplified for now
+            'disk_io': raw['disk_rates'],
+            'model_cache': format_model_cache(raw['model_cache']),
+            'llama_process': format_process_info(raw['process']),
+            'inference': raw['inference'],
+            'admission': raw['admission'],
+            'workers': raw['workers'],
+            'container': format_container(raw['cgroup'])
         }
     except Exception as e:
         app.logger.error(f"Error in get_system_info: {str(e)}")
         raise
 
+def format_model_cache(cache):
+    if cache is None:
+        return None
+    mb = 1024 * 1024
+    info = {
+        'size': round(cache['size'] / mb, 1),
+        'resident': round(cache['resident_bytes'] / mb, 1),
+        'resident_percent': cache['resident_percent'],
+    }
+    prewarm = model_prewarmer.status()
+    if prewarm['state'] != 'idle':
+        info['prewarm'] = prewarm
+    return info
+
+def run_blocking(func, *args):
+    """Call func on a real OS thread when serving with gevent, else inline.
+
+    gevent makes sockets cooperative but not file reads or long Python loops,
+    so those would stall every connection while they run on a greenlet.
+    """
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            import gevent
+            return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+class _Libc:
+    """ctypes bindings for mmap/mincore, which the mmap module does not expose."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                              ctypes.c_int, ctypes.c_int, ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+        self.libc = libc
+
+    def resident_pages(self, fd, size):
+        """(resident, total) pages of the first size bytes of fd."""
+        libc = self.libc
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            raise OSError(ctypes.get_errno(), 'mmap failed')
+        try:
+            pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+            vec = (ctypes.c_ubyte * pages)()
+            if libc.mincore(addr, size, vec) != 0:
+                raise OSError(ctypes.get_errno(), 'mincore failed')
+            resident = int(np.count_nonzero(np.frombuffer(vec, dtype=np.uint8) & 1))
+            return resident, pages
+        finally:
+            libc.munmap(addr, size)
+
+class ModelResidency:
+    """How much of the model file is in the page cache, via mincore(2)."""
+
+    def __init__(self, path, interval=MODEL_RESIDENCY_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._libc = None
+        self._unavailable = False
+        self._last = None
+        self._checked = 0.0
+
+    def check(self):
+        if self._unavailable or not os.path.isfile(self.path):
+            return None
+        try:
+            if self._libc is None:
+                self._libc = _Libc()
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return None
+                resident, pages = run_blocking(self._libc.resident_pages, f.fileno(), size)
+        except (OSError, AttributeError) as e:
+            # No mincore on this platform: stop trying.
+            app.logger.warning(f"Model residency unavailable: {str(e)}")
+            self._unavailable = True
+            return None
+        self._checked = time.monotonic()
+        self._last = {
+            'size': size,
+            'resident_bytes': min(size, resident * mmap.PAGESIZE),
+            'resident_percent': round(100.0 * resident / pages, 1),
+        }
+        return self._last
+
+    def sample(self):
+        if time.monotonic() - self._checked >= self.interval:
+            return self.check()
+        return self._last
+
+class Readiness:
+    """Gates /ready on llama-server health, a warmup completion and model residency.
+
+    Each llama-server worker gets its own warmup when it turns healthy;
+    /ready passes once any worker is healthy and warm. Residency is
+    re-checked after startup too, since page cache pressure can evict the
+    model. The startup timeline records when each stage was first reached,
+    in seconds since the monitor process started (which start.sh launches
+    first, so it stands in for container start).
+    """
+
+    STAGES = ('llama_server_start', 'llama_server_healthy', 'model_resident',
+              'first_token', 'warm', 'ready')
+
+    def __init__(self):
+        self.started = psutil.Process().create_time()
+        self.timeline = {}
+        self.healthy = False
+        self.warm = False
+        self.resident_percent = None
+        self.warmups = 0
+        self.warmup = {'state': 'pending'}
+        self._pid = None
+        self._next_warmup = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='readiness', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                app.logger.error(f"Error in readiness check: {str(e)}")
+            time.sleep(LLAMA_POLL_INTERVAL if self.ready() else READY_CHECK_INTERVAL)
+
+    def _mark(self, stage, when=None):
+        if stage not in self.timeline:
+            self.timeline[stage] = round((when or time.time()) - self.started, 3)
+            app.logger.info(f"Startup: {stage} after {self.timeline[stage]}s")
+
+    def ready(self):
+        return self.healthy and self.warm and self._resident()
+
+    def _resident(self):
+        return self.resident_percent is None or self.resident_percent >= READY_RESIDENT_PERCENT
+
+    def check(self):
+        process = sampler.latest().get('llama_process')
+        if process:
+            if self._pid is not None and process['pid'] != self._pid and not llama_workers.managed:
+                # A restarted llama-server is cold again, even if it came
+                # back between two health checks.
+                llama_workers.workers[0].warm = False
+                self._next_warmup = 0.0
+            self._pid = process['pid']
+            self._mark('llama_server_start', time.time() - process['uptime'])
+        healthy = llama_workers.healthy()
+        self.healthy = bool(healthy)
+        if not healthy:
+            return
+        self._mark('llama_server_healthy')
+        if not self._resident() or 'model_resident' not in self.timeline:
+            cache = model_cache.check()
+        else:
+            # Once resident, the sampler's cached reading is fresh enough.
+            cache = model_cache.sample()
+        self.resident_percent = cache['resident_percent'] if cache else None
+        if self._resident():
+            self._mark('model_resident')
+        if time.monotonic() >= self._next_warmup:
+            for worker in healthy:
+                if not worker.warm:
+                    self.run_warmup(worker)
+        self.warm = any(worker.warm for worker in healthy)
+        if self.ready():
+            self._mark('ready')
+
+    def run_warmup(self, worker):
+        if WARMUP_MAX_TOKENS <= 0:
+            worker.warm = True
+            self.warmup = {'state': 'skipped'}
+            self._mark('warm')
+            return
+        self.warmups += 1
+        self.warmup = {'state': 'running'}
+        body = json.dumps({
+            'messages': [{'role': 'user', 'content': WARMUP_PROMPT}],
+            'max_tokens': WARMUP_MAX_TOKENS,
+            'stream': True,
+        }).encode('utf-8')
+        started = time.monotonic()
+        first_token = None
+        try:
+            conn, response = worker.pool.request('POST', '/v1/chat/completions', body,
+                                                 {'Content-Type': 'application/json'})
+            try:
+                if response.status != 200:
+                    raise OSError(f"HTTP {response.status}")
+                for line in response:
+                    if first_token is None and line.startswith(b'data:') and b'"content"' in line:
+                        first_token = time.monotonic()
+                        self._mark('first_token')
+            finally:
+                worker.pool.release(conn, False)
+        except (OSError, http.client.HTTPException) as e:
+            app.logger.warning(f"Warmup completion on worker {worker.index} failed, "
+                               f"retrying: {str(e)}")
+            self.warmup = {'state': 'error', 'worker': worker.index, 'error': str(e)}
+            self._next_warmup = time.monotonic() + WARMUP_RETRY_INTERVAL
+            return
+        done = time.monotonic()
+        worker.warm = True
+        self.warmup = {
+            'state': 'done',
+            'worker': worker.index,
+            'duration': round(done - started, 3),
+            'time_to_first_token': round(first_token - started, 3) if first_token else None,
+        }
+        self._mark('warm')
+
+    def status(self):
+        return {
+            'ready': self.ready(),
+            'checks': {
+                'llama_server_healthy': self.healthy,
+                'warmup': self.warmup,
+                'model_resident_percent': self.resident_percent,
+                'model_resident_required': READY_RESIDENT_PERCENT,
+            },
+            'timeline': dict(self.timeline),
+        }
+
+    def write(self, writer):
+        writer.family('monitor_ready', 'gauge', 'Whether /ready is passing.', int(self.ready()))
+        writer.family('monitor_startup_seconds', 'gauge',
+                      'Seconds from monitor start until each startup stage was first reached.',
+                      [({'stage': stage}, self.timeline[stage])
+                       for stage in self.STAGES if stage in self.timeline])
+        writer.family('llama_warmups_total', 'counter', 'Warmup completions attempted.',
+                      self.warmups)
+        writer.family('llama_warmup_seconds', 'gauge', 'Duration of the last warmup completion.',
+                      self.warmup.get('duration'))
+        writer.family('llama_warmup_time_to_first_token_seconds', 'gauge',
+                      'Time to first token of the last warmup completion.',
+                      self.warmup.get('time_to_first_token'))
+
+class ModelPrewarmer:
+    """Pulls the model file into the page cache on a background thread.
+
+    'read' streams the file with large sequential reads; 'fadvise' asks the
+    kernel for readahead with POSIX_FADV_WILLNEED and tracks it via mincore.
+    """
+
+    MODES = ('read', 'fadvise')
+
+    def __init__(self, path, residency):
+        self.path = path
+        self.residency = residency
+        self._lock = threading.Lock()
+        self._status = {'state': 'idle'}
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def start(self, mode='read'):
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        with self._lock:
+            if self._status['state'] == 'running':
+                return False
+            self._status = {'state': 'running', 'mode': mode, 'bytes_done': 0,
+                            'started': time.time()}
+        threading.Thread(target=self._run, args=(mode,), name='model-prewarm', daemon=True).start()
+        return True
+
+    def _run(self, mode):
+        started = time.monotonic()
+        try:
+            with open(self.path, 'rb', buffering=0) as f:
+                size = os.fstat(f.fileno()).st_size
+                self._update(bytes_total=size)
+                if mode == 'read':
+                    self._read(f, size, started)
+                else:
+                    self._fadvise(f, size, started)
+            elapsed = time.monotonic() - started
+            self._update(state='done', duration=round(elapsed, 2),
+                         throughput_mb_s=round(size / elapsed / 2 ** 20, 1) if elapsed else None)
+            self.residency.check()
+        except Exception as e:
+            app.logger.error(f"Error prewarming {self.path}: {str(e)}")
+            self._update(state='error', error=str(e))
+
+    def _progress(self, done, started):
+        elapsed = time.monotonic() - started
+        self._update(bytes_done=done,
+                     throughput_mb_s=round(done / elapsed / 2 ** 20, 1) if elapsed else None)
+
+    def _read(self, f, size, started):
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(PREWARM_CHUNK)
+        view = memoryview(buffer)
+        done = 0
+        while True:
+            n = run_blocking(f.readinto, view)
+            if not n:
+                break
+            done += n
+            self._progress(done, started)
+
+    def _fadvise(self, f, size, started):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        # Readahead is asynchronous: follow it until it stops making progress.
+        last, stalled = -1, 0
+        while stalled < 10:
+            cache = self.residency.check()
+            if cache is None:
+                return
+            done = cache['resident_bytes']
+            self._progress(done, started)
+            if done >= size:
+                return
+            stalled = stalled + 1 if done <= last else 0
+            last = done
+            time.sleep(0.5)
+
+def read_core_times():
+    """Per-core CPU time percentages as a (cores, len(CORE_FIELDS)) array."""
+    times = psutil.cpu_times_percent(interval=None, percpu=True)
+    table = np.array(times, dtype=np.float32)
+    fields = times[0]._fields
+    matrix = np.zeros((len(times), len(CORE_FIELDS)), dtype=np.float32)
+    for column, name in enumerate(CORE_FIELDS[:-1]):
+        if name in fields:
+            matrix[:, column] = table[:, fields.index(name)]
+    idle = table[:, fields.index('idle')]
+    iowait = matrix[:, CORE_FIELDS.index('iowait')]
+    matrix[:, -1] = np.clip(100.0 - idle - iowait, 0.0, 100.0)
+    return matrix
+
+def read_core_freq():
+    freq = psutil.cpu_freq(percpu=True) or []
+    if not freq:
+        return None
+    return np.array([f.current for f in freq], dtype=np.float32)
+
+def core_aggregates(matrix, freq):
+    busy = matrix[:, -1]
+    means = matrix.mean(axis=0)
+    result = {
+        'count': int(matrix.shape[0]),
+        'busy_avg': round(float(means[-1]), 1),
+        'busy_max': round(float(busy.max()), 1),
+        'busy_min': round(float(busy.min()), 1),
+        'busy_stddev': round(float(busy.std()), 1),
+        'busy_cores': int(np.count_nonzero(busy >= CORE_BUSY_THRESHOLD)),
+        'per_core': np.rint(busy).astype(int).tolist(),
+    }
+    for column, name in enumerate(CORE_FIELDS[:-1]):
+        result[name] = round(float(means[column]), 1)
+    if freq is not None and freq.size:
+        result['freq_avg_mhz'] = round(float(freq.mean()), 0)
+        result['freq_min_mhz'] = round(float(freq.min()), 0)
+    return result
+
+class CoreHistory:
+    """Ring of per-core samples stored as one (capacity, cores, fields) array."""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._stamps = np.zeros(self.capacity)
+        self._values = None
+        self._head = 0
+        self._count = 0
+
+    def append(self, timestamp, matrix):
+        with self._lock:
+            if self._values is None or self._values.shape[1:] != matrix.shape:
+                # First sample, or cores were hot-plugged: start over.
+                self._values = np.zeros((self.capacity,) + matrix.shape, dtype=np.float32)
+                self._head = self._count = 0
+            self._values[self._head] = matrix
+            self._stamps[self._head] = timestamp
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def query(self, since=None, step=None, field='busy'):
+        """Bucketed per-core means: (bucket start times, buckets x cores)."""
+        column = CORE_FIELDS.index(field)
+        with self._lock:
+            if not self._count:
+                return [], np.zeros((0, 0), dtype=np.float32)
+            order = (np.arange(self._count) + self._head - self._count) % self.capacity
+            stamps = self._stamps[order]
+            values = self._values[order, :, column]
+        if since is not None:
+            start = int(np.searchsorted(stamps, since))
+            stamps, values = stamps[start:], values[start:]
+        if not len(stamps):
+            return [], np.zeros((0, values.shape[1]), dtype=np.float32)
+        if step is None:
+            step = max((stamps[-1] - stamps[0]) / HISTORY_MAX_POINTS, SAMPLE_INTERVAL)
+        keys = np.floor(stamps / step)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        sums = np.add.reduceat(values, starts, axis=0)
+        counts = np.diff(np.r_[starts, len(keys)])[:, None]
+        return (keys[starts] * step).tolist(), sums / counts
+
+def bench_cores(cores, ticks):
+    """Time per-core aggregation and history append for a synthetic host."""
+    rng = np.random.default_rng(0)
+    store = CoreHistory(CORE_HISTORY_MINUTES * 60 / SAMPLE_INTERVAL)
+    samples = rng.uniform(0, 100, size=(16, cores, len(CORE_FIELDS))).astype(np.float32)
+    freq = rng.uniform(800, 3500, size=cores).astype(np.float32)
+    started = time.perf_counter()
+    for tick in range(ticks):
+        matrix = samples[tick % len(samples)]
+        core_aggregates(matrix, freq)
+        store.append(tick * SAMPLE_INTERVAL, matrix)
+    aggregate_us = (time.perf_counter() - started) / ticks * 1e6
+    started = time.perf_counter()
+    store.query()
+    query_ms = (time.perf_counter() - started) * 1e3
+    reads = 50
+    started = time.perf_counter()
+    for _ in range(reads):
+        read_core_times()
+        read_core_freq()
+    read_us = (time.perf_counter() - started) / reads * 1e6
+    print(f"synthetic cores:          {cores}")
+    print(f"aggregate + append/tick:  {aggregate_us:.1f} us")
+    print(f"history query ({store._count} ticks): {query_ms:.2f} ms")
+    print(f"psutil read/tick ({psutil.cpu_count()} real cores): {read_us:.1f} us")
+
+def format_process_info(process):
+    if process is None:
+        return None
+    mb = 1024 * 1024
+    info = dict(process)
+    for key in ('rss', 'uss', 'model_mapped', 'model_resident'):
+        if info.get(key) is not None:
+            info[key] = round(info[key] / mb, 1)
+    return info
+
+def read_page_faults(pid):
+    # psutil does not expose fault counters on Linux; fields 10 and 12 of
+    # /proc/<pid>/stat are minflt and majflt (counted after the comm field).
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[7]), int(fields[9])
+    except (OSError, IndexError, ValueError):
+        return None, None
+
+class TrackedProcess:
+    """Follows one named process (or pidfile, or pid callback) across restarts."""
+
+    def __init__(self, name, pidfile=None, model_path=None, pid_source=None):
+        self.name = name
+        self.pidfile = pidfile
+        self.pid_source = pid_source
+        self.model_path = os.path.realpath(model_path) if model_path else None
+        self.restarts = 0
+        self._proc = None
+        self._last_scan = 0.0
+        self._previous = None
+        self._detail = {}
+        self._ticks = 0
+
+    def _read_pidfile(self):
+        if self.pid_source is not None:
+            return self.pid_source()
+        try:
+            with open(self.pidfile) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _matches(self, info):
+        if info['name'] == self.name:
+            return True
+        for path in (info.get('exe'), (info.get('cmdline') or [None])[0]):
+            if path and os.path.basename(path) == self.name:
+                return True
+        return False
+
+    def _find(self):
+        if self.pidfile or self.pid_source is not None:
+            pid = self._read_pidfile()
+            return psutil.Process(pid) if pid else None
+        for proc in psutil.process_iter(['name', 'exe', 'cmdline']):
+            try:
+                if self._matches(proc.info) and proc.status() != psutil.STATUS_ZOMBIE:
+                    return proc
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return None
+
+    def _attach(self):
+        now = time.monotonic()
+        if now - self._last_scan < PROCESS_RESCAN_INTERVAL:
+            return None
+        self._last_scan = now
+        try:
+            proc = self._find()
+            if proc is None:
+                return None
+            proc.cpu_percent(interval=None)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+        if self._proc is not None or self._previous is not None:
+            self.restarts += 1
+        app.logger.info(f"Tracking {self.name} pid {proc.pid}")
+        self._proc = proc
+        self._previous = None
+        self._detail = {}
+        self._ticks = 0
+        return proc
+
+    def _current(self):
+        proc = self._proc
+        if proc is not None:
+            try:
+                stale = not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE
+            except psutil.NoSuchProcess:
+                stale = True
+            if not stale and (self.pidfile or self.pid_source is not None):
+                stale = self._read_pidfile() != proc.pid
+            if stale:
+                self._proc = proc = None
+                self._last_scan = 0.0
+        return proc or self._attach()
+
+    def _read_detail(self, proc):
+        detail = {}
+        try:
+            detail['uss'] = proc.memory_full_info().uss
+        except (psutil.AccessDenied, AttributeError):
+            pass
+        if self.model_path:
+            try:
+                maps = [m for m in proc.memory_maps(grouped=True) if m.path == self.model_path]
+                detail['model_mapped'] = sum(m.size for m in maps)
+                detail['model_resident'] = sum(m.rss for m in maps)
+            except psutil.AccessDenied:
+                pass
+        return detail
+
+    def sample(self):
+        proc = self._current()
+        if proc is None:
+            return None
+        try:
+            with proc.oneshot():
+                now = time.monotonic()
+                memory = proc.memory_info()
+                ctx = proc.num_ctx_switches()
+                current = {
+                    'time': now,
+                    'ctx_voluntary': ctx.voluntary,
+                    'ctx_involuntary': ctx.involuntary,
+                }
+                current['minor_faults'], current['major_faults'] = read_page_faults(proc.pid)
+                info = {
+                    'pid': proc.pid,
+                    'uptime': round(time.time() - proc.create_time(), 1),
+                    'restarts': self.restarts,
+                    'cpu_percent': proc.cpu_percent(interval=None),
+                    'num_threads': proc.num_threads(),
+                    'rss': memory.rss,
+                }
+                if self._ticks % max(1, PROCESS_DETAIL_EVERY) == 0:
+                    # Parsing smaps takes tens of milliseconds for a large process.
+                    self._detail = run_blocking(self._read_detail, proc)
+                self._ticks += 1
+        except psutil.NoSuchProcess:
+            self._proc = None
+            self._last_scan = 0.0
+            return None
+        info.update(self._detail)
+        previous = self._previous
+        elapsed = now - previous['time'] if previous else 0
+        for key in ('ctx_voluntary', 'ctx_involuntary', 'minor_faults', 'major_faults'):
+            info[key] = current[key]
+            if elapsed > 0 and current[key] is not None and previous[key] is not None:
+                info[key + '_rate'] = round((current[key] - previous[key]) / elapsed, 1)
+        self._previous = current
+        return info
+
+def parse_prometheus_text(text):
+    """Sum Prometheus text-format samples by metric name, ignoring labels."""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        try:
+            name_part, value = line.rsplit(None, 1)
+            name = name_part.split('{', 1)[0].strip()
+            values[name] = values.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return values
+
+class LlamaServerClient:
+    """Keep-alive HTTP client for llama-server with a hard per-call timeout."""
+
+    def __init__(self, base_url, timeout):
+        parts = urllib.parse.urlsplit(base_url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, path):
+        # One retry covers a keep-alive connection the server already closed.
+        for attempt in (0, 1):
+            reused = self._conn is not None
+            if not reused:
+                self._conn = self._connect()
+            try:
+                self._conn.request('GET', self.prefix + path)
+                response = self._conn.getresponse()
+                return response.status, response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if not reused or attempt:
+                    raise
+            except Exception:
+                self.close()
+                raise
+
+class InferenceCollector:
+    """Polls llama-server's /health, /metrics and /slots on its own thread.
+
+    Runs apart from the sampler so a slow or hung model server can only
+    make this data stale, never delay host sampling.
+    """
+
+    def __init__(self, client, interval=LLAMA_POLL_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self._latest = None
+        self._previous = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='inference-collector', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self._latest = self.poll()
+            except Exception as e:
+                app.logger.error(f"Error in inference collector: {str(e)}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def latest(self):
+        return self._latest
+
+    def _get_json(self, path):
+        status, body = self.client.get(path)
+        return status, (json.loads(body) if body else None)
+
+    def poll(self):
+        try:
+            status, health = self._get_json('/health')
+        except (OSError, http.client.HTTPException, ValueError):
+            self._previous = None
+            return {'status': 'unreachable'}
+        info = {'status': 'ok' if status == 200 else 'loading' if status == 503 else 'error'}
+        if status != 200:
+            return info
+
+        # Each endpoint fails on its own (e.g. /slots disabled or timing out
+        # mid-generation); the rest of the poll still counts.
+        unavailable = []
+        try:
+            status, body = self.client.get('/metrics')
+            if status != 200:
+                raise ValueError(f"HTTP {status}")
+            self._add_metrics(info, parse_prometheus_text(body.decode('utf-8', 'replace')))
+        except (OSError, http.client.HTTPException, ValueError):
+            unavailable.append('metrics')
+
+        try:
+            status, slots = self._get_json('/slots')
+            if status != 200 or not isinstance(slots, list):
+                raise ValueError(f"HTTP {status}")
+            # Newer servers report is_processing, older ones state (0 = idle).
+            busy = sum(1 for slot in slots
+                       if slot.get('is_processing', slot.get('state', 0) != 0))
+            info['slots_total'] = len(slots)
+            info['slots_busy'] = busy
+            info['slots_idle'] = len(slots) - busy
+        except (OSError, http.client.HTTPException, ValueError, AttributeError):
+            unavailable.append('slots')
+        if unavailable:
+            info['unavailable'] = unavailable
+        return info
+
+    def _add_metrics(self, info, metrics):
+        now = time.monotonic()
+        counters = {
+            'time': now,
+            'prompt_tokens': metrics.get('llamacpp:prompt_tokens_total'),
+            'prompt_seconds': metrics.get('llamacpp:prompt_seconds_total'),
+            'generated_tokens': metrics.get('llamacpp:tokens_predicted_total'),
+            'generated_seconds': metrics.get('llamacpp:tokens_predicted_seconds_total'),
+        }
+        info['requests_processing'] = metrics.get('llamacpp:requests_processing')
+        info['queue_depth'] = metrics.get('llamacpp:requests_deferred')
+        info['kv_cache_usage'] = metrics.get('llamacpp:kv_cache_usage_ratio')
+        previous, self._previous = self._previous, counters
+        if previous is None:
+            return
+        wall = now - previous['time']
+        for kind in ('prompt', 'generated'):
+            tokens, seconds = counters[kind + '_tokens'], counters[kind + '_seconds']
+            old_tokens, old_seconds = previous[kind + '_tokens'], previous[kind + '_seconds']
+            if tokens is None or old_tokens is None or tokens < old_tokens:
+                continue  # metric missing or server restarted
+            delta = tokens - old_tokens
+            # Throughput over wall time, and speed while actually busy.
+            info[kind + '_throughput'] = round(delta / wall, 2) if wall > 0 else 0.0
+            if seconds is not None and old_seconds is not None and seconds > old_seconds:
+                info[kind + '_tokens_per_second'] = round(delta / (seconds - old_seconds), 2)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items()) + '}'
+
+def format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if value != value:
+        return 'NaN'
+    if value in (math.inf, -math.inf):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+class PrometheusWriter:
+    """Accumulates metric families in the Prometheus text format."""
+
+    def __init__(self):
+        self._parts = []
+
+    def family(self, name, kind, help_text, samples):
+        # samples is a single value or a list of (labels, value) pairs.
+        if not isinstance(samples, list):
+            samples = [({}, samples)]
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        self._parts.append(f'# HELP {name} {help_text}\n# TYPE {name} {kind}\n')
+        for labels, value in samples:
+            self.sample(name, value, labels)
+
+    def header(self, name, kind, help_text):
+        self._parts.append(f'# HELP {name} {help_text}\n# TYPE {name} {kind}\n')
+
+    def sample(self, name, value, labels=None):
+        self._parts.append(f'{name}{format_labels(labels)} {format_value(value)}\n')
+
+    def render(self):
+        return ''.join(self._parts)
+
+# Extra exporters called as provider(writer) each time /metrics is rebuilt.
+metrics_providers = []
+
+def write_host_metrics(writer, info, raw):
+    writer.family('monitor_sample_timestamp_seconds', 'gauge',
+                  'Unix time the sample was taken.', info['timestamp'])
+    writer.family('monitor_samples_total', 'counter',
+                  'Samples taken since the monitor started.', info['seq'])
+    writer.family('host_cpu_usage_percent', 'gauge',
+                  'Host CPU utilisation over the last sample interval.', raw['cpu_percent'])
+    writer.family('host_load_average', 'gauge', 'System load average.',
+                  [({'period': p}, v) for p, v in zip(('1m', '5m', '15m'), raw['load'])])
+
+    memory = raw['memory']
+    writer.family('host_memory_bytes', 'gauge', 'Host memory by state.',
+                  [({'state': k}, v) for k, v in memory.items() if k != 'percent'])
+    writer.family('host_memory_usage_percent', 'gauge', 'Host memory in use.', memory['percent'])
+
+    disk = raw['disk']
+    writer.family('host_filesystem_bytes', 'gauge', 'Root filesystem space by state.',
+                  [({'mountpoint': '/', 'state': k}, disk[k]) for k in ('total', 'used', 'free')])
+
+    network = raw['network']
+    for direction, suffix in (('receive', 'recv'), ('transmit', 'sent')):
+        writer.family(f'host_network_{direction}_bytes_total', 'counter',
+                      f'Bytes {suffix} on all interfaces.', network['bytes_' + suffix])
+        writer.family(f'host_network_{direction}_packets_total', 'counter',
+                      f'Packets {suffix} on all interfaces.', network['packets_' + suffix])
+    writer.family('host_network_errors_total', 'counter', 'Network errors on all interfaces.',
+                  [({'direction': 'receive'}, network['errin']), ({'direction': 'transmit'}, network['errout'])])
+    writer.family('host_network_drops_total', 'counter', 'Dropped packets on all interfaces.',
+                  [({'direction': 'receive'}, network['dropin']), ({'direction': 'transmit'}, network['dropout'])])
+
+    matrix = raw['core_times']
+    writer.family('host_cpu_core_percent', 'gauge', 'Per-core CPU utilisation by mode.',
+                  [({'core': core, 'mode': mode}, round(float(value), 2))
+                   for core, row in enumerate(matrix.tolist())
+                   for mode, value in zip(CORE_FIELDS, row)])
+    if raw['core_freq'] is not None:
+        writer.family('host_cpu_core_frequency_hertz', 'gauge', 'Per-core current frequency.',
+                      [({'core': core}, mhz * 1e6) for core, mhz in enumerate(raw['core_freq'].tolist())])
+
+    interfaces = raw['interfaces']
+    for key, name, help_text in (('bytes', 'host_network_device_bytes_total', 'Bytes per interface.'),
+                                 ('packets', 'host_network_device_packets_total', 'Packets per interface.')):
+        writer.family(name, 'counter', help_text,
+                      [({'device': dev, 'direction': d}, c[f'{key}_{f}'])
+                       for dev, c in interfaces.items() for d, f in (('receive', 'recv'), ('transmit', 'sent'))])
+    for key, name, help_text in (('err', 'host_network_device_errors_total', 'Errors per interface.'),
+                                 ('drop', 'host_network_device_drops_total', 'Dropped packets per interface.')):
+        writer.family(name, 'counter', help_text,
+                      [({'device': dev, 'direction': d}, c[f'{key}{f}'])
+                       for dev, c in interfaces.items() for d, f in (('receive', 'in'), ('transmit', 'out'))])
+
+    disks = raw['disks']
+    writer.family('host_disk_bytes_total', 'counter', 'Bytes transferred per block device.',
+                  [({'device': dev, 'direction': d}, c[f'{d}_bytes'])
+                   for dev, c in disks.items() for d in ('read', 'write')])
+    writer.family('host_disk_operations_total', 'counter', 'Completed I/O operations per block device.',
+                  [({'device': dev, 'direction': d}, c[f'{d}_count'])
+                   for dev, c in disks.items() for d in ('read', 'write')])
+
+    cgroup = raw['cgroup']
+    if cgroup:
+        writer.family('container_memory_bytes', 'gauge', 'Container memory from cgroup v2.',
+                      [({'kind': kind}, cgroup['memory_' + kind])
+                       for kind in ('current', 'working_set', 'anon', 'file', 'kernel')])
+        writer.family('container_memory_limit_bytes', 'gauge', 'Container memory.max.',
+                      cgroup['memory_max'])
+        writer.family('container_oom_kills_total', 'counter',
+                      'Processes killed by the OOM killer in the container.', cgroup['oom_kills'])
+        writer.family('container_cpu_limit_cores', 'gauge',
+                      'CPUs the container may use (cpu.max quota, else affinity).', cgroup['cpu_limit'])
+        if cgroup['cpu_usage_usec'] is not None:
+            writer.family('container_cpu_usage_seconds_total', 'counter',
+                          'CPU time used by the container.', cgroup['cpu_usage_usec'] / 1e6)
+        writer.family('container_cpu_periods_total', 'counter',
+                      'CFS enforcement periods.', cgroup['cpu_periods'])
+        writer.family('container_cpu_throttled_periods_total', 'counter',
+                      'CFS periods in which the container was throttled.', cgroup['cpu_throttled'])
+        if cgroup['cpu_throttled_usec'] is not None:
+            writer.family('container_cpu_throttled_seconds_total', 'counter',
+                          'Time the container spent throttled.', cgroup['cpu_throttled_usec'] / 1e6)
+        for resource, values in cgroup['pressure'].items():
+            writer.family(f'container_pressure_{resource}_stalled_seconds_total', 'counter',
+                          f'Time tasks were stalled on {resource} (PSI).',
+                          [({'kind': kind}, values[f'{kind}_total'] / 1e6)
+                           for kind in ('some', 'full') if f'{kind}_total' in values])
+
+    cache = raw['model_cache']
+    if cache:
+        writer.family('model_file_size_bytes', 'gauge', 'Size of the model file.', cache['size'])
+        writer.family('model_file_resident_bytes', 'gauge',
+                      'Bytes of the model file resident in the page cache.', cache['resident_bytes'])
+    prewarm = model_prewarmer.status()
+    writer.family('model_prewarm_running', 'gauge', 'Whether a model prewarm is in progress.',
+                  1 if prewarm['state'] == 'running' else 0)
+    writer.family('model_prewarm_bytes', 'gauge', 'Bytes read by the current or last prewarm.',
+                  prewarm.get('bytes_done'))
+
+    process = raw['process']
+    writer.family('llama_process_up', 'gauge', 'Whether the llama-server process is found.',
+                  1 if process else 0)
+    if process:
+        writer.family('llama_process_restarts_total', 'counter',
+                      'Times llama-server was re-attached after exiting.', process['restarts'])
+        writer.family('llama_process_cpu_percent', 'gauge', 'llama-server CPU utilisation.',
+                      process['cpu_percent'])
+        writer.family('llama_process_threads', 'gauge', 'llama-server thread count.',
+                      process['num_threads'])
+        writer.family('llama_process_memory_bytes', 'gauge', 'llama-server memory by kind.',
+                      [({'kind': k}, process.get(k)) for k in ('rss', 'uss', 'model_mapped', 'model_resident')])
+        writer.family('llama_process_context_switches_total', 'counter',
+                      'llama-server context switches.',
+                      [({'type': 'voluntary'}, process['ctx_voluntary']),
+                       ({'type': 'involuntary'}, process['ctx_involuntary'])])
+        writer.family('llama_process_page_faults_total', 'counter', 'llama-server page faults.',
+                      [({'type': 'minor'}, process['minor_faults']),
+                       ({'type': 'major'}, process['major_faults'])])
+
+    result = raw['inference']
+    if result:
+        writer.family('llama_server_up', 'gauge', 'Whether llama-server /health reports ok.',
+                      1 if result['status'] == 'ok' else 0)
+        writer.family('llama_server_tokens_per_second', 'gauge',
+                      'Token throughput over the last poll interval.',
+                      [({'phase': 'prompt'}, result.get('prompt_throughput')),
+                       ({'phase': 'generation'}, result.get('generated_throughput'))])
+        writer.family('llama_server_busy_tokens_per_second', 'gauge',
+                      'Token speed while llama-server was busy.',
+                      [({'phase': 'prompt'}, result.get('prompt_tokens_per_second')),
+                       ({'phase': 'generation'}, result.get('generated_tokens_per_second'))])
+        writer.family('llama_server_slots', 'gauge', 'llama-server slots by state.',
+                      [({'state': 'busy'}, result.get('slots_busy')),
+                       ({'state': 'idle'}, result.get('slots_idle'))])
+        writer.family('llama_server_requests_processing', 'gauge',
+                      'Requests llama-server is processing.', result.get('requests_processing'))
+        writer.family('llama_server_queue_depth', 'gauge',
+                      'Requests deferred by llama-server.', result.get('queue_depth'))
+        writer.family('llama_server_kv_cache_usage_ratio', 'gauge',
+                      'KV cache utilisation.', result.get('kv_cache_usage'))
+
+class MetricsExposition:
+    """/metrics body rendered once per sample and shared by every scrape."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._body = b''
+        self._gzipped = None
+
+    def update(self, info, raw):
+        writer = PrometheusWriter()
+        write_host_metrics(writer, info, raw)
+        for provider in metrics_providers:
+            try:
+                provider(writer)
+            except Exception as e:
+                app.logger.error(f"Error in metrics provider: {str(e)}")
+        body = writer.render().encode('utf-8')
+        with self._lock:
+            self._body = body
+            self._gzipped = None
+
+    def body(self, compressed=False):
+        with self._lock:
+            if not compressed:
+                return self._body
+            if self._gzipped is None:
+                # Compressed lazily, at most once per sample.
+                self._gzipped = gzip.compress(self._body, compresslevel=5)
+            return self._gzipped
+
+class StaticAsset:
+    """A response body compressed once up front and served with a strong ETag."""
+
+    def __init__(self, body, content_type, cache_control):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': body}
+        compressed = {'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(body, quality=11)
+        for encoding, data in compressed.items():
+            if len(data) < len(body):
+                self.variants[encoding] = data
+
+    def etag(self, encoding):
+        # Each encoding is a different byte sequence, so each gets its own tag.
+        return self.digest if encoding == 'identity' else f'{self.digest}-{encoding}'
+
+    def negotiate(self, accept_encoding):
+        accepted = set()
+        for part in accept_encoding.split(','):
+            name, _, params = part.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return 'identity'
+
+    def response(self):
+        encoding = self.negotiate(request.headers.get('Accept-Encoding', ''))
+        tag = self.etag(encoding)
+        if request.if_none_match.contains(tag):
+            response = Response(status=304)
+        else:
+            response = Response(self.variants[encoding], content_type=self.content_type)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(tag)
+        response.headers['Cache-Control'] = self.cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+class Dashboard:
+    """The dashboard page and its vendored libraries, built once per process."""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._page = None
+        self._assets = {}
+
+    def page(self):
+        if self._page is None:
+            self.build()
+        return self._page
+
+    def asset(self, name):
+        self.page()
+        return self._assets.get(name)
+
+    def build(self):
+        with self._lock:
+            if self._page is not None:
+                return
+            urls = {}
+            for name, cdn_url in VENDOR_ASSETS.items():
+                path = os.path.join(self.static_dir, 'vendor', name)
+                try:
+                    with open(path, 'rb') as f:
+                        body = f.read()
+                except OSError:
+                    app.logger.warning(f"{path} is missing, the dashboard will load {cdn_url}")
+                    urls[name] = cdn_url
+                    continue
+                content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                static = StaticAsset(body, f'{content_type}; charset=utf-8', IMMUTABLE_CACHE_CONTROL)
+                self._assets[name] = static
+                urls[name] = f'/assets/{static.digest}/{name}'
+            html = app.jinja_env.from_string(HTML_TEMPLATE).render(assets=urls)
+            self._page = StaticAsset(html.encode('utf-8'), 'text/html; charset=utf-8',
+                                     PAGE_CACHE_CONTROL)
+
+class UpstreamPool:
+    """Bounded pool of keep-alive connections to llama-server."""
+
+    def __init__(self, base_url, timeout, size):
+        self._client = LlamaServerClient(base_url, timeout)
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._client._connect(), False
+
+    def clear(self):
+        """Close idle connections, e.g. to a server that was restarted."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def release(self, conn, reusable=True):
+        if reusable:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(conn)
+                    return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        # A pooled connection may have been closed by the server while idle;
+        # retry once on a fresh one before giving up.
+        for attempt in (0, 1):
+            conn, reused = self.acquire()
+            try:
+                conn.request(method, self._client.prefix + path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if not reused or attempt:
+                    raise
+            except Exception:
+                conn.close()
+                raise
+
+def cpu_groups(count):
+    """Split this process's CPUs into count groups, keeping SMT siblings together."""
+    cpus = sorted(os.sched_getaffinity(0))
+    if count <= 0 or len(cpus) < count:
+        return [None] * max(count, 0)
+
+    def topology(cpu):
+        base = f'/sys/devices/system/cpu/cpu{cpu}/topology/'
+        package = read_int(base + 'physical_package_id')
+        core = read_int(base + 'core_id')
+        # Core 0 is a real id; only a missing file falls back to the CPU number.
+        return (0 if package is None else package, cpu if core is None else core, cpu)
+
+    cpus.sort(key=topology)
+    return [cpus[i * len(cpus) // count:(i + 1) * len(cpus) // count] for i in range(count)]
+
+def format_cpus(cpus):
+    """Compact list notation for a CPU set, e.g. 0-3,8-11."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(a) if a == b else f'{a}-{b}' for a, b in ranges)
+
+def _worker_preexec(cpus):
+    # Runs in the child between fork and exec: pin it, and have the kernel
+    # stop it if the monitor dies without cleaning up.
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    try:
+        ctypes.CDLL(None).prctl(1, signal.SIGTERM)  # PR_SET_PDEATHSIG
+    except (AttributeError, OSError):
+        pass
+
+class LlamaWorker:
+    """One llama-server the chat proxy routes to, started by us when command is set."""
+
+    def __init__(self, index, url, command=None, cpus=None):
+        self.index = index
+        self.url = url
+        self.command = command
+        self.cpus = cpus
+        self.client = LlamaServerClient(url, LLAMA_SERVER_TIMEOUT)
+        self.pool = UpstreamPool(url, CHAT_UPSTREAM_TIMEOUT, CHAT_POOL_SIZE)
+        self.process = None
+        self._exited = None
+        self.state = 'starting'
+        self.warm = False
+        self.outstanding = 0
+        self.served = 0
+        self.errors = 0
+        self.restarts = 0
+        self.failures = 0
+        self.crashes = 0
+        self.started = None
+        self.next_start = 0.0
+        self.last_error = None
+        self.ttft_avg = None
+        self.duration_avg = None
+        self.ttft = Histogram((0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+        self.duration = Histogram((0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+    @property
+    def healthy(self):
+        return self.state == 'healthy'
+
+    def pid(self):
+        process = self.process
+        return process.pid if process is not None and process.poll() is None else None
+
+    def spawn(self):
+        port = urllib.parse.urlsplit(self.url).port
+        argv = shlex.split(self.command.format(
+            port=port, index=self.index, threads=len(self.cpus) if self.cpus else os.cpu_count()))
+        argv += shlex.split(LLAMA_WORKER_ARGS)
+        if self.process is not None:
+            self.restarts += 1
+        app.logger.info(f"Starting llama-server worker {self.index} on port {port}"
+                        + (f", CPUs {format_cpus(self.cpus)}" if self.cpus else ""))
+        self.state = 'starting'
+        self.warm = False
+        self.failures = 0
+        self.started = time.monotonic()
+        try:
+            self.process = subprocess.Popen(argv, stdin=subprocess.DEVNULL,
+                                            preexec_fn=lambda: _worker_preexec(self.cpus))
+        except OSError as e:
+            self.process = None
+            self._crashed(f"failed to start: {str(e)}")
+
+    def _crashed(self, reason):
+        self.state = 'unhealthy'
+        self.last_error = reason
+        self.crashes += 1
+        self.next_start = time.monotonic() + min(LLAMA_WORKER_MAX_BACKOFF, 2 ** (self.crashes - 1))
+        app.logger.error(f"Error in llama-server worker {self.index}: {reason}")
+
+    def terminate(self, timeout=5.0):
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def supervise(self):
+        """One health check, restarting a managed worker that died or hangs."""
+        now = time.monotonic()
+        if self.command is not None and (self.process is None or self.process.poll() is not None):
+            if self.process is not None and self._exited is not self.process:
+                self._exited = self.process
+                self._crashed(f"exited with status {self.process.returncode}")
+            if now < self.next_start:
+                return
+            self.spawn()
+            if self.process is None:
+                return
+        try:
+            status, _ = self.client.get('/health')
+        except (OSError, http.client.HTTPException):
+            status = None
+        if status == 200:
+            if not self.healthy:
+                app.logger.info(f"llama-server worker {self.index} is healthy")
+                # New or restarted servers start with a cold cache, and any
+                # pooled connections went to the old process.
+                self.warm = False
+                self.pool.clear()
+            self.state = 'healthy'
+            self.failures = 0
+            self.crashes = 0
+            return
+        self.failures += 1
+        if self.state == 'starting' and (self.command is None
+                                         or now - self.started < LLAMA_WORKER_START_TIMEOUT):
+            # Still loading the model (llama-server answers 503 meanwhile).
+            return
+        if self.state != 'unhealthy':
+            app.logger.warning(f"llama-server worker {self.index} is unhealthy (status {status})")
+        self.state = 'unhealthy'
+        self.last_error = f"health check returned {status}" if status else "unreachable"
+        if self.command is not None and self.failures >= LLAMA_WORKER_MAX_FAILURES:
+            self._exited = self.process
+            self._crashed(f"{self.failures} failed health checks, restarting")
+            self.terminate()
+
+    def finished(self, timer, outcome, now):
+        # Called once per routed request, from ChatTimer.finish().
+        self.outstanding -= 1
+        self.served += 1
+        if outcome.startswith(('upstream', 'http')):
+            self.errors += 1
+            return
+        if timer.first_token is not None:
+            ttft = timer.first_token - timer.started
+            self.ttft.observe(ttft)
+            self.ttft_avg = ttft if self.ttft_avg is None else self.ttft_avg + 0.2 * (ttft - self.ttft_avg)
+        duration = now - timer.started
+        self.duration.observe(duration)
+        self.duration_avg = (duration if self.duration_avg is None
+                             else self.duration_avg + 0.2 * (duration - self.duration_avg))
+
+    def describe(self):
+        return {
+            'state': self.state,
+            'url': self.url,
+            'pid': self.process.pid if self.process is not None else None,
+            'cpus': format_cpus(self.cpus) if self.cpus else None,
+            'warm': self.warm,
+            'outstanding': self.outstanding,
+            'served': self.served,
+            'errors': self.errors,
+            'restarts': self.restarts,
+            'ttft': round(self.ttft_avg, 3) if self.ttft_avg is not None else None,
+            'duration': round(self.duration_avg, 3) if self.duration_avg is not None else None,
+            'last_error': self.last_error,
+        }
+
+class LlamaWorkers:
+    """Supervises llama-server workers and picks one for each chat request.
+
+    Requests go to the healthy worker with the fewest outstanding requests;
+    a chat session stays on its worker while that is healthy, so its prompt
+    cache keeps being reused. With count 0 the pool is the one server at
+    LLAMA_SERVER_URL, which is health-checked but not managed.
+    """
+
+    def __init__(self, count, command, base_port, pin=LLAMA_WORKER_PIN):
+        if count > 0:
+            groups = cpu_groups(count) if pin else [None] * count
+            self.workers = [LlamaWorker(i, f'http://127.0.0.1:{base_port + i}', command, groups[i])
+                            for i in range(count)]
+        else:
+            self.workers = [LlamaWorker(0, LLAMA_SERVER_URL)]
+        self.managed = count > 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='llama-workers', daemon=True)
+            self._thread.start()
+        if self.managed:
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopping:
+            for worker in self.workers:
+                try:
+                    worker.supervise()
+                except Exception as e:
+                    app.logger.error(f"Error in llama-server worker {worker.index}: {str(e)}")
+                if self._stopping:
+                    return
+            time.sleep(LLAMA_WORKER_HEALTH_INTERVAL)
+
+    def stop(self):
+        self._stopping = True
+        for worker in self.workers:
+            if worker.command is not None:
+                worker.terminate()
+                worker.state = 'stopped'
+
+    def healthy(self):
+        return [worker for worker in self.workers if worker.healthy]
+
+    def pick(self, preferred=None):
+        """Worker for the next request; preferred (an index) wins while healthy."""
+        with self._lock:
+            candidates = self.healthy() or self.workers
+            if preferred is not None and 0 <= preferred < len(self.workers):
+                worker = self.workers[preferred]
+                if worker in candidates:
+                    return worker
+            # Least outstanding requests; ties go to the one that served fewest.
+            return min(candidates, key=lambda w: (w.outstanding, w.served))
+
+    def dispatch(self, worker):
+        with self._lock:
+            worker.outstanding += 1
+
+    def release(self, worker, timer, outcome, now):
+        with self._lock:
+            worker.finished(timer, outcome, now)
+
+    def status(self):
+        return {str(worker.index): worker.describe() for worker in self.workers}
+
+    def write(self, writer):
+        labelled = [({'worker': str(worker.index)}, worker) for worker in self.workers]
+        writer.family('llama_worker_up', 'gauge', 'Whether the llama-server worker passes health checks.',
+                      [(labels, int(worker.healthy)) for labels, worker in labelled])
+        writer.family('llama_worker_outstanding_requests', 'gauge',
+                      'Chat requests routed to the worker and not yet finished.',
+                      [(labels, worker.outstanding) for labels, worker in labelled])
+        writer.family('llama_worker_requests_total', 'counter', 'Chat requests routed to the worker.',
+                      [(labels, worker.served) for labels, worker in labelled])
+        writer.family('llama_worker_errors_total', 'counter',
+                      'Routed chat requests that failed upstream.',
+                      [(labels, worker.errors) for labels, worker in labelled])
+        writer.family('llama_worker_restarts_total', 'counter', 'Times the worker was restarted.',
+                      [(labels, worker.restarts) for labels, worker in labelled])
+        writer.header('llama_worker_time_to_first_token_seconds', 'histogram',
+                      'Time to first token of chat requests, per worker.')
+        for labels, worker in labelled:
+            worker.ttft.write_samples(writer, 'llama_worker_time_to_first_token_seconds', labels)
+        writer.header('llama_worker_request_duration_seconds', 'histogram',
+                      'Duration of chat requests, per worker.')
+        for labels, worker in labelled:
+            worker.duration.write_samples(writer, 'llama_worker_request_duration_seconds', labels)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def write(self, writer, name, help_text, labels=None):
+        writer.header(name, 'histogram', help_text)
+        self.write_samples(writer, name, labels)
+
+    def write_samples(self, writer, name, labels=None):
+        labels = labels or {}
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            writer.sample(name + '_bucket', cumulative, {**labels, 'le': format_value(float(bound))})
+        writer.sample(name + '_sum', total, labels)
+        writer.sample(name + '_count', cumulative, labels)
+
+class ChatStats:
+    """Latency histograms and outcome counters for proxied chat requests."""
+
+    def __init__(self):
+        self.ttft = Histogram((0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+        self.itl = Histogram((0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+        self.duration = Histogram((0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+        self.tokens_per_second = Histogram((1, 2, 5, 10, 20, 50, 100, 200, 500))
+        self._outcomes = {}
+        self._prompt_tokens = {'evaluated': 0, 'reused': 0}
+        self._lock = threading.Lock()
+
+    def count(self, outcome):
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def prompt(self, evaluated, reused):
+        with self._lock:
+            self._prompt_tokens['evaluated'] += evaluated or 0
+            self._prompt_tokens['reused'] += reused or 0
+
+    def write(self, writer):
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            prompt_tokens = dict(self._prompt_tokens)
+        writer.family('chat_requests_total', 'counter', 'Chat requests by outcome.',
+                      [({'outcome': k}, v) for k, v in sorted(outcomes.items())])
+        writer.family('chat_prompt_tokens_total', 'counter',
+                      'Prompt tokens llama-server evaluated vs. reused from its prompt cache.',
+                      [({'kind': k}, v) for k, v in sorted(prompt_tokens.items())])
+        self.ttft.write(writer, 'chat_time_to_first_token_seconds',
+                        'Time from request to the first generated token.')
+        self.itl.write(writer, 'chat_inter_token_latency_seconds',
+                       'Gap between consecutive streamed tokens.')
+        self.duration.write(writer, 'chat_request_duration_seconds',
+                            'Total time to serve a chat request.')
+        self.tokens_per_second.write(writer, 'chat_generation_tokens_per_second',
+                                     'Generation speed per request after the first token.')
+
+class ChatTimer:
+    """Times one proxied request from the SSE chunks that pass through."""
+
+    def __init__(self, streaming, keep_content=False):
+        self.streaming = streaming
+        self.started = time.monotonic()
+        self.first_token = None
+        self.last_token = None
+        self.tokens = 0
+        # Generated text, collected only when a session needs the reply.
+        self.content = [] if keep_content else None
+        self.timings = None
+        self.usage = None
+        self.on_finish = None
+        # The llama-server worker serving the request, released on finish.
+        self.worker = None
+        self._pending = b''
+        self._finished = False
+
+    def feed(self, chunk):
+        # Chunks can end mid-line; only complete lines are parsed.
+        lines = (self._pending + chunk).split(b'\n')
+        self._pending = lines.pop()
+        arrived = 0
+        for line in lines:
+            if not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip()
+            if not data or data == b'[DONE]':
+                continue
+            try:
+                event = json.loads(data)
+                # llama-server puts timings and usage on the last chunk, whose
+                # choices may be empty.
+                self.timings = event.get('timings') or self.timings
+                self.usage = event.get('usage') or self.usage
+                choices = event.get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+            except (ValueError, AttributeError, TypeError):
+                continue
+            if content:
+                arrived += 1
+                if self.content is not None:
+                    self.content.append(content)
+        if arrived:
+            self.token(time.monotonic(), arrived)
+
+    def token(self, now, count=1):
+        """Record count tokens (SSE events) that arrived in one read at now."""
+        if self.first_token is None:
+            self.first_token = now
+            chat_stats.ttft.observe(now - self.started)
+            # Tokens that came with the first one carry no gap to measure.
+        else:
+            # Share the gap since the last read among the events in this one,
+            # rather than timing all but one of them at zero.
+            gap = (now - self.last_token) / count
+            for _ in range(count):
+                chat_stats.itl.observe(gap)
+        self.last_token = now
+        self.tokens += count
+
+    def finish_response(self, status, data):
+        if status == 200:
+            try:
+                result = json.loads(data)
+                self.usage = result.get('usage')
+                self.timings = result.get('timings')
+                self.tokens = (self.usage or {}).get('completion_tokens', 0)
+                if self.content is not None:
+                    self.content.append(result['choices'][0]['message']['content'] or '')
+            except (ValueError, AttributeError, KeyError, IndexError, TypeError):
+                pass
+        self.finish('ok' if status == 200 else f'http_{status}')
+
+    def prompt_tokens(self):
+        """(evaluated, reused) prompt tokens from llama-server's timings, if reported."""
+        timings = self.timings or {}
+        evaluated = timings.get('prompt_n')
+        if evaluated is None:
+            return None, None
+        reused = timings.get('cache_n')
+        if reused is None and self.usage and self.usage.get('prompt_tokens') is not None:
+            # Older servers report only the total.
+            reused = max(0, self.usage['prompt_tokens'] - evaluated)
+        return evaluated, reused
+
+    def finish(self, outcome='ok'):
+        if self._finished:
+            return
+        self._finished = True
+        now = time.monotonic()
+        if self.worker is not None:
+            llama_workers.release(self.worker, self, outcome, now)
+        chat_stats.count(outcome)
+        chat_stats.prompt(*self.prompt_tokens())
+        if self.on_finish is not None:
+            try:
+                self.on_finish(self, outcome)
+            except Exception as e:
+                app.logger.error(f"Error finishing chat request: {str(e)}")
+        if outcome.startswith(('upstream', 'http')):
+            return
+        chat_stats.duration.observe(now - self.started)
+        if self.streaming and self.tokens > 1 and self.last_token > self.first_token:
+            chat_stats.tokens_per_second.observe((self.tokens - 1) / (self.last_token - self.first_token))
+        elif self.tokens and now > self.started:
+            # Not streamed, or streamed in a single read.
+            chat_stats.tokens_per_second.observe(self.tokens / (now - self.started))
+
+def relay_stream(conn, response, timer, pool, cache_key=None, content_type=None):
+    """Forward upstream SSE bytes as they arrive, timing tokens on the way."""
+    reusable = False
+    outcome = 'aborted'
+    recorded = [] if cache_key is not None else None
+    recorded_bytes = 0
+    try:
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            timer.feed(chunk)
+            if recorded is not None:
+                recorded.append(chunk)
+                recorded_bytes += len(chunk)
+                if recorded_bytes > response_cache.max_entry_bytes:
+                    recorded = None
+            yield chunk
+        reusable = not response.will_close
+        outcome = 'ok'
+        if recorded is not None:
+            response_cache.put(cache_key, content_type, recorded)
+    except (OSError, http.client.HTTPException) as e:
+        app.logger.error(f"Error relaying chat stream: {str(e)}")
+        outcome = 'upstream_error'
+    finally:
+        # An unfinished response cannot be reused; closing it also tells
+        # llama-server to stop generating for a client that went away.
+        pool.release(conn, reusable)
+        timer.finish(outcome)
+
+def message_chars(message):
+    content = message.get('content')
+    return len(content) if isinstance(content, str) else len(json.dumps(content or ''))
+
+class ChatSession:
+    """One conversation: system prompt, history and the slot holding its cache."""
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.system = None
+        self.history = []
+        self.worker = None
+        self.slot = None
+        self.busy = False
+        self.pending = []
+        self.prompt_chars = 0
+        self.chars_per_token = 4.0
+        self.truncations = 0
+        self.turns = collections.deque(maxlen=50)
+        self.last_used = time.monotonic()
+
+    def prompt(self, turn):
+        return ([self.system] if self.system else []) + self.history + turn
+
+    def estimate(self, messages):
+        return sum(message_chars(m) / self.chars_per_token + CHAT_MESSAGE_OVERHEAD for m in messages)
+
+    def describe(self, include_history=False):
+        info = {
+            'id': self.id,
+            'worker': self.worker,
+            'slot': self.slot,
+            'messages': len(self.history),
+            'estimated_tokens': round(self.estimate(self.prompt([]))),
+            'truncations': self.truncations,
+            'prompt_evaluated': sum(t['prompt_evaluated'] or 0 for t in self.turns),
+            'prompt_reused': sum(t['prompt_reused'] or 0 for t in self.turns),
+            'turns': list(self.turns),
+        }
+        if include_history:
+            info['history'] = self.prompt([])
+        return info
+
+class ChatSessions:
+    """Server-side conversation histories for the chat proxy.
+
+    The client sends only new messages with a session_id; the proxy sends
+    llama-server the stored history plus those messages, with cache_prompt
+    and the session's id_slot, so only the new suffix has to be evaluated.
+    Slots are per worker, and a session sticks to the worker holding its cache.
+    """
+
+    def __init__(self, budget, ttl, max_sessions, slots=CHAT_SLOTS):
+        self.budget = budget
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.configured_slots = slots
+        self._sessions = collections.OrderedDict()
+        self._slot_owner = {}
+        self._slot_used = {}
+        self._lock = threading.Lock()
+
+    def _slots(self):
+        if self.configured_slots > 0:
+            return self.configured_slots
+        return (inference.latest() or {}).get('slots_total') or 0
+
+    def _expire(self, now):
+        # Least recently used first. A busy session is passed over, not a
+        # reason to stop: idle sessions behind it may still be due.
+        for session in list(self._sessions.values()):
+            if len(self._sessions) <= self.max_sessions and now - session.last_used < self.ttl:
+                break
+            if not session.busy:
+                self._drop(session)
+
+    def _drop(self, session):
+        del self._sessions[session.id]
+        key = (session.worker, session.slot)
+        if session.slot is not None and self._slot_owner.get(key) == session.id:
+            del self._slot_owner[key]
+
+    def _assign_slot(self, session, now):
+        session.worker = llama_workers.pick(session.worker).index
+        slots = self._slots()
+        if not slots:
+            return None
+        worker, slot = session.worker, session.slot
+        if slot is None or slot >= slots or self._slot_owner.get((worker, slot)) != session.id:
+            # Take the worker's least recently used slot; its owner loses the
+            # cached prefix.
+            slot = min(range(slots), key=lambda s: self._slot_used.get((worker, s), 0.0))
+            previous = self._sessions.get(self._slot_owner.get((worker, slot)))
+            if previous is not None and previous.worker == worker:
+                previous.slot = None
+            self._slot_owner[(worker, slot)] = session.id
+            session.slot = slot
+        self._slot_used[(worker, slot)] = now
+        return slot
+
+    def _trim(self, session, turn):
+        history = session.history
+        fixed = session.estimate(([session.system] if session.system else []) + turn)
+        if fixed + session.estimate(history) <= self.budget:
+            return
+        remaining = session.estimate(history)
+        target = self.budget * CHAT_SESSION_TRIM_TO - fixed
+        drop = 0
+        while drop < len(history) and remaining > target:
+            remaining -= session.estimate([history[drop]])
+            drop += 1
+        # Never start the history on an assistant reply.
+        while drop < len(history) and history[drop].get('role') != 'user':
+            drop += 1
+        del history[:drop]
+        session.truncations += 1
+
+    def begin(self, session_id, payload):
+        """(session, upstream payload), or (None, None) if a turn is already running."""
+        messages = [m for m in payload.get('messages') or [] if isinstance(m, dict)]
+        system = [m for m in messages if m.get('role') == 'system']
+        turn = [m for m in messages if m.get('role') != 'system']
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession(session_id)
+            if session.busy:
+                return None, None
+            session.busy = True
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            if system:
+                session.system = system[-1] if system[-1].get('content') else None
+            self._trim(session, turn)
+            slot = self._assign_slot(session, now)
+            session.pending = turn
+            prompt = session.prompt(turn)
+        session.prompt_chars = sum(message_chars(m) for m in prompt)
+        upstream = {**payload, 'messages': prompt, 'cache_prompt': True}
+        if slot is not None:
+            upstream['id_slot'] = slot
+        return session, upstream
+
+    def complete(self, session, timer, outcome):
+        evaluated, reused = timer.prompt_tokens()
+        with self._lock:
+            session.busy = False
+            session.last_used = time.monotonic()
+            if outcome == 'ok' and timer.content is not None:
+                # A failed turn leaves the history as it was, so a retry sees
+                # the same prefix.
+                session.history.extend(session.pending)
+                session.history.append({'role': 'assistant', 'content': ''.join(timer.content)})
+                if evaluated is not None and evaluated + (reused or 0) > 0:
+                    ratio = session.prompt_chars / (evaluated + (reused or 0))
+                    session.chars_per_token = min(8.0, max(1.0, ratio))
+            session.pending = []
+            session.turns.append({
+                'at': round(time.time(), 3),
+                'outcome': outcome,
+                'worker': session.worker,
+                'slot': session.slot,
+                'prompt_evaluated': evaluated,
+                'prompt_reused': reused,
+                'completion_tokens': timer.tokens,
+            })
+
+    def abort(self, session):
+        with self._lock:
+            session.busy = False
+            session.pending = []
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.describe(include_history=True) if session else None
+
+    def delete(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            self._drop(session)
+            return True
+
+    def write(self, writer):
+        with self._lock:
+            count = len(self._sessions)
+            truncations = sum(session.truncations for session in self._sessions.values())
+        writer.family('chat_sessions', 'gauge', 'Conversations held by the chat proxy.', count)
+        writer.family('chat_session_truncations', 'gauge',
+                      'History truncations across live conversations.', truncations)
+
+class ResponseCache:
+    """LRU + TTL cache of complete upstream responses, bounded in bytes."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 8
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def key(self, payload):
+        """Cache key for a deterministic request, otherwise None."""
+        if self.max_bytes <= 0 or not isinstance(payload, dict):
+            return None
+        seed = payload.get('seed')
+        if payload.get('temperature') != 0 and (seed is None or seed == -1):
+            return None
+        normalized = {k: v for k, v in payload.items() if k not in CHAT_CACHE_IGNORED_FIELDS}
+        messages = normalized.get('messages')
+        if isinstance(messages, list):
+            normalized['messages'] = [
+                {**m, 'content': m['content'].strip()}
+                if isinstance(m, dict) and isinstance(m.get('content'), str) else m
+                for m in messages]
+        canonical = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+        # Streaming and plain responses are stored in their own format.
+        kind = 'stream' if payload.get('stream') else 'json'
+        return kind + ':' + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, content_type, chunks):
+        size = sum(len(c) for c in chunks)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, content_type, tuple(chunks), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def write(self, writer):
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+            entries, size = len(self._entries), self._bytes
+        writer.family('chat_cache_requests_total', 'counter', 'Cacheable chat requests by result.',
+                      [({'result': 'hit'}, hits), ({'result': 'miss'}, misses)])
+        writer.family('chat_cache_evictions_total', 'counter',
+                      'Entries evicted to stay under the size limit.', evictions)
+        writer.family('chat_cache_entries', 'gauge', 'Cached chat responses.', entries)
+        writer.family('chat_cache_bytes', 'gauge', 'Bytes held by the chat cache.', size)
+
+class AdmissionTicket:
+    def __init__(self, client):
+        self.client = client
+        self.event = threading.Event()
+        self.granted = False
+        self.rejected = None
+        self.retry_after = None
+        self.queued = time.monotonic()
+        self.started = None
+
+class AdmissionController:
+    """Caps concurrent chat requests and queues the rest fairly per client.
+
+    Waiting clients are served round-robin, so one client sending a burst
+    cannot starve the others. A full queue is rejected at once (429), and a
+    request that cannot start before its deadline gets a 503.
+    """
+
+    def __init__(self, limit, queue_size, timeout):
+        self.configured_limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._waiting = 0
+        self._queues = collections.OrderedDict()
+        self._service_time = 1.0
+        self.rejections = {'queue_full': 0, 'deadline': 0}
+        self.admitted = 0
+        self.wait_time = Histogram((0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30))
+
+    def limit(self):
+        if self.configured_limit > 0:
+            return self.configured_limit
+        # Every worker runs the same configuration as the one inference polls.
+        result = inference.latest() or {}
+        return max(1, (result.get('slots_total') or 1) * max(1, len(llama_workers.healthy())))
+
+    def retry_after(self):
+        # Rough time for the current backlog to drain.
+        backlog = (self._waiting + 1) / self.limit()
+        return max(1, math.ceil(self._service_time * backlog))
+
+    def acquire(self, client, timeout=None):
+        ticket = AdmissionTicket(client)
+        with self._lock:
+            self._dispatch()
+            if self._inflight < self.limit() and not self._waiting:
+                self._grant(ticket)
+            elif self._waiting >= self.queue_size:
+                return self._reject(ticket, 'queue_full')
+            else:
+                self._queues.setdefault(client, collections.deque()).append(ticket)
+                self._waiting += 1
+        if not ticket.granted:
+            ticket.event.wait(self.timeout if timeout is None else max(0.0, timeout))
+            with self._lock:
+                if not ticket.granted:
+                    queue = self._queues.get(client)
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[client]
+                    self._waiting -= 1
+                    return self._reject(ticket, 'deadline')
+        self.wait_time.observe(ticket.started - ticket.queued)
+        return ticket
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.started is None:
+                return
+            elapsed = time.monotonic() - ticket.started
+            self._service_time += 0.2 * (elapsed - self._service_time)
+            ticket.started = None
+            self._inflight -= 1
+            self._dispatch()
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        self._inflight += 1
+        self.admitted += 1
+        ticket.event.set()
+
+    def _reject(self, ticket, reason):
+        ticket.rejected = reason
+        ticket.retry_after = self.retry_after()
+        self.rejections[reason] += 1
+        return ticket
+
+    def _dispatch(self):
+        limit = self.limit()
+        while self._waiting and self._inflight < limit:
+            # Take the head of the least recently served client's queue.
+            client, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self._waiting -= 1
+            self._grant(ticket)
+
+    def status(self):
+        with self._lock:
+            return {
+                'limit': self.limit(),
+                'inflight': self._inflight,
+                'queued': self._waiting,
+                'queued_clients': len(self._queues),
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejections['queue_full'],
+                'rejected_deadline': self.rejections['deadline'],
+            }
+
+    def write(self, writer):
+        status = self.status()
+        writer.family('chat_admission_limit', 'gauge',
+                      'Concurrent chat requests allowed through to llama-server.', status['limit'])
+        writer.family('chat_inflight_requests', 'gauge',
+                      'Chat requests currently being served.', status['inflight'])
+        writer.family('chat_queue_depth', 'gauge', 'Chat requests waiting for a slot.',
+                      status['queued'])
+        writer.family('chat_admitted_total', 'counter', 'Chat requests let through.',
+                      status['admitted'])
+        writer.family('chat_rejections_total', 'counter', 'Chat requests turned away.',
+                      [({'reason': 'queue_full'}, status['rejected_queue_full']),
+                       ({'reason': 'deadline'}, status['rejected_deadline'])])
+        self.wait_time.write(writer, 'chat_queue_wait_seconds',
+                             'Time admitted chat requests spent queued.')
+
+def flatten_metrics(info, prefix=''):
+    """Map the numeric leaves of a get_system_info() dict to dotted names."""
+    flat = {}
+    for key, value in info.items():
+        if key in ('seq', 'timestamp') and not prefix:
+            continue
+        name = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+class TimeSeriesStore:
+    """Fixed-capacity ring of samples with one float32 array per metric.
+
+    Memory is at most capacity * (8 + 4 * max_metrics) bytes regardless of
+    uptime: new interfaces or disks cannot grow it without limit. Metrics
+    that first appear later are back-filled with NaN.
+    """
+
+    def __init__(self, capacity, max_metrics=HISTORY_MAX_METRICS):
+        self.capacity = max(1, int(capacity))
+        self.max_metrics = max_metrics
+        self._lock = threading.Lock()
+        self._times = array('d', bytes(8 * self.capacity))
+        self._columns = {}
+        self._skipped = set()
+        self._head = 0
+        self._count = 0
+
+    def append(self, timestamp, values):
+        with self._lock:
+            slot = self._head
+            self._times[slot] = timestamp
+            written = 0
+            for name, value in values.items():
+                column = self._columns.get(name)
+                if column is None:
+                    column = self._new_column(name)
+                    if column is None:
+                        continue
+                    self._columns[name] = column
+                column[slot] = value
+                written += 1
+            if written != len(self._columns):
+                for name, column in self._columns.items():
+                    if name not in values:
+                        column[slot] = math.nan
+            self._head = (slot + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _new_column(self, name):
+        if len(self._columns) >= self.max_metrics:
+            self._skip(name)
+            return None
+        return array('f', [math.nan]) * self.capacity
+
+    def _skip(self, name):
+        if name not in self._skipped:
+            self._skipped.add(name)
+            app.logger.warning(f"History has no room for {name}, not recording it")
+
+    def flush(self):
+        pass
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._columns)
+
+    def _slot(self, i):
+        # Logical index 0 is the oldest retained sample.
+        return (self._head - self._count + i) % self.capacity
+
+    def query(self, metric, since=None, step=None):
+        with self._lock:
+            column = self._columns[metric]
+            count = self._count
+            if count == 0:
+                return []
+            times = self._times
+            slot = self._slot
+            start = 0
+            if since is not None:
+                start = bisect.bisect_left(range(count), since, key=lambda i: times[slot(i)])
+            if start >= count:
+                return []
+            first, last = times[slot(start)], times[slot(count - 1)]
+            if step is None:
+                step = max((last - first) / HISTORY_MAX_POINTS, SAMPLE_INTERVAL)
+            buckets = []
+            bucket_key = None
+            for i in range(start, count):
+                s = slot(i)
+                value = column[s]
+                if value != value:
+                    continue
+                key = times[s] // step
+                if key != bucket_key:
+                    bucket_key = key
+                    lo = hi = total = value
+                    n = 1
+                    buckets.append([key * step, lo, hi, total, n])
+                    continue
+                bucket = buckets[-1]
+                if value < bucket[1]:
+                    bucket[1] = value
+                if value > bucket[2]:
+                    bucket[2] = value
+                bucket[3] += value
+                bucket[4] += 1
+        return [{'t': t, 'min': round(lo, 3), 'max': round(hi, 3), 'avg': round(total / n, 3)}
+                for t, lo, hi, total, n in buckets]
+
+class MappedTimeSeriesStore(TimeSeriesStore):
+    """TimeSeriesStore kept in a preallocated, memory-mapped circular file.
+
+    Layout (little-endian): a header with magic, version, capacity, metric
+    slots and the ring cursor; a table of NUL-padded metric names; then
+    capacity fixed-size records of one float64 timestamp followed by one
+    float32 per metric slot. Columns are strided memoryviews over the map,
+    so appends write in place and queries read without copying.
+    """
+
+    MAGIC = b'SMONHIST'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIIII')  # magic, version, capacity, metric slots, name size
+    CURSOR = struct.Struct('<QQ')  # head, count
+    CURSOR_OFFSET = 32
+    NAMES_OFFSET = 64
+    NAME_SIZE = 64
+
+    def __init__(self, path, capacity, max_metrics=HISTORY_MAX_METRICS):
+        # Records must stay 8-byte aligned for the float64 timestamp view.
+        super().__init__(capacity, max_metrics + max_metrics % 2)
+        self.path = path
+        self._record_floats = 2 + self.max_metrics
+        names_end = self.NAMES_OFFSET + self.max_metrics * self.NAME_SIZE
+        self._data_offset = -(-names_end // mmap.PAGESIZE) * mmap.PAGESIZE
+        size = self._data_offset + self.capacity * 4 * self._record_floats
+        self._last_flush = time.monotonic()
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # One writer per file: another monitor (or a bench run) sharing
+            # HISTORY_DIR must not interleave records with ours.
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            raise OSError(e.errno, f"{path} is in use by another process") from e
+        try:
+            fresh = not self._compatible(fd)
+            if fresh:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                if hasattr(os, 'posix_fallocate'):
+                    # Fail now rather than with SIGBUS on a full disk later.
+                    os.posix_fallocate(fd, 0, size)
+            self._map = mmap.mmap(fd, size)
+        except Exception:
+            os.close(fd)
+            raise
+        # Kept open for the lifetime of the store, since closing it drops the lock.
+        self._fd = fd
+        records = memoryview(self._map)[self._data_offset:]
+        self._floats = records.cast('f')
+        self._times = records.cast('d')[::self._record_floats // 2]
+        if fresh:
+            self.HEADER.pack_into(self._map, 0, self.MAGIC, self.VERSION, self.capacity,
+                                  self.max_metrics, self.NAME_SIZE)
+            self._write_cursor()
+        else:
+            self._load()
+
+    def _compatible(self, fd):
+        header = os.pread(fd, self.HEADER.size, 0)
+        if len(header) < self.HEADER.size:
+            return False
+        expected = (self.MAGIC, self.VERSION, self.capacity, self.max_metrics, self.NAME_SIZE)
+        if self.HEADER.unpack(header) != expected:
+            app.logger.warning(f"{self.path} has a different format or size, starting a new history")
+            return False
+        return True
+
+    def _load(self):
+        head, count = self.CURSOR.unpack_from(self._map, self.CURSOR_OFFSET)
+        if head >= self.capacity or count > self.capacity:
+            app.logger.warning(f"{self.path} has a corrupt cursor, starting a new history")
+            head = count = 0
+        self._head, self._count = head, count
+        for index in range(self.max_metrics):
+            offset = self.NAMES_OFFSET + index * self.NAME_SIZE
+            name = self._map[offset:offset + self.NAME_SIZE].rstrip(b'\0')
+            if not name:
+                break
+            self._columns[name.decode('utf-8')] = self._column(index)
+        app.logger.info(f"Loaded {count} samples of {len(self._columns)} metrics from {self.path}")
+
+    def _column(self, index):
+        return self._floats[2 + index::self._record_floats]
+
+    def _new_column(self, name):
+        index = len(self._columns)
+        encoded = name.encode('utf-8')
+        if index >= self.max_metrics or len(encoded) > self.NAME_SIZE:
+            self._skip(name)
+            return None
+        column = self._column(index)
+        # The slot may hold values from a metric of an older file layout.
+        column[:] = array('f', [math.nan]) * self.capacity
+        offset = self.NAMES_OFFSET + index * self.NAME_SIZE
+        self._map[offset:offset + len(encoded)] = encoded
+        return column
+
+    def _write_cursor(self):
+        self.CURSOR.pack_into(self._map, self.CURSOR_OFFSET, self._head, self._count)
+
+    def append(self, timestamp, values):
+        super().append(timestamp, values)
+        with self._lock:
+            # The record is complete before the cursor makes it visible.
+            self._write_cursor()
+            if time.monotonic() - self._last_flush >= HISTORY_FLUSH_INTERVAL:
+                self._last_flush = time.monotonic()
+                self._map.flush()
+
+    def flush(self):
+        with self._lock:
+            self._map.flush()
+
+def open_history(capacity):
+    """The history store: file-backed under HISTORY_DIR, else in memory."""
+    if HISTORY_DIR:
+        path = os.path.join(HISTORY_DIR, 'history.bin')
+        try:
+            os.makedirs(HISTORY_DIR, exist_ok=True)
+            return MappedTimeSeriesStore(path, capacity)
+        except OSError as e:
+            app.logger.error(f"Error opening {path}, keeping history in memory: {str(e)}")
+    return TimeSeriesStore(capacity)
+
+def diff_info(previous, current):
+    """Nested dict of the leaves that changed; removed keys map to None."""
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff_info(old, value)
+            if nested:
+                delta[key] = nested
+        elif value != old or key not in previous:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+    return delta
+
+def flatten_values(values, prefix=''):
+    """Like flatten_metrics, but keeps every leaf, including strings and lists."""
+    flat = {}
+    for key, value in values.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_values(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+def compact_sample(info, raw):
+    """Flat view of a sample for /data?since=: raw byte counts, no static facts."""
+    native = ('memory', 'disk', 'network', 'cpu_load', 'model_cache', 'container', 'seq', 'timestamp')
+    flat = flatten_values({k: v for k, v in info.items()
+                           if k not in STATIC_FIELDS and k not in native})
+    # Totals never change and are served by /info.
+    for section in ('memory', 'disk'):
+        flat.update(flatten_values({k: v for k, v in raw[section].items() if k != 'total'},
+                                   section + '.'))
+    flat.update(flatten_values(raw['network'], 'network.'))
+    flat.update(flatten_values(info['network']['interfaces'], 'network.interfaces.'))
+    flat['cpu_load'] = list(raw['load'])
+    if raw['model_cache'] is not None:
+        flat.update(flatten_values(raw['model_cache'], 'model_cache.'))
+    if raw['cgroup'] is not None:
+        flat.update(flatten_values(raw['cgroup'], 'container.'))
+    return flat
+
+class DataDeltas:
+    """Recent compact samples by seq, so /data?since= sends only what changed.
+
+    Clients pass back the cursor, <epoch>:<seq>. seq restarts with the
+    process, so the random per-process epoch tells a cursor from before a
+    restart apart from a current one. Each (since, latest) body is encoded
+    once and shared until the next sample.
+    """
+
+    def __init__(self, depth):
+        self.epoch = os.urandom(4).hex()
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=max(1, depth))
+        self._bodies = {}
+
+    def append(self, info, raw):
+        flat = compact_sample(info, raw)
+        with self._lock:
+            self._samples.append((info['seq'], info['timestamp'], flat))
+            self._bodies = {}
+
+    def _base(self, since):
+        epoch, _, since = since.rpartition(':')
+        if epoch != self.epoch or not since.isdigit():
+            return None
+        since = int(since)
+        first_seq = self._samples[0][0]
+        index = since - first_seq
+        if 0 <= index < len(self._samples) and self._samples[index][0] == since:
+            return self._samples[index][2]
+        return None
+
+    def body(self, since):
+        with self._lock:
+            seq, timestamp, current = self._samples[-1]
+            base = self._base(since)
+            key = since if base is not None else None
+            body = self._bodies.get(key)
+            if body is not None:
+                return body
+            payload = {'cursor': f'{self.epoch}:{seq}', 'seq': seq, 'timestamp': timestamp}
+            if base is None:
+                # Unknown, expired or another process's cursor: resend everything.
+                payload.update(full=True, changed=current, removed=[])
+            else:
+                payload['since'] = since
+                payload['changed'] = {k: v for k, v in current.items()
+                                      if k not in base or base[k] != v}
+                payload['removed'] = [k for k in base if k not in current]
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            self._bodies[key] = body
+            return body
+
+def format_event(event, payload, event_id=None):
+    lines = f"event: {event}\n"
+    if event_id is not None:
+        lines += f"id: {event_id}\n"
+    return f"{lines}data: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+class StreamHub:
+    """Fans sampler output out to /stream clients.
+
+    Each sample is diffed and encoded once; clients that kept up get the
+    shared delta event, clients that fell behind get the shared full one.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._previous = None
+        self._snapshot_event = None
+        self._delta_event = None
+        self._closed = False
+        self._alerts = collections.deque(maxlen=ALERT_HISTORY)
+        self._alert_seq = 0
+        self.clients = 0
+
+    def publish_alert(self, event):
+        with self._cond:
+            self._alert_seq += 1
+            self._alerts.append((self._alert_seq, format_event('alert', event)))
+            self._cond.notify_all()
+
+    def publish(self, info, raw=None):
+        dynamic = {k: v for k, v in info.items() if k not in STATIC_FIELDS}
+        delta = diff_info(self._previous, dynamic) if self._previous is not None else dynamic
+        snapshot_event = format_event('snapshot', dynamic, info['seq'])
+        delta_event = format_event('delta', delta, info['seq'])
+        with self._cond:
+            self._previous = dynamic
+            self._seq = info['seq']
+            self._snapshot_event = snapshot_event
+            self._delta_event = delta_event
+            self._cond.notify_all()
+
+    def close(self):
+        # Ends every subscription so a graceful shutdown is not held open.
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def try_join(self):
+        with self._cond:
+            if self._closed or self.clients >= STREAM_MAX_CLIENTS:
+                return False
+            self.clients += 1
+            return True
+
+    def leave(self):
+        with self._cond:
+            self.clients -= 1
+
+    def subscribe(self):
+        yield format_event('static', get_static_info())
+        last_seq = None
+        with self._cond:
+            # Only alerts raised after connecting; /alerts has the current set.
+            last_alert = self._alert_seq
+        while True:
+            with self._cond:
+                ready = self._cond.wait_for(
+                    lambda: self._closed or self._alert_seq != last_alert
+                    or (self._seq != last_seq and self._seq),
+                    timeout=STREAM_KEEPALIVE)
+                if self._closed:
+                    return
+                events = [event for seq, event in self._alerts if seq > last_alert]
+                last_alert = self._alert_seq
+                if not ready:
+                    events.append(': keepalive\n\n')
+                elif self._seq and self._seq != last_seq:
+                    if last_seq is not None and self._seq == last_seq + 1:
+                        events.append(self._delta_event)
+                    else:
+                        events.append(self._snapshot_event)
+                last_seq = self._seq or None
+            yield ''.join(events)
+
+class AlertRule:
+    """A threshold on one metric with constant-size state.
+
+    The value can be turned into a per-second rate and/or smoothed with an
+    EWMA before it is compared. The rule fires once the condition has held
+    for `for` seconds and resolves when the value crosses back over `clear`
+    (hysteresis, defaults to `threshold`). It notifies once per episode,
+    or again every `repeat` seconds while still firing.
+    """
+
+    OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            raise ValueError("each rule must be a mapping")
+        unknown = set(spec) - {'name', 'metric', 'op', 'threshold', 'clear', 'for', 'rate',
+                               'ewma', 'repeat', 'severity', 'summary'}
+        if unknown:
+            raise ValueError(f"unknown rule fields: {', '.join(sorted(unknown))}")
+        try:
+            self.name = str(spec['name'])
+            self.metric = str(spec['metric'])
+            self.threshold = float(spec['threshold'])
+        except KeyError as e:
+            raise ValueError(f"rule is missing {e}")
+        self.op = spec.get('op', '>')
+        if self.op not in self.OPERATORS:
+            raise ValueError(f"{self.name}: op must be one of {', '.join(self.OPERATORS)}")
+        self.clear = float(spec.get('clear', self.threshold))
+        if self.op in ('>', '>=') and self.clear > self.threshold or \
+                self.op in ('<', '<=') and self.clear < self.threshold:
+            raise ValueError(f"{self.name}: clear must be on the safe side of threshold")
+        self.duration = float(spec.get('for', 0))
+        self.rate = bool(spec.get('rate', False))
+        self.halflife = float(spec['ewma']) if spec.get('ewma') else None
+        self.repeat = float(spec['repeat']) if spec.get('repeat') else None
+        self.severity = str(spec.get('severity', 'warning'))
+        self.summary = spec.get('summary') or (
+            f"{self.metric}{' rate' if self.rate else ''} {self.op} {spec['threshold']}")
+        self.spec = spec
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self._previous = None
+        self._evaluated = None
+        self.pending_since = None
+        self.firing_since = None
+        self._notified = None
+
+    def adopt(self, other):
+        # Keeps a reloaded rule's episode going when its definition did not change.
+        self.__dict__.update({k: v for k, v in other.__dict__.items() if k != 'spec'})
+
+    def _transform(self, timestamp, value):
+        if self.rate:
+            previous = self._previous
+            self._previous = (timestamp, value)
+            if previous is None or timestamp <= previous[0]:
+                return None
+            value = (value - previous[1]) / (timestamp - previous[0])
+        if self.halflife:
+            if self.value is None or self._evaluated is None:
+                smoothed = value
+            else:
+                alpha = 1.0 - 0.5 ** ((timestamp - self._evaluated) / self.halflife)
+                smoothed = self.value + alpha * (value - self.value)
+            value = smoothed
+        self._evaluated = timestamp
+        return value
+
+    def observe(self, timestamp, value):
+        """Feed one sample; returns an alert event when the rule changes state."""
+        if value is None or value != value:
+            return None
+        value = self._transform(timestamp, value)
+        if value is None:
+            return None
+        self.value = value
+        compare = self.OPERATORS[self.op]
+        if self.firing_since is None:
+            if not compare(value, self.threshold):
+                self.pending_since = None
+                return None
+            if self.pending_since is None:
+                self.pending_since = timestamp
+            if timestamp - self.pending_since < self.duration:
+                return None
+            self.firing_since = self._notified = timestamp
+            return self.event('firing', timestamp)
+        if not compare(value, self.clear):
+            event = self.event('resolved', timestamp)
+            self.pending_since = self.firing_since = None
+            return event
+        if self.repeat and timestamp - self._notified >= self.repeat:
+            self._notified = timestamp
+            return self.event('firing', timestamp)
+        return None
+
+    def event(self, state, timestamp):
+        return {
+            'rule': self.name,
+            'state': state,
+            'severity': self.severity,
+            'summary': self.summary,
+            'metric': self.metric,
+            'value': round(self.value, 3),
+            'threshold': self.threshold,
+            'since': self.pending_since,
+            'at': timestamp,
+        }
+
+class AlertManager:
+    """Evaluates the rules file against every sample and delivers alert events.
+
+    The file holds a list of rules, or {"rules": [...]}, each like
+    {"name": "memory_high", "metric": "memory.percent", "op": ">",
+     "threshold": 90, "clear": 85, "for": 60}. Metric names are the ones
+    /history lists. An invalid file is logged and the previous rules kept.
+    """
+
+    def __init__(self, path, webhook=ALERT_WEBHOOK, log_path=ALERT_LOG):
+        self.path = path
+        self.webhook = webhook
+        self.log_path = log_path
+        self.rules = []
+        self.error = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._active = {}
+        self._recent = collections.deque(maxlen=ALERT_HISTORY)
+        self._outbox = queue.Queue(maxsize=1000)
+        self._sender = None
+
+    def _parse(self, text):
+        if self.path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError("PyYAML is not installed; use a .json rules file")
+            document = yaml.safe_load(text)
+        else:
+            document = json.loads(text)
+        if isinstance(document, dict):
+            document = document.get('rules')
+        if document is None:
+            return []
+        if not isinstance(document, list):
+            raise ValueError("rules must be a list")
+        rules = [AlertRule(spec) for spec in document]
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise ValueError("rule names must be unique")
+        return rules
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked < RULES_RELOAD_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            if mtime is None:
+                rules = []
+            else:
+                with open(self.path) as f:
+                    rules = self._parse(f.read())
+        except (OSError, ValueError, TypeError) as e:
+            self.error = f"{self.path}: {str(e)}"
+            app.logger.error(f"Error loading alert rules, keeping the previous ones: {self.error}")
+            return
+        old = {rule.name: rule for rule in self.rules}
+        kept = set()
+        for rule in rules:
+            previous = old.get(rule.name)
+            if previous is not None and previous.spec == rule.spec:
+                rule.adopt(previous)
+                kept.add(rule.name)
+        with self._lock:
+            self.rules = rules
+            self.error = None
+            # Changed or removed rules start over, so their open alerts are dropped.
+            for name in [name for name in self._active if name not in kept]:
+                del self._active[name]
+        app.logger.info(f"Loaded {len(rules)} alert rules from {self.path}")
+
+    def evaluate(self, info, raw=None):
+        self.reload_if_changed()
+        values = flatten_metrics(info)
+        timestamp = info['timestamp']
+        for rule in self.rules:
+            event = rule.observe(timestamp, values.get(rule.metric))
+            if event is not None:
+                self._emit(event)
+
+    def _emit(self, event):
+        app.logger.warning(f"Alert {event['rule']} {event['state']}: {event['summary']} "
+                           f"(value {event['value']})")
+        with self._lock:
+            if event['state'] == 'firing':
+                self._active[event['rule']] = event
+            else:
+                self._active.pop(event['rule'], None)
+            self._recent.append(event)
+        stream_hub.publish_alert(event)
+        if self.webhook or self.log_path:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._deliver, name='alerts', daemon=True)
+                self._sender.start()
+            try:
+                self._outbox.put_nowait(event)
+            except queue.Full:
+                app.logger.error(f"Alert outbox full, dropping {event['rule']} {event['state']}")
+
+    def _deliver(self):
+        # Sinks run here so a slow webhook never delays the sampler.
+        while True:
+            event = self._outbox.get()
+            body = json.dumps(event, separators=(',', ':'))
+            if self.log_path:
+                try:
+                    with open(self.log_path, 'a') as f:
+                        f.write(body + '\n')
+                except OSError as e:
+                    app.logger.error(f"Error writing alert log: {str(e)}")
+            if self.webhook:
+                try:
+                    post = urllib.request.Request(
+                        self.webhook, data=body.encode('utf-8'), method='POST',
+                        headers={'Content-Type': 'application/json'})
+                    with urllib.request.urlopen(post, timeout=5) as response:
+                        response.read()
+                except Exception as e:
+                    app.logger.error(f"Error posting alert webhook: {str(e)}")
+
+    def status(self):
+        with self._lock:
+            return {
+                'active': list(self._active.values()),
+                'recent': list(self._recent),
+                'rules': [{'name': rule.name, 'summary': rule.summary, 'severity': rule.severity,
+                           'value': None if rule.value is None else round(rule.value, 3),
+                           'state': 'firing' if rule.firing_since is not None
+                           else 'pending' if rule.pending_since is not None else 'ok'}
+                          for rule in self.rules],
+                'error': self.error,
+            }
+
+    def write(self, writer):
+        with self._lock:
+            rules = list(self.rules)
+        writer.family('monitor_alert_firing', 'gauge', 'Whether each alert rule is firing.',
+                      [({'rule': rule.name, 'severity': rule.severity},
+                        int(rule.firing_since is not None)) for rule in rules])
+
+class PerfRecorder:
+    """Latency of routes, sampler collectors and listeners, for /debug/perf.
+
+    Nothing is timed until install() wraps the hot paths, so a monitor
+    without MONITOR_DEBUG_PERF runs exactly the uninstrumented code.
+    """
+
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+               0.1, 0.25, 0.5, 1, 2.5, 10)
+    KINDS = {
+        'route': ('monitor_request_duration_seconds', 'endpoint',
+                  'Time from request to response headers, per Flask endpoint.'),
+        'collector': ('monitor_collector_duration_seconds', 'collector',
+                      'Time spent in each sampler reader.'),
+        'listener': ('monitor_listener_duration_seconds', 'listener',
+                     'Time spent in each sampler listener.'),
+    }
+
+    def __init__(self):
+        self.installed = False
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, name, seconds):
+        series = self._series.get((kind, name))
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(
+                    (kind, name), (Histogram(self.BUCKETS), collections.deque(maxlen=PERF_RECENT)))
+        series[0].observe(seconds)
+        series[1].append(seconds)
+
+    def timed(self, kind, name, func):
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            started = perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.observe(kind, name, perf_counter() - started)
+        return wrapper
+
+    def install(self):
+        if self.installed:
+            return
+        self.installed = True
+        sampler.collectors = tuple((key, self.timed('collector', key, read))
+                                   for key, read in sampler.collectors)
+        sampler._listeners = [self.timed('listener', getattr(callback, '__qualname__', repr(callback)),
+                                         callback)
+                              for callback in sampler._listeners]
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        metrics_providers.append(self.write)
+
+    def _before_request(self):
+        request.environ['monitor.perf_started'] = time.perf_counter()
+
+    def _after_request(self, response):
+        started = request.environ.get('monitor.perf_started')
+        if started is not None:
+            self.observe('route', request.endpoint or 'unmatched', time.perf_counter() - started)
+        return response
+
+    def summary(self):
+        with self._lock:
+            series = list(self._series.items())
+        result = {kind: {} for kind in self.KINDS}
+        for (kind, name), (histogram, recent) in sorted(series):
+            values = [v * 1000 for v in list(recent)]
+            result[kind][name] = {
+                'count': sum(histogram._counts),
+                'total_seconds': round(histogram._sum, 3),
+                'recent_ms': {**percentiles(values), 'max': round(max(values), 4)} if values else None,
+            }
+        return result
+
+    def write(self, writer):
+        with self._lock:
+            series = sorted(self._series.items())
+        for kind, (name, label, help_text) in self.KINDS.items():
+            matching = [(key[1], histogram) for key, (histogram, _) in series if key[0] == kind]
+            if not matching:
+                continue
+            writer.header(name, 'histogram', help_text)
+            for value, histogram in matching:
+                histogram.write_samples(writer, name, {label: value})
+
+def _native_threads():
+    """start_new_thread, get_ident and sleep as the OS provides them, even under gevent."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        import _thread
+        return _thread.start_new_thread, _thread.get_ident, time.sleep
+    return (monkey.get_original('_thread', 'start_new_thread'),
+            monkey.get_original('_thread', 'get_ident'),
+            monkey.get_original('time', 'sleep'))
+
+class StackProfiler:
+    """Time-boxed sampling profiler that reports collapsed stacks.
+
+    A native OS thread snapshots every thread's stack at a fixed interval.
+    Under gevent all greenlets share the main thread, so its stack is
+    whichever greenlet was running, or the hub while idle. The output is
+    the folded format flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self):
+        self._start_thread, self._get_ident, self._sleep = _native_threads()
+        self.main_ident = self._get_ident()
+        self.running = False
+        self.last = None
+        self._lock = threading.Lock()
+
+    def profile(self, seconds, interval):
+        """Counter of 'thread;outer;...;inner' stacks, or None if a profile is running."""
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+        try:
+            job = {'stacks': collections.Counter(), 'samples': 0, 'done': False}
+            self._start_thread(self._sample, (job, seconds, interval))
+            while not job['done']:
+                # Cooperative under gevent; the sampler is a real thread either way.
+                time.sleep(0.05)
+            self.last = {'at': round(time.time(), 3), 'seconds': seconds,
+                         'interval': interval, 'samples': job['samples']}
+            return job
+        finally:
+            self.running = False
+
+    def _sample(self, job, seconds, interval):
+        try:
+            me = self._get_ident()
+            deadline = time.monotonic() + seconds
+            stacks = job['stacks']
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names.setdefault(self.main_ident, 'MainThread')
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f'thread-{ident}'))
+                    stacks[';'.join(reversed(stack))] += 1
+                job['samples'] += 1
+                self._sleep(interval)
+        except Exception as e:
+            app.logger.error(f"Error in profiler: {str(e)}")
+        finally:
+            job['done'] = True
+
+class Sampler:
+    """Collects get_system_info() on a fixed interval into a shared snapshot."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._seq = 0
+        self._thread = None
+        self._listeners = []
+        self.collectors = COLLECTORS
+
+    def add_listener(self, callback):
+        # Called on the sampler thread as callback(info, raw) for every sample.
+        self._listeners.append(callback)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='sampler', daemon=True)
+        # Prime the CPU counters so the first real sample covers a full interval.
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_times_percent(interval=None, percpu=True)
+        self._thread.start()
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.interval
+            try:
+                self.sample()
+            except Exception as e:
+                app.logger.error(f"Error in sampler: {str(e)}")
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind (suspend, slow disk): resync instead of bursting.
+                next_tick = time.monotonic()
+
+    def sample(self):
+        raw = collect_metrics(self.collectors)
+        info = get_system_info(raw)
+        with self._lock:
+            self._seq += 1
+            info['seq'] = self._seq
+            info['timestamp'] = time.time()
+            self._snapshot = info
+        for callback in self._listeners:
+            try:
+                callback(info, raw)
+            except Exception as e:
+                app.logger.error(f"Error in sampler listener: {str(e)}")
+        return info
+
+    def latest(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # First request before the thread produced anything.
+            self.start()
+            snapshot = self._snapshot or self.sample()
+        result = dict(snapshot)
+        result['sample_age'] = round(max(0.0, time.time() - snapshot['timestamp']), 3)
+        return result
+
+network_rates = CounterRates({
+    'rx_bytes_per_sec': 'bytes_recv',
+    'tx_bytes_per_sec': 'bytes_sent',
+    'rx_packets_per_sec': 'packets_recv',
+    'tx_packets_per_sec': 'packets_sent',
+    'rx_errors_per_sec': 'errin',
+    'tx_errors_per_sec': 'errout',
+    'rx_drops_per_sec': 'dropin',
+    'tx_drops_per_sec': 'dropout',
+})
+disk_rates = CounterRates({
+    'read_bytes_per_sec': 'read_bytes',
+    'write_bytes_per_sec': 'write_bytes',
+    'read_iops': 'read_count',
+    'write_iops': 'write_count',
+})
+cgroup_stats = CgroupStats()
+model_cache = ModelResidency(MODEL_PATH)
+model_prewarmer = ModelPrewarmer(MODEL_PATH, model_cache)
+prewarm_networks = parse_networks(MODEL_PREWARM_ALLOW)
+llama_workers = LlamaWorkers(LLAMA_WORKERS, LLAMA_WORKER_COMMAND, LLAMA_WORKER_BASE_PORT)
+# Any other llama-server on the host would be an arbitrary pick among several.
+llama_process = TrackedProcess(LLAMA_PROCESS_NAME, LLAMA_PIDFILE, MODEL_PATH,
+                               llama_workers.workers[0].pid if llama_workers.managed else None)
+metrics_providers.append(llama_workers.write)
+inference = InferenceCollector(LlamaServerClient(llama_workers.workers[0].url, LLAMA_SERVER_TIMEOUT))
+chat_stats = ChatStats()
+metrics_providers.append(chat_stats.write)
+response_cache = ResponseCache(CHAT_CACHE_MAX_BYTES, CHAT_CACHE_TTL)
+metrics_providers.append(response_cache.write)
+admission = AdmissionController(CHAT_CONCURRENCY, CHAT_QUEUE_SIZE, CHAT_QUEUE_TIMEOUT)
+metrics_providers.append(admission.write)
+chat_sessions = ChatSessions(CHAT_SESSION_TOKEN_BUDGET, CHAT_SESSION_TTL, CHAT_SESSION_MAX)
+metrics_providers.append(chat_sessions.write)
+readiness = Readiness()
+metrics_providers.append(readiness.write)
+sampler = Sampler()
+perf = PerfRecorder()
+profiler = StackProfiler()
+perf_networks = parse_networks(DEBUG_PERF_ALLOW)
+# In memory until serve() opens the history file, so bench and helper
+# subcommands never touch the live one.
+history = TimeSeriesStore(HISTORY_HOURS * 3600 / SAMPLE_INTERVAL)
+
+def record_history(info, raw):
+    history.append(info['timestamp'], flatten_metrics(info))
+
+sampler.add_listener(record_history)
+core_history = CoreHistory(CORE_HISTORY_MINUTES * 60 / SAMPLE_INTERVAL)
+
+def record_core_history(info, raw):
+    core_history.append(info['timestamp'], raw['core_times'])
+
+sampler.add_listener(record_core_history)
+stream_hub = StreamHub()
+alerts = AlertManager(RULES_FILE)
+metrics_providers.append(alerts.write)
+sampler.add_listener(alerts.evaluate)
+sampler.add_listener(stream_hub.publish)
+exposition = MetricsExposition()
+sampler.add_listener(exposition.update)
+data_deltas = DataDeltas(DATA_DELTA_DEPTH)
+sampler.add_listener(data_deltas.append)
+dashboard = Dashboard(STATIC_DIR)
+
+DEFAULT_BENCH_PROMPTS = [
+    "What is the capital of France?",
+    "Explain what a hash table is in two sentences.",
+    "Write a haiku about autumn.",
+    "List three uses for a paperclip.",
+]
+
+def load_prompts(path):
+    """Prompts from a text file (one per line) or JSONL with prompt/messages."""
+    if not path:
+        return [[{'role': 'user', 'content': p}] for p in DEFAULT_BENCH_PROMPTS]
+    prompts = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                prompts.append(item.get('messages') or [{'role': 'user', 'content': item['prompt']}])
+            else:
+                prompts.append([{'role': 'user', 'content': line}])
+    if not prompts:
+        raise ValueError(f"No prompts in {path}")
+    return prompts
+
+def percentiles(values):
+    if not values:
+        return None
+    p50, p90, p99 = np.percentile(np.asarray(values, dtype=float), (50, 90, 99))
+    return {'p50': round(float(p50), 4), 'p90': round(float(p90), 4),
+            'p99': round(float(p99), 4), 'mean': round(float(np.mean(values)), 4)}
+
+class ChatBenchmark:
+    """Drives an OpenAI-style streaming chat endpoint and times each request.
+
+    Closed loop keeps `concurrency` requests in flight back to back. Open
+    loop sends Poisson arrivals at `rate` per second; latency is measured
+    from the scheduled arrival, so queueing behind busy workers counts.
+    """
+
+    def __init__(self, url, prompts, concurrency=1, rate=None, max_tokens=128,
+                 requests=None, duration=None, timeout=300.0):
+        self.url = urllib.parse.urlsplit(url)
+        self.prompts = prompts
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_tokens = max_tokens
+        self.requests = requests
+        self.duration = duration
+        self.timeout = timeout
+        self.results = []
+        self._lock = threading.Lock()
+        self._issued = 0
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.url.hostname, self.url.port, timeout=self.timeout)
+
+    def _next_index(self):
+        # Claims the next request number, or None once the budget is spent.
+        with self._lock:
+            if self.requests is not None and self._issued >= self.requests:
+                return None
+            if self.duration is not None and time.monotonic() >= self._deadline:
+                return None
+            self._issued += 1
+            return self._issued - 1
+
+    def _one(self, conn, index, scheduled):
+        body = json.dumps({
+            'messages': self.prompts[index % len(self.prompts)],
+            'max_tokens': self.max_tokens,
+            'stream': True,
+        })
+        result = {'index': index, 'start': round(scheduled - self._started, 4),
+                  'tokens': 0, 'error': None}
+        token_times = []
+        try:
+            conn.request('POST', self.url.path or '/', body=body,
+                         headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            if response.status != 200:
+                response.read()
+                result['error'] = f'http_{response.status}'
+            else:
+                pending = b''
+                while True:
+                    chunk = response.read1(65536)
+                    if not chunk:
+                        break
+                    lines = (pending + chunk).split(b'\n')
+                    pending = lines.pop()
+                    now = time.monotonic()
+                    for line in lines:
+                        if not line.startswith(b'data:') or line[5:].strip() == b'[DONE]':
+                            continue
+                        try:
+                            delta = json.loads(line[5:])['choices'][0].get('delta') or {}
+                        except (ValueError, KeyError, IndexError, TypeError):
+                            continue
+                        if delta.get('content'):
+                            token_times.append(now)
+        except (OSError, http.client.HTTPException) as e:
+            result['error'] = type(e).__name__
+            conn.close()
+        finished = time.monotonic()
+        result['e2e'] = round(finished - scheduled, 4)
+        result['tokens'] = len(token_times)
+        if token_times:
+            result['ttft'] = round(token_times[0] - scheduled, 4)
+            result['itl'] = [round(b - a, 5) for a, b in zip(token_times, token_times[1:])]
+        if result['error'] is None and not token_times:
+            result['error'] = 'no_tokens'
+        with self._lock:
+            self.results.append(result)
+
+    def _closed_worker(self):
+        conn = self._connect()
+        while True:
+            index = self._next_index()
+            if index is None:
+                break
+            self._one(conn, index, time.monotonic())
+        conn.close()
+
+    def _open_worker(self, arrivals):
+        conn = self._connect()
+        while True:
+            item = arrivals.get()
+            if item is None:
+                break
+            self._one(conn, *item)
+        conn.close()
+
+    def run(self):
+        self._started = time.monotonic()
+        self._deadline = self._started + (self.duration or 0)
+        if self.rate:
+            arrivals = queue.Queue()
+            workers = [threading.Thread(target=self._open_worker, args=(arrivals,), daemon=True)
+                       for _ in range(self.concurrency)]
+            for worker in workers:
+                worker.start()
+            scheduled = time.monotonic()
+            while True:
+                index = self._next_index()
+                if index is None:
+                    break
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                arrivals.put((index, scheduled))
+                scheduled += random.expovariate(self.rate)
+            for _ in workers:
+                arrivals.put(None)
+        else:
+            workers = [threading.Thread(target=self._closed_worker, daemon=True)
+                       for _ in range(self.concurrency)]
+            for worker in workers:
+                worker.start()
+        for worker in workers:
+            worker.join()
+        self.elapsed = time.monotonic() - self._started
+        return self.summary()
+
+    def summary(self):
+        ok = [r for r in self.results if r['error'] is None]
+        errors = {}
+        for r in self.results:
+            if r['error'] is not None:
+                errors[r['error']] = errors.get(r['error'], 0) + 1
+        tokens = sum(r['tokens'] for r in ok)
+        return {
+            'requests': len(self.results),
+            'errors': errors,
+            'error_rate': round(1 - len(ok) / len(self.results), 4) if self.results else None,
+            'elapsed': round(self.elapsed, 3),
+            'requests_per_second': round(len(ok) / self.elapsed, 3) if self.elapsed else None,
+            'tokens_per_second': round(tokens / self.elapsed, 2) if self.elapsed else None,
+            'ttft': percentiles([r['ttft'] for r in ok if 'ttft' in r]),
+            'itl': percentiles([gap for r in ok for gap in r.get('itl', ())]),
+            'e2e': percentiles([r['e2e'] for r in ok]),
+        }
+
+class HostRecorder:
+    """Samples get_system_info() on a thread while a benchmark runs."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bench-host', daemon=True)
+
+    def _run(self):
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_times_percent(interval=None, percpu=True)
+        while True:
+            # Always record one sample at the end, so short runs get one too.
+            stopped = self._stop.wait(self.interval)
+            info = get_system_info()
+            process = info['llama_process'] or {}
+            self.samples.append({
+                'cpu_usage': info['cpu_usage'],
+                'memory_percent': info['memory']['percent'],
+                'llama_cpu_percent': process.get('cpu_percent'),
+                'llama_rss_mb': process.get('rss'),
+            })
+            if stopped:
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        result = {}
+        for key in ('cpu_usage', 'memory_percent', 'llama_cpu_percent', 'llama_rss_mb'):
+            values = [s[key] for s in self.samples if s[key] is not None]
+            if values:
+                result[key] = {'mean': round(float(np.mean(values)), 2),
+                               'max': round(float(np.max(values)), 2)}
+        return result
+
+def run_chat_bench(args):
+    prompts = load_prompts(args.prompts)
+    if args.requests is None and args.duration is None:
+        args.requests = 50
+    bench = ChatBenchmark(args.url, prompts, concurrency=args.concurrency, rate=args.rate,
+                          max_tokens=args.max_tokens, requests=args.requests,
+                          duration=args.duration, timeout=args.timeout)
+    with HostRecorder() as host:
+        summary = bench.run()
+    report = {
+        'config': {k: getattr(args, k) for k in ('url', 'concurrency', 'rate', 'max_tokens',
+                                                  'requests', 'duration', 'prompts')},
+        'mode': 'open' if args.rate else 'closed',
+        'summary': summary,
+        'host': host.summary(),
+        'results': sorted(bench.results, key=lambda r: r['index']),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps({k: report[k] for k in ('mode', 'summary', 'host')}, indent=2, sort_keys=True))
+    return 1 if summary['error_rate'] else 0
+
+class MonitorBenchmark:
+    """Load-tests this monitor's own endpoints in a child server process.
+
+    The server runs as a separate process so its CPU and RSS can be read
+    without counting the simulated clients.
+    """
+
+    def __init__(self, levels, duration, port):
+        self.levels = levels
+        self.duration = duration
+        self.port = port
+        self.child = None
+
+    # Settings whose side effects belong to the production monitor only:
+    # llama-server workers on fixed ports, the shared history file, alert sinks.
+    SCRUBBED_ENV = ('MONITOR_LLAMA_WORKERS', 'MONITOR_HISTORY_DIR', 'MONITOR_ALERT_WEBHOOK',
+                    'MONITOR_ALERT_LOG')
+
+    def child_env(self):
+        env = {k: v for k, v in os.environ.items() if k not in self.SCRUBBED_ENV}
+        env['MONITOR_WARMUP_MAX_TOKENS'] = '0'
+        env['MODEL_PREWARM'] = ''
+        return env
+
+    def __enter__(self):
+        self.child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'serve', '--host', '127.0.0.1',
+             '--port', str(self.port), '--no-debug'],
+            env=self.child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.process = psutil.Process(self.child.pid)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=2)
+                conn.request('GET', '/data')
+                if conn.getresponse().status == 200:
+                    conn.close()
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError('monitor did not start')
+
+    def __exit__(self, *exc):
+        self.child.terminate()
+        try:
+            self.child.wait(10)
+        except subprocess.TimeoutExpired:
+            self.child.kill()
+
+    def _measure(self, run):
+        # Server CPU% over the scenario and its RSS at the end.
+        before = self.process.cpu_times()
+        started = time.monotonic()
+        result = run() or {}
+        elapsed = time.monotonic() - started
+        after = self.process.cpu_times()
+        cpu = (after.user + after.system) - (before.user + before.system)
+        result['server_cpu_percent'] = round(100 * cpu / elapsed, 2)
+        result['server_rss_mb'] = round(self.process.memory_info().rss / 2 ** 20, 1)
+        return result
+
+    def _poll_client(self, path, latencies, stop):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                latencies.append(None)
+                continue
+            latencies.append(time.monotonic() - started)
+        conn.close()
+
+    def _stream_client(self, counts, stop):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.duration + 30)
+        try:
+            conn.request('GET', '/stream')
+            response = conn.getresponse()
+            events = 0
+            while not stop.is_set():
+                line = response.readline()
+                if not line:
+                    break
+                if line.startswith(b'event:'):
+                    events += 1
+            counts.append(events)
+        except (OSError, http.client.HTTPException):
+            counts.append(None)
+        finally:
+            conn.close()
+
+    def _clients(self, target, clients, *args):
+        stop = threading.Event()
+        threads = [threading.Thread(target=target, args=args + (stop,), daemon=True)
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(self.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(self.duration + 30)
+
+    def poll(self, path, clients):
+        latencies = []
+        def run():
+            self._clients(self._poll_client, clients, path, latencies)
+            ok = [v * 1000 for v in latencies if v is not None]
+            return {'requests_per_second': round(len(ok) / self.duration, 1),
+                    'errors': len(latencies) - len(ok),
+                    'latency_ms': percentiles(ok)}
+        return self._measure(run)
+
+    def stream(self, clients):
+        counts = []
+        def run():
+            self._clients(self._stream_client, clients, counts)
+            ok = [c for c in counts if c is not None]
+            return {'errors': len(counts) - len(ok),
+                    'events_per_client': round(float(np.mean(ok)), 1) if ok else 0}
+        return self._measure(run)
+
+    def idle(self):
+        return self._measure(lambda: time.sleep(self.duration))
+
+    def run(self):
+        report = {'idle': self.idle()}
+        for path in ('/data', '/'):
+            for clients in self.levels:
+                report[f'GET {path} x{clients}'] = self.poll(path, clients)
+        for clients in self.levels:
+            report[f'stream x{clients}'] = self.stream(clients)
+        return report
+
+def sampler_tick_cost(ticks=50):
+    """Mean wall time of one full sampler tick (collection plus listeners)."""
+    probe = Sampler()
+    psutil.cpu_percent(interval=None)
+    psutil.cpu_times_percent(interval=None, percpu=True)
+    # The same listener work as production, on private instances: nothing is
+    # written to the history file and alerts reach no webhook or log.
+    store = TimeSeriesStore(HISTORY_HOURS * 3600 / SAMPLE_INTERVAL)
+    cores = CoreHistory(CORE_HISTORY_MINUTES * 60 / SAMPLE_INTERVAL)
+    probe.add_listener(lambda info, raw: store.append(info['timestamp'], flatten_metrics(info)))
+    probe.add_listener(lambda info, raw: cores.append(info['timestamp'], raw['core_times']))
+    probe.add_listener(AlertManager(RULES_FILE, webhook='', log_path='').evaluate)
+    probe.add_listener(StreamHub().publish)
+    probe.add_listener(MetricsExposition().update)
+    probe.add_listener(DataDeltas(DATA_DELTA_DEPTH).append)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        probe.sample()
+    return round((time.perf_counter() - started) / ticks * 1000, 3)
+
+# Baseline metrics compared by selfbench: lower is better for all of them.
+# The committed baseline sits next to this file, wherever selfbench runs from.
+SELFBENCH_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'selfbench-baseline.json')
+SELFBENCH_CHECKS = (('latency_ms', 'p50'), ('latency_ms', 'p99'),
+                    ('server_cpu_percent',), ('server_rss_mb',))
+
+def compare_baseline(report, baseline, tolerance):
+    """Regressions as (metric, baseline, current) beyond tolerance x baseline."""
+    regressions = []
+    def check(name, old, new, floor):
+        # The absolute floor keeps tiny values from failing on noise.
+        if old is not None and new is not None and new > old * tolerance + floor:
+            regressions.append((name, old, new))
+    check('sampler_tick_ms', baseline.get('sampler_tick_ms'), report['sampler_tick_ms'], 1.0)
+    for scenario, old_result in baseline.get('scenarios', {}).items():
+        new_result = report['scenarios'].get(scenario)
+        if new_result is None:
+            continue
+        for path in SELFBENCH_CHECKS:
+            old, new = old_result, new_result
+            for key in path:
+                old = old.get(key) if isinstance(old, dict) else None
+                new = new.get(key) if isinstance(new, dict) else None
+            floor = 5.0 if path[0] == 'server_rss_mb' else 1.0
+            check(f"{scenario} {'.'.join(path)}", old, new, floor)
+    return regressions
+
+def run_selfbench(args):
+    levels = [int(n) for n in args.clients.split(',')]
+    report = {'sampler_tick_ms': sampler_tick_cost(args.ticks)}
+    with MonitorBenchmark(levels, args.duration, args.port) as bench:
+        report['scenarios'] = bench.run()
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline:
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError) as e:
+        # Nothing to compare against is a failure, not a silent pass.
+        print(f"Cannot read baseline {args.baseline}: {str(e)}")
+        return 2
+    regressions = compare_baseline(report, baseline, args.tolerance)
+    for name, old, new in regressions:
+        print(f"REGRESSION {name}: {old} -> {new}")
+    if regressions:
+        return 1
+    print(f"Within {args.tolerance}x of {args.baseline}")
+    return 0
+
+class StubLlamaHandler(http.server.BaseHTTPRequestHandler):
+    """Just enough of llama-server's API to exercise the proxy without a model.
+
+    Streams one token per --token-delay, reports prompt-cache reuse per slot
+    in timings like llama-server does, answers /health with 503 while
+    "loading", and can exit after a number of requests to test restarts.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        stub = self.server
+        if self.path == '/health':
+            if time.monotonic() < stub.ready_at:
+                self._send(503, {'error': {'code': 503, 'message': 'Loading model',
+                                           'type': 'unavailable_error'}})
+            else:
+                self._send(200, {'status': 'ok'})
+        elif self.path == '/slots':
+            with stub.lock:
+                slots = [{'id': i, 'is_processing': i in stub.busy} for i in range(len(stub.prompts))]
+            self._send(200, slots)
+        elif self.path == '/metrics':
+            with stub.lock:
+                text = (f'llamacpp:prompt_tokens_total {stub.prompt_tokens}\n'
+                        f'llamacpp:tokens_predicted_total {stub.predicted_tokens}\n'
+                        f'llamacpp:requests_processing {len(stub.busy)}\n'
+                        'llamacpp:requests_deferred 0\n')
+            self._send(200, text.encode('utf-8'), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': {'code': 404, 'message': 'File Not Found'}})
+
+    def do_POST(self):
+        stub = self.server
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self._send(400, {'error': {'code': 400, 'message': 'Invalid JSON'}})
+            return
+        if self.path not in ('/v1/chat/completions', '/chat/completions'):
+            self._send(404, {'error': {'code': 404, 'message': 'File Not Found'}})
+            return
+        prompt = json.dumps(payload.get('messages') or [])
+        with stub.lock:
+            slot = payload.get('id_slot')
+            if not isinstance(slot, int) or not 0 <= slot < len(stub.prompts):
+                idle = [i for i in range(len(stub.prompts)) if i not in stub.busy]
+                slot = idle[0] if idle else 0
+            cached = stub.prompts[slot] if payload.get('cache_prompt', True) else ''
+            reused = len(os.path.commonprefix([cached, prompt])) // 4
+            stub.prompts[slot] = prompt
+            stub.busy.add(slot)
+        total = max(1, len(prompt) // 4)
+        tokens = [f'[{stub.server_port}]'] + [' token'] * (max(1, payload.get('max_tokens') or stub.tokens) - 1)
+        timings = {'prompt_n': total - reused, 'cache_n': reused, 'predicted_n': len(tokens)}
+        usage = {'prompt_tokens': total, 'completion_tokens': len(tokens),
+                 'total_tokens': total + len(tokens)}
+        try:
+            if not payload.get('stream'):
+                time.sleep(stub.token_delay * len(tokens))
+                self._send(200, {'object': 'chat.completion', 'model': 'stub',
+                                 'choices': [{'index': 0, 'finish_reason': 'length',
+                                              'message': {'role': 'assistant', 'content': ''.join(tokens)}}],
+                                 'usage': usage, 'timings': timings})
+            else:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for token in tokens:
+                    time.sleep(stub.token_delay)
+                    event = {'object': 'chat.completion.chunk', 'model': 'stub',
+                             'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+                    self._chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+                event = {'object': 'chat.completion.chunk', 'model': 'stub',
+                         'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'length'}],
+                         'usage': usage, 'timings': timings}
+                self._chunk(f'data: {json.dumps(event)}\n\ndata: [DONE]\n\n'.encode('utf-8'))
+                self._chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; llama-server stops generating too.
+            self.close_connection = True
+        finally:
+            with stub.lock:
+                stub.busy.discard(slot)
+                stub.prompt_tokens += total - reused
+                stub.predicted_tokens += len(tokens)
+                stub.completions += 1
+                crash = stub.crash_after and stub.completions >= stub.crash_after
+        if crash:
+            app.logger.warning(f"Stub worker on port {stub.server_port} exiting after "
+                               f"{stub.completions} requests")
+            os._exit(1)
+
+def make_stub_server(host, port, slots=2, tokens=16, token_delay=0.02, load_time=0.0, crash_after=0):
+    server = http.server.ThreadingHTTPServer((host, port), StubLlamaHandler)
+    server.daemon_threads = True
+    server.ready_at = time.monotonic() + load_time
+    server.prompts = [''] * slots
+    server.busy = set()
+    server.tokens = tokens
+    server.token_delay = token_delay
+    server.crash_after = crash_after
+    server.prompt_tokens = 0
+    server.predicted_tokens = 0
+    server.completions = 0
+    server.lock = threading.Lock()
+    return server
+
+def run_stub_worker(args):
+    server = make_stub_server(args.host, args.port, args.slots, args.tokens, args.token_delay,
+                              args.load_time, args.crash_after)
+    app.logger.info(f"Stub llama-server on {args.host}:{args.port} ({args.slots} slots)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def main(argv=None):
+    serve_options = argparse.ArgumentParser(add_help=False)
+    serve_options.add_argument('--host', default=os.environ.get('MONITOR_HOST', '0.0.0.0'))
+    serve_options.add_argument('--port', type=int, default=int(os.environ.get('MONITOR_PORT', '5001')))
+    serve_options.add_argument('--server', choices=('gevent', 'werkzeug'),
+                               default=os.environ.get('MONITOR_SERVER', 'gevent'),
+                               help='gevent serves each connection on a greenlet; werkzeug is '
+                                    "Flask's thread-per-connection development server")
+    serve_options.add_argument('--max-connections', type=int,
+                               default=int(os.environ.get('MONITOR_MAX_CONNECTIONS', '1000')),
+                               help='concurrent connections served by gevent')
+    serve_options.add_argument('--drain-timeout', type=float,
+                               default=float(os.environ.get('MONITOR_DRAIN_TIMEOUT', '30')),
+                               help='seconds to let in-flight responses finish on shutdown')
+    serve_options.add_argument('--debug', action=argparse.BooleanOptionalAction,
+                               default=os.environ.get('MONITOR_DEBUG', '') == '1',
+                               help='Flask debugger and reloader (implies --server werkzeug)')
+    parser = argparse.ArgumentParser(description='System monitor and chat UI for llama-server.',
+                                     parents=[serve_options])
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('serve', help='run the monitor web app (default)', parents=[serve_options])
+    bench = commands.add_parser('bench-cores', help='measure the per-tick cost of per-core CPU stats')
+    bench.add_argument('--cores', type=int, default=128, help='synthetic core count')
+    bench.add_argument('--ticks', type=int, default=5000, help='samples to aggregate')
+    chat = commands.add_parser('bench', help='load-test an OpenAI-style chat completions endpoint')
+    chat.add_argument('--url', default='http://127.0.0.1:5001/v1/chat/completions')
+    chat.add_argument('--concurrency', type=int, default=1, help='parallel connections')
+    chat.add_argument('--rate', type=float,
+                      help='open loop: Poisson arrivals per second (default: closed loop)')
+    chat.add_argument('--requests', type=int, help='total requests (default 50)')
+    chat.add_argument('--duration', type=float, help='stop issuing requests after N seconds')
+    chat.add_argument('--prompts', help='text file with one prompt per line, or JSONL')
+    chat.add_argument('--max-tokens', type=int, default=128)
+    chat.add_argument('--timeout', type=float, default=300.0, help='per-read timeout in seconds')
+    chat.add_argument('--output', help='write the full JSON report here')
+    selfbench = commands.add_parser('selfbench', help="benchmark the monitor's own endpoints")
+    selfbench.add_argument('--clients', default='1,10,100',
+                           help='comma-separated concurrent client counts')
+    selfbench.add_argument('--duration', type=float, default=5.0, help='seconds per scenario')
+    selfbench.add_argument('--port', type=int, default=15001, help='port for the server under test')
+    selfbench.add_argument('--ticks', type=int, default=50,
+                           help='sampler ticks to time for sampler_tick_ms')
+    selfbench.add_argument('--baseline', default=SELFBENCH_BASELINE,
+                           help="baseline JSON to compare against (or write); '' skips the check")
+    selfbench.add_argument('--save-baseline', action='store_true',
+                           help='store this run as the new baseline')
+    selfbench.add_argument('--tolerance', type=float, default=1.5,
+                           help='fail when a metric exceeds baseline x tolerance')
+    stub = commands.add_parser('stub-worker',
+                               help='fake llama-server for testing routing and worker supervision')
+    stub.add_argument('--host', default='127.0.0.1')
+    stub.add_argument('--port', type=int, default=8081)
+    stub.add_argument('--slots', type=int, default=2)
+    stub.add_argument('--tokens', type=int, default=16, help='tokens per reply without max_tokens')
+    stub.add_argument('--token-delay', type=float, default=0.02, help='seconds per streamed token')
+    stub.add_argument('--load-time', type=float, default=0.0,
+                      help='seconds /health reports the model as loading')
+    stub.add_argument('--crash-after', type=int, default=0,
+                      help='exit after this many completions (0: never)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench-cores':
+        bench_cores(args.cores, args.ticks)
+        return 0
+    if args.command == 'bench':
+        return run_chat_bench(args)
+    if args.command == 'selfbench':
+        return run_selfbench(args)
+    if args.command == 'stub-worker':
+        return run_stub_worker(args)
+    return serve(args)
+
+def serve(args):
+    global history
+    history = open_history(HISTORY_HOURS * 3600 / SAMPLE_INTERVAL)
+    if DEBUG_PERF:
+        perf.install()
+        app.logger.warning(f"/debug/perf is enabled for {DEBUG_PERF_ALLOW}")
+    dashboard.build()
+    if MODEL_PREWARM:
+        model_prewarmer.start(MODEL_PREWARM)
+    llama_workers.start()
+    inference.start()
+    sampler.start()
+    readiness.start()
+    if args.debug or args.server == 'werkzeug':
+        app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
+        return 0
+    try:
+        import gevent
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+    except ImportError:
+        app.logger.warning("gevent is not installed; falling back to the werkzeug server")
+        app.run(host=args.host, port=args.port, threaded=True)
+        return 0
+
+    class MonitorServer(WSGIServer):
+        def handle(self, sock, address):
+            # pywsgi sends the headers and the body in separate writes; with
+            # Nagle on, the body then waits for a delayed ACK (~40 ms) on
+            # every keep-alive request after the first.
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            super().handle(sock, address)
+
+    server = MonitorServer((args.host, args.port), app, spawn=Pool(args.max_connections),
+                           log=None, error_log=app.logger)
+
+    def shutdown():
+        app.logger.info(f"Shutting down, draining for up to {args.drain_timeout}s")
+        # Dashboard streams never end on their own; chat streams get to finish.
+        stream_hub.close()
+        server.stop(timeout=args.drain_timeout)
+        llama_workers.stop()
+        history.flush()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        gevent.signal_handler(signum, lambda: gevent.spawn(shutdown))
+    app.logger.info(f"Serving on {args.host}:{args.port} with gevent "
+                    f"(max {args.max_connections} connections)")
+    server.serve_forever()
+    return 0
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeLlamaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        route = self.server.routes.get(self.path, (404, b'{}'))
+        if route is None:
+            # Drop the connection without answering.
+            self.close_connection = True
+            return
+        status, body = route
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def fake_llama():
+    """llama-server look-alike whose GET routes map path -> (status, body) or None."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeLlamaHandler)
+    server.daemon_threads = True
+    server.routes = {}
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_llama():
+    """Start in-process stub-worker servers: stub_llama(**make_stub_server options)."""
+    import system_monitor as sm
+
+    servers = []
+
+    def start(**options):
+        server = sm.make_stub_server('127.0.0.1', 0, **options)
+        server.url = f'http://127.0.0.1:{server.server_port}'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def chat_upstream(monkeypatch):
+    """Send the chat proxy's requests to a stub server: chat_upstream(stub)."""
+    import system_monitor as sm
+
+    def route(stub):
+        workers = sm.LlamaWorkers(0, None, 0)
+        workers.workers = [sm.LlamaWorker(0, stub.url)]
+        workers.workers[0].supervise()
+        monkeypatch.setattr(sm, 'llama_workers', workers)
+
+    return route
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+import system_monitor as sm
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def proxy(stub_llama, chat_upstream, monkeypatch):
+    stub = stub_llama(tokens=4, token_delay=0)
+    chat_upstream(stub)
+    monkeypatch.setattr(sm, 'response_cache', sm.ResponseCache(0, 0))
+
+    def setup(limit, queue_size, timeout):
+        admission = sm.AdmissionController(limit, queue_size, timeout)
+        monkeypatch.setattr(sm, 'admission', admission)
+        return admission
+
+    return setup, sm.app.test_client()
+
+
+def ask(client, stream=False, headers=None):
+    return client.post('/v1/chat/completions', headers=headers or {}, json={
+        'messages': [{'role': 'user', 'content': 'hi'}], 'max_tokens': 4, 'stream': stream})
+
+
+def test_full_queue_gets_429_with_retry_after(proxy):
+    setup, client = proxy
+    admission = setup(1, 1, 5)
+    held = admission.acquire('other')
+    waiter = threading.Thread(target=lambda: admission.release(admission.acquire('other')))
+    waiter.start()
+    wait_until(lambda: admission.status()['queued'] == 1)
+
+    response = ask(client)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['error']['message'] == 'Server busy (queue full)'
+    admission.release(held)
+    waiter.join(5)
+    assert admission.status()['rejected_queue_full'] == 1
+
+
+def test_queue_deadline_gets_503_with_retry_after(proxy):
+    setup, client = proxy
+    admission = setup(1, 8, 30)
+    held = admission.acquire('other')
+    started = time.monotonic()
+    response = ask(client, headers={'X-Queue-Timeout': '0.1'})
+    assert response.status_code == 503
+    assert time.monotonic() - started < 5
+    assert int(response.headers['Retry-After']) >= 1
+    status = admission.status()
+    assert (status['inflight'], status['queued'], status['rejected_deadline']) == (1, 0, 1)
+    admission.release(held)
+    assert ask(client).status_code == 200
+
+
+def test_clients_are_served_round_robin():
+    admission = sm.AdmissionController(1, 16, 5)
+    held = admission.acquire('setup')
+    order = []
+    threads = []
+
+    def request(client, n):
+        ticket = admission.acquire(client)
+        order.append(f'{client}{n}')
+        admission.release(ticket)
+
+    # A burst from one client queued ahead of a single request from another.
+    for client, n in (('a', 1), ('a', 2), ('a', 3), ('b', 1)):
+        queued = admission.status()['queued']
+        threads.append(threading.Thread(target=request, args=(client, n)))
+        threads[-1].start()
+        wait_until(lambda: admission.status()['queued'] == queued + 1)
+    admission.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == ['a1', 'b1', 'a2', 'a3']
+
+
+def test_unread_stream_releases_its_ticket_on_close(proxy):
+    setup, client = proxy
+    admission = setup(1, 4, 5)
+    response = ask(client, stream=True)
+    assert response.status_code == 200
+    assert admission.status()['inflight'] == 1
+    # The client goes away without reading the body.
+    response.close()
+    assert admission.status()['inflight'] == 0
+    assert sm.llama_workers.workers[0].outstanding == 0
+    assert ask(client).status_code == 200
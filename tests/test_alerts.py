@@ -0,0 +1,145 @@
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import system_monitor as sm
+
+
+def rule(**spec):
+    return sm.AlertRule({'name': 'r', 'metric': 'm', 'threshold': 90, **spec})
+
+
+def feed(alert, samples):
+    return [(t, event['state']) for t, value in samples
+            for event in [alert.observe(t, value)] if event is not None]
+
+
+def test_for_duration_must_hold_continuously():
+    alert = rule(**{'for': 30})
+    events = feed(alert, [(0, 95), (20, 95), (25, 80), (30, 95), (50, 95), (60, 95)])
+    # The dip at t=25 restarts the pending period, so it fires at 60, not 30.
+    assert events == [(60, 'firing')]
+    assert alert.event('firing', 60)['since'] == 30
+
+
+def test_clear_level_adds_hysteresis():
+    alert = rule(clear=85)
+    events = feed(alert, [(0, 91), (1, 88), (2, 92), (3, 86), (4, 84), (5, 89), (6, 91)])
+    assert events == [(0, 'firing'), (4, 'resolved'), (6, 'firing')]
+
+
+def test_ewma_smooths_out_a_single_spike():
+    alert = rule(ewma=10)
+    events = feed(alert, [(0, 50), (10, 100)])
+    assert alert.value == pytest.approx(75.0)  # half way after one half-life
+    assert events == []
+    events = feed(alert, [(20, 100), (30, 100)])
+    assert alert.value == pytest.approx(93.75)
+    assert events == [(30, 'firing')]
+
+
+def test_rate_and_repeat():
+    alert = rule(metric='errors', threshold=1, rate=True, repeat=10)
+    events = feed(alert, [(0, 0), (1, 5), (6, 20), (11, 40), (12, 40)])
+    assert events == [(1, 'firing'), (11, 'firing'), (12, 'resolved')]
+
+
+def test_invalid_rules_are_rejected():
+    for spec in ({'name': 'x', 'metric': 'm'}, {'name': 'x', 'metric': 'm', 'threshold': 1, 'op': '!'},
+                 {'name': 'x', 'metric': 'm', 'threshold': 90, 'clear': 95},
+                 {'name': 'x', 'metric': 'm', 'threshold': 1, 'bogus': 1}):
+        with pytest.raises(ValueError):
+            sm.AlertRule(spec)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(sm, 'RULES_RELOAD_INTERVAL', 0)
+    path = tmp_path / 'rules.yaml'
+
+    def write(text):
+        path.write_text(text)
+        # Make sure the reload sees a new mtime even within one clock tick.
+        stamp = time.time_ns() + write.bumps * 10 ** 9
+        write.bumps += 1
+        os.utime(path, ns=(stamp, stamp))
+
+    write.bumps = 1
+    return sm.AlertManager(str(path), webhook='', log_path=''), write
+
+
+def sample(t, percent):
+    return {'timestamp': t, 'memory': {'percent': percent}}
+
+
+def test_reload_keeps_unchanged_rules_and_survives_bad_files(manager):
+    alerts, write = manager
+    write('rules:\n'
+          '  - {name: memory_high, metric: memory.percent, threshold: 90, for: 10}\n'
+          '  - {name: memory_full, metric: memory.percent, threshold: 99}\n')
+    alerts.evaluate(sample(0, 95))
+    assert {r['name']: r['state'] for r in alerts.status()['rules']} == {
+        'memory_high': 'pending', 'memory_full': 'ok'}
+
+    # memory_high is unchanged and keeps its pending period.
+    write('rules:\n'
+          '  - {name: memory_high, metric: memory.percent, threshold: 90, for: 10}\n'
+          '  - {name: memory_full, metric: memory.percent, threshold: 98}\n')
+    alerts.evaluate(sample(10, 95))
+    assert [a['rule'] for a in alerts.status()['active']] == ['memory_high']
+
+    write('rules: [{name: broken}]\n')
+    alerts.evaluate(sample(11, 95))
+    status = alerts.status()
+    assert 'missing' in status['error']
+    assert [r['name'] for r in status['rules']] == ['memory_high', 'memory_full']
+
+    # A changed rule starts over and its open alert is dropped.
+    write('rules:\n  - {name: memory_high, metric: memory.percent, threshold: 80, for: 10}\n')
+    alerts.evaluate(sample(12, 95))
+    status = alerts.status()
+    assert status['error'] is None
+    assert status['active'] == []
+    assert status['rules'][0]['state'] == 'pending'
+
+
+class WebhookHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.headers['Content-Type'], json.loads(body)))
+        self.send_response(204)
+        self.end_headers()
+
+
+def test_events_go_to_the_webhook_and_log(tmp_path, monkeypatch):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        path = tmp_path / 'rules.json'
+        path.write_text(json.dumps([{'name': 'memory_high', 'metric': 'memory.percent',
+                                     'threshold': 90, 'severity': 'critical'}]))
+        log = tmp_path / 'alerts.log'
+        alerts = sm.AlertManager(str(path), webhook=f'http://127.0.0.1:{server.server_port}/hook',
+                                 log_path=str(log))
+        for t, percent in ((0, 50), (1, 95), (2, 50)):
+            alerts.evaluate(sample(t, percent))
+        deadline = time.monotonic() + 5
+        while len(server.received) < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert [(ctype, event['state'], event['severity']) for ctype, event in server.received] == [
+            ('application/json', 'firing', 'critical'), ('application/json', 'resolved', 'critical')]
+        logged = [json.loads(line) for line in log.read_text().splitlines()]
+        assert [event['state'] for event in logged] == ['firing', 'resolved']
+        assert [event['state'] for event in alerts.status()['recent']] == ['firing', 'resolved']
+    finally:
+        server.shutdown()
+        server.server_close()
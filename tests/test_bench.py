@@ -0,0 +1,50 @@
+import json
+import time
+
+import pytest
+
+import system_monitor as sm
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_bench_reports_latency_and_throughput(stub_llama, tmp_path, capsys):
+    stub = stub_llama(slots=2, token_delay=0.02)
+    output = tmp_path / 'report.json'
+    status = sm.main(['bench', '--url', f'{stub.url}/v1/chat/completions', '--requests', '6',
+                      '--concurrency', '2', '--max-tokens', '5', '--output', str(output)])
+    assert status == 0
+    printed = json.loads(capsys.readouterr().out)
+    report = json.loads(output.read_text())
+    assert printed['summary'] == report['summary']
+    assert printed['mode'] == 'closed'
+
+    summary = report['summary']
+    assert summary['requests'] == 6 and summary['errors'] == {}
+    assert summary['error_rate'] == 0
+    # The stub waits token_delay before each of the 5 tokens.
+    assert 0.02 <= summary['ttft']['p50'] < 0.5
+    assert 0.015 <= summary['itl']['p50'] < 0.5
+    assert summary['e2e']['p50'] >= 0.1
+    assert summary['tokens_per_second'] == pytest.approx(30 / summary['elapsed'], rel=0.01)
+    assert summary['requests_per_second'] == pytest.approx(6 / summary['elapsed'], rel=0.01)
+    assert [r['tokens'] for r in report['results']] == [5] * 6
+    assert all(len(r['itl']) == 4 for r in report['results'])
+    # The stub counts a request after the client already has the response.
+    wait_until(lambda: stub.completions == 6)
+
+
+def test_bench_open_loop_counts_errors(stub_llama, capsys):
+    stub = stub_llama()
+    status = sm.main(['bench', '--url', f'{stub.url}/missing', '--requests', '3', '--rate', '50',
+                      '--max-tokens', '2'])
+    assert status == 1
+    summary = json.loads(capsys.readouterr().out)['summary']
+    assert summary['errors'] == {'http_404': 3}
+    assert summary['error_rate'] == 1.0
+    assert summary['ttft'] is None
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+import system_monitor as sm
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def proxy(stub_llama, chat_upstream, monkeypatch):
+    stub = stub_llama(tokens=3, token_delay=0)
+    chat_upstream(stub)
+    monkeypatch.setattr(sm, 'response_cache', sm.ResponseCache(1024 * 1024, 60))
+    monkeypatch.setattr(sm, 'admission', sm.AdmissionController(4, 4, 5))
+    return stub, sm.app.test_client()
+
+
+def ask(client, stream=False, **extra):
+    return client.post('/v1/chat/completions', json={
+        'messages': [{'role': 'user', 'content': 'What is 2+2?'}], 'max_tokens': 3,
+        'temperature': 0, 'stream': stream, **extra})
+
+
+def test_hits_are_kept_apart_by_response_kind(proxy):
+    stub, client = proxy
+    first = ask(client)
+    assert first.headers['X-Cache'] == 'MISS'
+    again = ask(client)
+    assert again.headers['X-Cache'] == 'HIT'
+    assert again.get_json() == first.get_json()
+    # The stub counts a request after the client already has the response.
+    wait_until(lambda: stub.completions == 1)
+
+    # The same request streamed is a separate entry, replayed as SSE.
+    streamed = ask(client, stream=True)
+    assert streamed.headers['X-Cache'] == 'MISS'
+    body = streamed.get_data()
+    assert body.startswith(b'data: ') and body.endswith(b'data: [DONE]\n\n')
+    replay = ask(client, stream=True)
+    assert replay.headers['X-Cache'] == 'HIT'
+    assert replay.content_type.startswith('text/event-stream')
+    assert replay.get_data() == body
+    wait_until(lambda: stub.completions == 2)
+
+
+def test_only_deterministic_requests_are_cached(proxy):
+    stub, client = proxy
+    assert 'X-Cache' not in ask(client, temperature=0.8).headers
+    assert ask(client, temperature=0.8, seed=7).headers['X-Cache'] == 'MISS'
+    assert ask(client, temperature=0.8, seed=7).headers['X-Cache'] == 'HIT'
+    # Whitespace around message content does not change the key.
+    padded = client.post('/v1/chat/completions', json={
+        'messages': [{'role': 'user', 'content': '  What is 2+2?\n'}], 'max_tokens': 3,
+        'temperature': 0})
+    assert padded.headers['X-Cache'] == 'MISS'
+    assert ask(client).headers['X-Cache'] == 'HIT'
+
+
+def test_lru_eviction_by_size():
+    cache = sm.ResponseCache(800, 60)  # 100 bytes per entry at most
+    for name in 'abcdefgh':
+        cache.put(name, 'application/json', [b'x' * 100])
+    assert cache.get('a') is not None  # now most recently used
+    cache.put('i', 'application/json', [b'x' * 100])
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.evictions == 1
+    cache.put('big', 'application/json', [b'x' * 101])
+    assert cache.get('big') is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(sm.time, 'monotonic', lambda: clock[0])
+    cache = sm.ResponseCache(1024, 10)
+    cache.put('k', 'application/json', [b'{}'])
+    clock[0] += 9.9
+    assert cache.get('k') == ('application/json', (b'{}',))
+    clock[0] += 0.2
+    assert cache.get('k') is None
+    assert cache._bytes == 0
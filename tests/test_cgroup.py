@@ -0,0 +1,75 @@
+import system_monitor as sm
+
+GB = 1024 ** 3
+
+
+def write_cgroup(path, usage_usec, periods, throttled, throttled_usec):
+    files = {
+        'memory.current': str(3 * GB),
+        'memory.max': str(4 * GB),
+        'memory.stat': f'anon {2 * GB}\nfile {GB}\ninactive_file {GB}\nkernel 1024\npgmajfault 7\n',
+        'memory.events': 'low 0\nhigh 0\nmax 4\noom 1\noom_kill 1\n',
+        'cpu.max': '200000 100000',
+        'cpu.stat': (f'usage_usec {usage_usec}\nuser_usec 0\nsystem_usec 0\n'
+                     f'nr_periods {periods}\nnr_throttled {throttled}\nthrottled_usec {throttled_usec}\n'),
+        'cpu.pressure': 'some avg10=12.50 avg60=3.00 avg300=1.00 total=123456\n'
+                        'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n',
+        'memory.pressure': 'some avg10=1.00 avg60=0.50 avg300=0.10 total=100\n'
+                           'full avg10=0.50 avg60=0.20 avg300=0.00 total=50\n',
+    }
+    path.mkdir(parents=True, exist_ok=True)
+    for name, text in files.items():
+        (path / name).write_text(text)
+
+
+def make_stats(tmp_path, relative='kube/pod1'):
+    (tmp_path / 'cgroup.controllers').write_text('cpu memory io\n')
+    self_cgroup = tmp_path / 'self'
+    self_cgroup.write_text(f'0::/{relative}\n')
+    return sm.CgroupStats(root=str(tmp_path), self_cgroup=str(self_cgroup))
+
+
+def test_reads_memory_limits_and_pressure(tmp_path):
+    write_cgroup(tmp_path / 'kube' / 'pod1', 0, 0, 0, 0)
+    stats = make_stats(tmp_path)
+    assert stats.path == str(tmp_path / 'kube' / 'pod1')
+    sample = stats.sample()
+    assert sample['memory_working_set'] == 2 * GB
+    assert sample['memory_percent'] == 50.0
+    assert sample['oom_kills'] == 1
+    assert sample['cpu_limit'] == 2.0
+    assert sample['cpu_cores'] is None  # no rate before the second sample
+    container = sm.format_container(sample)
+    assert container['memory'] == {'used': 2.0, 'limit': 4.0, 'percent': 50.0, 'oom_kills': 1}
+    assert container['pressure']['cpu'] == {'some': 12.5, 'full': 0.0}
+    assert container['pressure']['io'] == {}
+
+
+def test_cpu_and_throttling_rates(tmp_path, monkeypatch):
+    cgroup = tmp_path / 'kube' / 'pod1'
+    write_cgroup(cgroup, 1_000_000, 100, 0, 0)
+    stats = make_stats(tmp_path)
+    clock = [100.0]
+    monkeypatch.setattr(sm.time, 'monotonic', lambda: clock[0])
+    stats.sample()
+
+    # 2 s later: 3 CPU-seconds used, 5 of 20 periods throttled for 0.5 s in total.
+    write_cgroup(cgroup, 4_000_000, 120, 5, 500_000)
+    clock[0] += 2.0
+    sample = stats.sample()
+    assert sample['cpu_cores'] == 1.5
+    assert sample['cpu_percent'] == 75.0
+    assert sample['throttled_percent'] == 25.0
+    assert sample['throttled_seconds_per_sec'] == 0.25
+
+    # No CFS periods elapsed: not throttled rather than unknown.
+    clock[0] += 1.0
+    assert stats.sample()['throttled_percent'] == 0.0
+
+
+def test_falls_back_to_mount_root_and_missing_hierarchy(tmp_path):
+    write_cgroup(tmp_path, 0, 0, 0, 0)
+    # The listed path does not exist under the mount (no cgroup namespace).
+    assert make_stats(tmp_path, 'system.slice/docker-abc.scope').path == str(tmp_path)
+    missing = sm.CgroupStats(root=str(tmp_path / 'nope'), self_cgroup=str(tmp_path / 'nope'))
+    assert missing.sample() is None
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import system_monitor as sm
+
+
+def events(*tokens):
+    return b''.join(b'data: ' + json.dumps({'choices': [{'delta': {'content': t}}]}).encode() + b'\n\n'
+                    for t in tokens)
+
+
+class RecordingHistogram(sm.Histogram):
+    def __init__(self):
+        super().__init__((1,))
+        self.values = []
+
+    def observe(self, value):
+        super().observe(value)
+        self.values.append(value)
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = sm.ChatStats()
+    stats.itl = RecordingHistogram()
+    stats.tokens_per_second = RecordingHistogram()
+    monkeypatch.setattr(sm, 'chat_stats', stats)
+    return stats
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sm.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_itl_is_per_event_when_a_read_carries_several(stats, clock):
+    timer = sm.ChatTimer(streaming=True)
+    clock[0] += 0.5
+    timer.feed(events('a'))
+    clock[0] += 0.4
+    timer.feed(events('b', 'c', 'd', 'e'))
+    clock[0] += 0.1
+    # An event split across reads counts when its line completes.
+    data = events('f')
+    timer.feed(data[:10])
+    timer.feed(data[10:])
+    timer.finish()
+    assert timer.tokens == 6
+    assert stats.itl.values == pytest.approx([0.1] * 5)
+    assert stats.tokens_per_second.values == pytest.approx([10.0])
+
+
+def test_single_read_stream_does_not_divide_by_zero(stats, clock):
+    timer = sm.ChatTimer(streaming=True)
+    clock[0] += 2.0
+    timer.feed(events('a', 'b', 'c', 'd') + b'data: [DONE]\n\n')
+    timer.finish()
+    assert timer.tokens == 4
+    assert stats.itl.values == []
+    assert stats.tokens_per_second.values == pytest.approx([2.0])
@@ -0,0 +1,55 @@
+import json
+
+import system_monitor as sm
+
+
+def feed(deltas, seq, cpu, mode='idle'):
+    info = {'seq': seq, 'timestamp': 1000.0 + seq, 'cpu_usage': cpu, 'mode': mode,
+            'network': {'interfaces': {}}}
+    raw = {'memory': {'used': 100, 'total': 1000}, 'disk': {}, 'network': {}, 'load': (0.5, 0.4, 0.3),
+           'model_cache': None, 'cgroup': None}
+    deltas.append(info, raw)
+
+
+def get(deltas, since):
+    return json.loads(deltas.body(since))
+
+
+def test_delta_against_a_recent_cursor():
+    deltas = sm.DataDeltas(10)
+    feed(deltas, 1, 10.0)
+    cursor = get(deltas, '')['cursor']
+    feed(deltas, 2, 20.0)
+    body = get(deltas, cursor)
+    assert 'full' not in body
+    assert body['since'] == cursor
+    assert body['changed'] == {'cpu_usage': 20.0}
+    assert body['cursor'] == f'{deltas.epoch}:2'
+
+
+def test_cursor_from_before_a_restart_gets_a_full_payload():
+    before = sm.DataDeltas(200)
+    for seq in range(1, 41):
+        feed(before, seq, 50.0, 'busy')
+    cursor = get(before, '')['cursor']
+    assert cursor.endswith(':40')
+
+    # The new process counts seq from 1 again and is past 40 by now, with
+    # 'mode' unchanged between its own samples 40 and 100.
+    after = sm.DataDeltas(200)
+    for seq in range(1, 101):
+        feed(after, seq, float(seq))
+    body = get(after, cursor)
+    assert body['full'] is True
+    assert body['changed']['mode'] == 'idle'
+    assert body['cursor'] == f'{after.epoch}:100'
+    assert after.epoch != before.epoch
+
+
+def test_expired_or_malformed_cursors_get_a_full_payload():
+    deltas = sm.DataDeltas(5)
+    for seq in range(1, 11):
+        feed(deltas, seq, float(seq))
+    for since in (f'{deltas.epoch}:2', f'{deltas.epoch}:99', '7', 'junk', f'{deltas.epoch}:x'):
+        assert get(deltas, since)['full'] is True
+    assert 'full' not in get(deltas, f'{deltas.epoch}:8')
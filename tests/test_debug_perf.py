@@ -0,0 +1,48 @@
+import pytest
+
+import system_monitor as sm
+
+LOOPBACK = {'REMOTE_ADDR': '127.0.0.1'}
+REMOTE = {'REMOTE_ADDR': '10.1.2.3'}
+
+
+def test_debug_endpoints_are_off_by_default():
+    assert not sm.DEBUG_PERF
+    client = sm.app.test_client()
+    for path in ('/debug/perf', '/debug/perf/profile?seconds=0.01'):
+        assert client.get(path, environ_base=LOOPBACK).status_code == 404
+        assert client.get(path, environ_base=REMOTE).status_code == 404
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(sm, 'DEBUG_PERF', True)
+    return sm.app.test_client()
+
+
+@pytest.mark.parametrize('address', ['127.0.0.1', '127.8.9.10', '::1', '::ffff:127.0.0.1'])
+def test_loopback_is_allowed_by_default(enabled, address):
+    response = enabled.get('/debug/perf', environ_base={'REMOTE_ADDR': address})
+    assert response.status_code == 200
+    assert 'profiler' in response.get_json()
+
+
+@pytest.mark.parametrize('address', ['10.1.2.3', '::ffff:10.1.2.3', '2001:db8::1', 'garbage', ''])
+def test_other_clients_are_forbidden(enabled, address):
+    for path in ('/debug/perf', '/debug/perf/profile?seconds=0.01'):
+        assert enabled.get(path, environ_base={'REMOTE_ADDR': address}).status_code == 403
+
+
+def test_allowlist_is_configurable(enabled, monkeypatch):
+    monkeypatch.setattr(sm, 'perf_networks', sm.parse_networks('10.0.0.0/8, 2001:db8::/32'))
+    assert enabled.get('/debug/perf', environ_base=REMOTE).status_code == 200
+    assert enabled.get('/debug/perf', environ_base={'REMOTE_ADDR': '2001:db8::1'}).status_code == 200
+    assert enabled.get('/debug/perf', environ_base=LOOPBACK).status_code == 403
+
+
+def test_profile_from_an_allowed_client(enabled):
+    response = enabled.get('/debug/perf/profile?seconds=0.05&interval=0.005&format=json',
+                           environ_base=LOOPBACK)
+    assert response.status_code == 200
+    assert response.get_json()['samples'] > 0
+    assert enabled.get('/debug/perf/profile?seconds=999', environ_base=LOOPBACK).status_code == 400
@@ -0,0 +1,109 @@
+import math
+import os
+import struct
+import subprocess
+import sys
+
+import system_monitor as sm
+
+
+def test_ring_keeps_the_latest_samples_and_downsamples():
+    store = sm.TimeSeriesStore(4)
+    for t in range(6):
+        store.append(100.0 + t, {'cpu': float(t)})
+    points = store.query('cpu', step=1)
+    assert [p['t'] for p in points] == [102.0, 103.0, 104.0, 105.0]
+    assert [p['avg'] for p in store.query('cpu', step=2)] == [2.5, 4.5]
+    bucket = store.query('cpu', since=104.0, step=10)[0]
+    assert (bucket['min'], bucket['max'], bucket['avg']) == (4.0, 5.0, 4.5)
+
+
+def test_late_and_missing_metrics_are_nan():
+    store = sm.TimeSeriesStore(8)
+    store.append(1.0, {'cpu': 1.0})
+    store.append(2.0, {'cpu': 2.0, 'eth0': 5.0})
+    store.append(3.0, {'cpu': 3.0})
+    assert [p['avg'] for p in store.query('eth0', step=1)] == [5.0]
+    assert math.isnan(store._columns['eth0'][0])
+
+
+def test_metric_names_are_capped():
+    store = sm.TimeSeriesStore(16, max_metrics=2)
+    for t in range(3):
+        store.append(float(t), {'cpu': 1.0, 'memory': 2.0, f'veth{t}': 3.0})
+    # Interfaces that come and go cannot add columns past the cap.
+    assert store.metrics() == ['cpu', 'memory']
+    assert store._skipped == {'veth0', 'veth1', 'veth2'}
+
+
+def test_skipped_metrics_do_not_hide_missing_ones():
+    store = sm.TimeSeriesStore(1, max_metrics=2)
+    store.append(1.0, {'cpu': 1.0, 'memory': 2.0})
+    store.append(2.0, {'cpu': 1.0, 'veth0': 3.0})
+    assert math.isnan(store._columns['memory'][0])
+
+
+def run_in_child(code):
+    # A separate process, like a monitor restart or a second monitor.
+    return subprocess.run([sys.executable, '-c', 'import system_monitor as sm\n' + code],
+                          cwd=os.path.dirname(sm.__file__), capture_output=True, text=True, timeout=60)
+
+
+def test_mapped_store_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    child = run_in_child(
+        f'store = sm.MappedTimeSeriesStore({path!r}, 8)\n'
+        'for t in range(10):\n'
+        '    store.append(100.0 + t, {"cpu": float(t), "memory": 50.0})\n'
+        'store.flush()\n')
+    assert child.returncode == 0, child.stderr
+    store = sm.MappedTimeSeriesStore(path, 8)
+    assert store.metrics() == ['cpu', 'memory']
+    assert [p['avg'] for p in store.query('cpu', step=1)] == [float(t) for t in range(2, 10)]
+    store.append(110.0, {'cpu': 10.0, 'disk': 1.0})
+    assert [p['t'] for p in store.query('cpu', step=1)][-2:] == [109.0, 110.0]
+    assert [p['avg'] for p in store.query('disk', step=1)] == [1.0]
+
+
+def test_mapped_store_rejects_a_second_writer(tmp_path, monkeypatch):
+    path = str(tmp_path / 'history.bin')
+    store = sm.MappedTimeSeriesStore(path, 8)
+    store.append(1.0, {'cpu': 1.0})
+    child = run_in_child(
+        'try:\n'
+        f'    sm.MappedTimeSeriesStore({path!r}, 8)\n'
+        'except OSError as e:\n'
+        '    print(e)\n')
+    assert child.returncode == 0, child.stderr
+    assert 'in use by another process' in child.stdout
+    # open_history falls back to memory instead of sharing the file.
+    monkeypatch.setattr(sm, 'HISTORY_DIR', str(tmp_path))
+    assert type(sm.open_history(8)) is sm.TimeSeriesStore
+
+
+def test_mapped_store_starts_over_on_another_layout(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    write = (f'store = sm.MappedTimeSeriesStore({path!r}, 8)\n'
+             'store.append(1.0, {"cpu": 1.0})\n'
+             'store.flush()\n')
+    assert run_in_child(write).returncode == 0
+    with open(path, 'r+b') as f:
+        f.seek(8)
+        f.write(struct.pack('<I', sm.MappedTimeSeriesStore.VERSION + 1))
+    check = (f'store = sm.MappedTimeSeriesStore({path!r}, {{}})\n'
+             'print(store.metrics(), store._count)\n')
+    child = run_in_child(check.format(8))
+    assert child.stdout.split('\n')[0] == '[] 0', child.stderr
+    assert 'different format or size' in child.stderr
+
+    # A different capacity is a different layout too.
+    assert run_in_child(write).returncode == 0
+    child = run_in_child(check.format(16))
+    assert child.stdout.split('\n')[0] == '[] 0', child.stderr
+
+
+def test_mapped_store_caps_metric_slots(tmp_path):
+    store = sm.MappedTimeSeriesStore(str(tmp_path / 'history.bin'), 8, max_metrics=2)
+    store.append(1.0, {'a': 1.0, 'b': 2.0, 'c': 3.0, 'x' * 65: 4.0})
+    assert store.metrics() == ['a', 'b']
+    assert store._skipped == {'c', 'x' * 65}
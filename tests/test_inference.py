@@ -0,0 +1,53 @@
+import json
+
+import system_monitor as sm
+
+METRICS = (b'llamacpp:prompt_tokens_total 100\n'
+           b'llamacpp:prompt_seconds_total 1\n'
+           b'llamacpp:tokens_predicted_total 40\n'
+           b'llamacpp:tokens_predicted_seconds_total 2\n'
+           b'llamacpp:requests_processing 1\n'
+           b'llamacpp:requests_deferred 3\n')
+SLOTS = json.dumps([{'id': 0, 'is_processing': True}, {'id': 1, 'is_processing': False}]).encode()
+
+
+def collector(server):
+    return sm.InferenceCollector(sm.LlamaServerClient(server.url, 1.0))
+
+
+def test_poll_reads_health_metrics_and_slots(fake_llama):
+    fake_llama.routes.update({'/health': (200, b'{"status":"ok"}'), '/metrics': (200, METRICS),
+                              '/slots': (200, SLOTS)})
+    inference = collector(fake_llama)
+    info = inference.poll()
+    assert info['status'] == 'ok'
+    assert info['queue_depth'] == 3
+    assert (info['slots_total'], info['slots_busy'], info['slots_idle']) == (2, 1, 1)
+    assert 'unavailable' not in info
+
+    fake_llama.routes['/metrics'] = (200, METRICS.replace(b'predicted_total 40', b'predicted_total 60')
+                                     .replace(b'predicted_seconds_total 2', b'predicted_seconds_total 3'))
+    info = inference.poll()
+    assert info['generated_tokens_per_second'] == 20.0
+    assert info['generated_throughput'] > 0
+
+
+def test_poll_reports_loading_and_unreachable(fake_llama):
+    fake_llama.routes['/health'] = (503, b'{"error":{"message":"Loading model"}}')
+    assert collector(fake_llama).poll() == {'status': 'loading'}
+    unreachable = sm.InferenceCollector(sm.LlamaServerClient('http://127.0.0.1:9', 0.5))
+    assert unreachable.poll() == {'status': 'unreachable'}
+
+
+def test_failing_endpoint_is_marked_unavailable(fake_llama):
+    fake_llama.routes.update({'/health': (200, b'{"status":"ok"}'), '/metrics': (200, METRICS),
+                              '/slots': None})
+    info = collector(fake_llama).poll()
+    assert info['status'] == 'ok'
+    assert info['unavailable'] == ['slots']
+    assert info['queue_depth'] == 3
+
+    fake_llama.routes.update({'/metrics': (500, b''), '/slots': (200, SLOTS)})
+    info = collector(fake_llama).poll()
+    assert info['unavailable'] == ['metrics']
+    assert info['slots_total'] == 2
@@ -0,0 +1,23 @@
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import system_monitor as sm
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_page_script_parses(tmp_path):
+    # HTML_TEMPLATE is a plain Python string, so a single backslash in the
+    # page JavaScript turns into an escape before the browser sees it.
+    response = sm.app.test_client().get('/')
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    scripts = re.findall(r'<script(?![^>]*\bsrc=)[^>]*>(.*?)</script>', html, re.S)
+    assert scripts
+    for i, script in enumerate(scripts):
+        path = tmp_path / f'page{i}.js'
+        path.write_text(script)
+        result = subprocess.run(['node', '--check', str(path)], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
@@ -0,0 +1,31 @@
+import time
+
+import system_monitor as sm
+
+
+def test_prewarm_post_is_limited_to_allowed_clients(tmp_path, monkeypatch):
+    model = tmp_path / 'model.gguf'
+    model.write_bytes(b'\0' * (1024 * 1024))
+    prewarmer = sm.ModelPrewarmer(str(model), sm.ModelResidency(str(model)))
+    monkeypatch.setattr(sm, 'model_prewarmer', prewarmer)
+    client = sm.app.test_client()
+
+    remote = {'REMOTE_ADDR': '10.1.2.3'}
+    assert client.get('/model/prewarm', environ_base=remote).status_code == 200
+    response = client.post('/model/prewarm', environ_base=remote)
+    assert response.status_code == 403
+    assert prewarmer.status()['state'] != 'running'
+
+    response = client.post('/model/prewarm?mode=read', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 202
+    deadline = time.monotonic() + 10
+    while prewarmer.status()['state'] == 'running':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert prewarmer.status()['bytes_done'] == 1024 * 1024
+
+
+def test_prewarm_allowlist_can_be_emptied(monkeypatch):
+    monkeypatch.setattr(sm, 'prewarm_networks', sm.parse_networks(''))
+    response = sm.app.test_client().post('/model/prewarm', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 403
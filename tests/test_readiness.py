@@ -0,0 +1,35 @@
+import system_monitor as sm
+
+
+class FakeResidency:
+    def __init__(self, percent):
+        self.percent = percent
+
+    def check(self):
+        return {'size': 1000, 'resident_bytes': int(self.percent * 10),
+                'resident_percent': self.percent}
+
+    sample = check
+
+
+def test_ready_follows_model_eviction_after_startup(monkeypatch):
+    pool = sm.LlamaWorkers(0, None, 0)
+    worker = pool.workers[0]
+    worker.state = 'healthy'
+    worker.warm = True
+    cache = FakeResidency(100.0)
+    monkeypatch.setattr(sm, 'llama_workers', pool)
+    monkeypatch.setattr(sm, 'model_cache', cache)
+    readiness = sm.Readiness()
+
+    readiness.check()
+    assert readiness.ready()
+    assert 'model_resident' in readiness.timeline
+
+    # Evicted under memory pressure: not ready until it is paged back in.
+    cache.percent = 40.0
+    readiness.check()
+    assert not readiness.ready()
+    cache.percent = 95.0
+    readiness.check()
+    assert readiness.ready()
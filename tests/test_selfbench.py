@@ -0,0 +1,52 @@
+import json
+import os
+import socket
+
+import system_monitor as sm
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_compare_baseline_flags_regressions_past_tolerance_and_floor():
+    baseline = {'sampler_tick_ms': 2.0, 'scenarios': {
+        'GET /data x1': {'latency_ms': {'p50': 1.0, 'p99': 10.0}, 'server_cpu_percent': 5.0,
+                         'server_rss_mb': 80.0},
+        'GET / x100': {'latency_ms': {'p50': 1.0}}}}
+    report = {'sampler_tick_ms': 3.9, 'scenarios': {
+        'GET /data x1': {'latency_ms': {'p50': 2.4, 'p99': 16.5}, 'server_cpu_percent': 8.6,
+                         'server_rss_mb': 86.0}}}
+    # Within 1.5x plus the absolute floor: tick 3.9 <= 4.0, p50 2.4 <= 2.5, RSS 86 <= 125.
+    assert sm.compare_baseline(report, baseline, 1.5) == [
+        ('GET /data x1 latency_ms.p99', 10.0, 16.5),
+        ('GET /data x1 server_cpu_percent', 5.0, 8.6)]
+    # Scenarios that were not run this time are not compared.
+    assert sm.compare_baseline(report, baseline, 2.0) == []
+
+
+def test_selfbench_passes_the_committed_baseline(capsys):
+    assert sm.SELFBENCH_BASELINE == os.path.join(os.path.dirname(sm.__file__), 'selfbench-baseline.json')
+    with open(sm.SELFBENCH_BASELINE) as f:
+        assert {'GET /data x1', 'GET / x1', 'stream x1'} <= set(json.load(f)['scenarios'])
+    status = sm.main(['selfbench', '--clients', '1', '--duration', '0.5', '--ticks', '5',
+                      '--port', str(free_port()), '--tolerance', '20'])
+    out = capsys.readouterr().out
+    assert status == 0, out
+    assert f'Within 20.0x of {sm.SELFBENCH_BASELINE}' in out
+    report = json.loads(out[:out.rindex('}') + 1])
+    assert report['scenarios']['GET /data x1']['errors'] == 0
+    assert report['scenarios']['stream x1']['events_per_client'] >= 0
+
+
+def test_selfbench_fails_without_a_baseline(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sm, 'sampler_tick_cost', lambda ticks: 1.0)
+    monkeypatch.setattr(sm.MonitorBenchmark, '__enter__', lambda self: self)
+    monkeypatch.setattr(sm.MonitorBenchmark, '__exit__', lambda self, *exc: None)
+    monkeypatch.setattr(sm.MonitorBenchmark, 'run', lambda self: {})
+    missing = str(tmp_path / 'missing.json')
+    assert sm.main(['selfbench', '--baseline', missing]) == 2
+    assert f'Cannot read baseline {missing}' in capsys.readouterr().out
+    assert sm.main(['selfbench', '--baseline', '']) == 0
@@ -0,0 +1,28 @@
+import system_monitor as sm
+
+
+def start(sessions, session_id, text='hi'):
+    session, _ = sessions.begin(session_id, {'messages': [{'role': 'user', 'content': text}]})
+    return session
+
+
+def test_expire_skips_busy_sessions(monkeypatch):
+    monkeypatch.setattr(sm, 'llama_workers', sm.LlamaWorkers(0, None, 0))
+    sessions = sm.ChatSessions(budget=4096, ttl=60, max_sessions=2, slots=2)
+    clock = [1000.0]
+    monkeypatch.setattr(sm.time, 'monotonic', lambda: clock[0])
+
+    busy = start(sessions, 'busy')  # oldest, and its turn never finishes
+    for name in ('a', 'b'):
+        clock[0] += 1
+        sessions.abort(start(sessions, name))
+    clock[0] += 1
+    start(sessions, 'c')
+    # Over the cap: the idle 'a' goes, the busy one is kept.
+    assert set(sessions._sessions) == {'busy', 'b', 'c'}
+    assert busy.busy
+
+    # Past the TTL every idle session expires, even behind a busy one.
+    clock[0] += 120
+    sessions.abort(start(sessions, 'd'))
+    assert set(sessions._sessions) == {'busy', 'c', 'd'}
@@ -0,0 +1,135 @@
+import json
+import socket
+import sys
+import time
+import types
+
+import pytest
+
+import system_monitor as sm
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, worker, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, worker.describe()
+        worker.supervise()
+        time.sleep(0.05)
+
+
+def finish(pool, worker):
+    pool.release(worker, types.SimpleNamespace(first_token=None, started=time.monotonic()),
+                 'stop', time.monotonic())
+
+
+def test_pick_least_outstanding_and_sticky_sessions():
+    pool = sm.LlamaWorkers(3, None, 18500, pin=False)
+    for worker in pool.workers:
+        worker.state = 'healthy'
+    first = pool.pick()
+    pool.dispatch(first)
+    second = pool.pick()
+    assert second is not first
+    pool.dispatch(second)
+    # A session stays on its worker even when another one is less loaded.
+    assert pool.pick(preferred=first.index) is first
+    pool.workers[2].state = 'unhealthy'
+    assert pool.pick(preferred=2) in (first, second)
+    finish(pool, first)
+    assert pool.pick() is first
+    assert first.outstanding == 0 and first.served == 1
+
+
+def test_pick_falls_back_when_no_worker_is_healthy():
+    pool = sm.LlamaWorkers(2, None, 18500, pin=False)
+    pool.workers[0].outstanding = 1
+    assert pool.pick() is pool.workers[1]
+
+
+def test_proxy_routes_between_workers(stub_llama, monkeypatch):
+    stubs = [stub_llama(tokens=4, token_delay=0), stub_llama(tokens=4, token_delay=0)]
+    pool = sm.LlamaWorkers(2, None, 18500, pin=False)
+    pool.workers = [sm.LlamaWorker(i, stub.url) for i, stub in enumerate(stubs)]
+    for worker in pool.workers:
+        worker.supervise()
+        assert worker.healthy
+    monkeypatch.setattr(sm, 'llama_workers', pool)
+    client = sm.app.test_client()
+
+    def ask(text, **extra):
+        response = client.post('/v1/chat/completions', json={
+            'messages': [{'role': 'user', 'content': text}], 'max_tokens': 4, **extra})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        content = response.get_json()['choices'][0]['message']['content']
+        return response, int(content[1:content.index(']')])
+
+    # Idle workers take turns.
+    ports = {ask(f'question {i}')[1] for i in range(4)}
+    assert ports == {stub.server_port for stub in stubs}
+    assert [worker.served for worker in pool.workers] == [2, 2]
+
+    # Every turn of a session goes to the worker that holds its prompt cache.
+    response, port = ask('hello', session_id='sticky')
+    worker = response.headers['X-Worker']
+    for turn in range(3):
+        response, again = ask(f'turn {turn}', session_id='sticky')
+        assert again == port and response.headers['X-Worker'] == worker
+    assert all(worker.outstanding == 0 for worker in pool.workers)
+
+
+def test_supervisor_restarts_a_crashed_worker():
+    port = free_port()
+    command = (f'{sys.executable} {sm.__file__} stub-worker --port {{port}} '
+               '--crash-after 1 --token-delay 0 --tokens 2')
+    pool = sm.LlamaWorkers(1, command, port, pin=False)
+    worker = pool.workers[0]
+    # Tracked like llama_process is when the monitor manages the workers.
+    tracked = sm.TrackedProcess('llama-server', pid_source=worker.pid)
+    try:
+        wait_for(lambda: worker.healthy, worker)
+        first_pid = worker.process.pid
+        assert tracked.sample()['pid'] == first_pid
+        conn, response = worker.pool.request('POST', '/v1/chat/completions', json.dumps(
+            {'messages': [{'role': 'user', 'content': 'hi'}]}).encode(),
+            {'Content-Type': 'application/json'})
+        assert response.status == 200
+        response.read()
+        conn.close()
+        worker.process.wait(10)
+
+        worker.supervise()
+        assert worker.state == 'unhealthy'
+        assert worker.last_error == 'exited with status 1'
+        wait_for(lambda: worker.healthy, worker)
+        assert worker.process.pid != first_pid
+        assert worker.restarts == 1
+        assert worker.crashes == 0
+        assert tracked.sample()['pid'] == worker.process.pid
+        assert tracked.restarts == 1
+    finally:
+        pool.stop()
+
+
+@pytest.mark.parametrize('siblings, expected', [
+    # cpu N and N+4 share a core, core ids start at 0.
+    ({0: 0, 1: 1, 2: 2, 3: 3, 4: 0, 5: 1, 6: 2, 7: 3}, [[0, 4, 1, 5], [2, 6, 3, 7]]),
+    # Missing topology files keep CPU order.
+    ({}, [[0, 1, 2, 3], [4, 5, 6, 7]]),
+])
+def test_cpu_groups_keep_smt_siblings_together(monkeypatch, siblings, expected):
+    monkeypatch.setattr(sm.os, 'sched_getaffinity', lambda pid: set(range(8)))
+
+    def read_int(path):
+        cpu = int(path.split('/cpu')[-1].split('/')[0])
+        if path.endswith('physical_package_id'):
+            return 0 if siblings else None
+        return siblings.get(cpu)
+
+    monkeypatch.setattr(sm, 'read_int', read_int)
+    assert sm.cpu_groups(2) == expected